@@ -0,0 +1,374 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+"""
+Cold start of each lambda handler: starts a fresh interpreter per handler
+(benchmark.cold_start_child) and times the handler's import, its first
+invocation and --invocations steady state invocations after that.
+
+    python -m benchmark.cold_start --output cold-start.json
+    python -m benchmark.cold_start --handlers predict status --runs 5
+
+GraphQL and SBERT are served by a local fake http server, S3/SQS/DynamoDB
+are in-memory fakes in the child (S3 serves a synthetic trained model).
+Results are JSON (median over --runs of each timing) so they can be
+compared between commits; a handler that can't be imported or invoked,
+or leaves a training job that did not succeed (e.g. trainjob FAILURE),
+is reported with an "error" and the exit code is 1.
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+import numpy
+
+from benchmark.import_budget import BUDGETS_MS, STUB_ENV
+from benchmark.synthetic import (
+    EMBEDDING_SIZE,
+    synthetic_mentor,
+    synthetic_mentor_data,
+    train_synthetic_model,
+)
+from module.classifier import ARCH_LR_TRANSFORMER, mentor_model_path
+from module.classifier.model_artifact import save_model
+from module.mentor import MENTOR_BUNDLE, save_mentor_bundle
+from module.utils import file_hash
+
+HANDLERS = list(BUDGETS_MS)
+MODELS_DIR = "/tmp/models"  # where predict and trainjob keep models
+USER_ID = "cold-start-user"
+# statuses a handler may leave a training job in (the train handler only queues jobs)
+JOB_STATUS_OK = {"SUCCESS", "QUEUED"}
+
+
+def graphql_response(body: dict, mentor_data: dict) -> dict:
+    """
+    A response for each query/mutation the handlers send, by operation name.
+    """
+    query = body.get("query", "")
+    if "MentorCanEdit" in query:
+        return {"data": {"mentorCanEdit": True}}
+    if "GradedUserQuestions" in query:
+        return {"data": {"userQuestions": {"edges": []}}}
+    if "CategoryAnswers" in query:
+        return {
+            "data": {
+                "categoryAnswers": [
+                    {
+                        "answerText": a["transcript"],
+                        "questionText": a["question"]["question"],
+                    }
+                    for a in mentor_data["answers"][:5]
+                ]
+            }
+        }
+    if "query Mentor" in query:
+        return {"data": {"mentor": {**mentor_data, "name": "Cold Start"}}}
+    if "TrainTaskAdd" in query:
+        return {
+            "data": {"me": {"mentorTrainTaskAddOrUpdate": {"_id": str(uuid.uuid4())}}}
+        }
+    if "UserQuestionCreateBatch" in query:
+        n = len(body.get("variables") or {})
+        return {"data": {f"q{i}": {"_id": uuid.uuid4().hex[:24]} for i in range(n)}}
+    if "UserQuestionCreate" in query:
+        return {"data": {"userQuestionCreate": {"_id": uuid.uuid4().hex[:24]}}}
+    if "UpdateMentorTraining" in query:
+        return {"data": {"updateMentorTraining": {"_id": "cold-start"}}}
+    return {"errors": [{"message": f"not faked: {query[:80]}"}]}
+
+
+def sbert_encoding(query: str) -> List[float]:
+    seed = int.from_bytes(
+        hashlib.blake2b(query.encode(), digest_size=4).digest(), "big"
+    )
+    return numpy.random.default_rng(seed).normal(size=EMBEDDING_SIZE).tolist()
+
+
+def start_fake_services(mentor_data: dict) -> ThreadingHTTPServer:
+    """
+    GraphQL at /graphql and SBERT at /sbert on 127.0.0.1 (port in server_address).
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            path, _, query = self.path.partition("?")
+            if path == "/sbert/encode":
+                self._send(200, {"encoding": sbert_encoding(query)})
+            else:
+                self._send(404, {"message": "not found"})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if self.path == "/graphql":
+                self._send(200, graphql_response(body, mentor_data))
+            elif self.path == "/sbert/encode/cos_sim_weight":
+                self._send(200, {"cos_sim_weight": 0.5})
+            elif self.path == "/sbert/paraphrase":
+                self._send(200, {"paraphrases": []})
+            else:
+                self._send(404, {"message": "not found"})
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def jwt_token(payload: dict, secret: str) -> str:
+    def b64(data: bytes) -> str:
+        return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+    signing_input = ".".join(
+        b64(json.dumps(part).encode())
+        for part in [{"alg": "HS256", "typ": "JWT"}, payload]
+    )
+    signature = hmac.new(secret.encode(), signing_input.encode(), hashlib.sha256)
+    return f"{signing_input}.{b64(signature.digest())}"
+
+
+def publish_synthetic_model(s3_root: str, mentor: str, data: dict) -> None:
+    """
+    The files trainjob uploads for a mentor, under s3_root.
+    """
+    model = train_synthetic_model(s3_root, mentor, data)
+    model_dir = mentor_model_path(s3_root, mentor, ARCH_LR_TRANSFORMER)
+    model_hash = file_hash(os.path.join(model_dir, "model.pkl"))
+    save_model(os.path.join(model_dir, "model.bin"), model, model_hash)
+    save_mentor_bundle(
+        os.path.join(model_dir, MENTOR_BUNDLE),
+        synthetic_mentor(mentor, data),
+        model_hash,
+    )
+
+
+def handler_events(handler: str, mentor: str, invocations: int) -> List[dict]:
+    """
+    The first event and `invocations` steady state events for the handler.
+    """
+    token = jwt_token(
+        {"id": USER_ID, "role": "USER", "mentorIds": [mentor]}, STUB_ENV["JWT_SECRET"]
+    )
+    headers = {"Authorization": f"Bearer {token}", "origin": "http://localhost"}
+
+    def event(i: int) -> dict:
+        if handler == "predict":
+            return {
+                "headers": headers,
+                "queryStringParameters": {
+                    "mentor": mentor,
+                    "query": f"What do you think about topic {i}?",
+                    "chatsessionid": "cold-start",
+                },
+            }
+        if handler == "followup":
+            return {
+                "headers": headers,
+                "pathParameters": {"mentor": mentor, "category": "background"},
+            }
+        if handler == "train":
+            return {
+                "headers": headers,
+                "isBase64Encoded": False,
+                "body": json.dumps({"mentor": mentor}),
+            }
+        if handler == "trainjob":
+            request = {
+                "id": f"job{i}",
+                "mentor": mentor,
+                "auth_headers": json.dumps({"Authorization": headers["Authorization"]}),
+            }
+            return {"Records": [{"body": json.dumps(request)}]}
+        if handler == "status":
+            return {
+                "headers": headers,
+                "pathParameters": {"id": "job0"},
+                "requestContext": {
+                    "authorizer": {"token": json.dumps({"id": USER_ID})}
+                },
+            }
+        if handler == "trainingdata":
+            return {"headers": headers, "pathParameters": {"mentor": mentor}}
+        if handler == "authorizer":
+            return {
+                "type": "TOKEN",
+                "authorizationToken": headers["Authorization"],
+                "methodArn": "arn:aws:execute-api:us-east-1:000000000000:cold-start/*",
+            }
+        raise ValueError(f"unknown handler {handler}")
+
+    return [event(i) for i in range(invocations + 1)]
+
+
+def run_once(
+    handler: str, work_dir: str, env: dict, data: dict, invocations: int
+) -> Dict:
+    # a new mentor each run, so nothing is left in MODELS_DIR from the last one
+    mentor = f"cold-start-{uuid.uuid4().hex[:12]}"
+    s3_root = os.path.join(work_dir, "s3")
+    publish_synthetic_model(s3_root, mentor, data)
+    config = {
+        "handler": handler,
+        "s3_root": s3_root,
+        "events": handler_events(handler, mentor, invocations),
+        "dynamodb": {
+            STUB_ENV["JOBS_TABLE_NAME"]: [
+                {"id": "job0", "mentor": mentor, "status": "SUCCESS"}
+            ]
+        },
+    }
+    config_file = os.path.join(work_dir, "config.json")
+    result_file = os.path.join(work_dir, "result.json")
+    with open(config_file, "w") as f:
+        json.dump(config, f)
+    if os.path.exists(result_file):
+        os.remove(result_file)
+    started_at = time.time()
+    started = time.perf_counter()
+    p = subprocess.run(
+        [sys.executable, "-m", "benchmark.cold_start_child", config_file, result_file],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    total_ms = (time.perf_counter() - started) * 1000
+    shutil.rmtree(os.path.join(s3_root, mentor), ignore_errors=True)
+    shutil.rmtree(os.path.join(MODELS_DIR, mentor), ignore_errors=True)
+    if not os.path.exists(result_file):
+        lines = p.stderr.strip().splitlines() or [f"exit code {p.returncode}"]
+        return {"handler": handler, "error": lines[-1]}
+    with open(result_file) as f:
+        result = json.load(f)
+    if "first_response_at" in result:
+        result["ready_ms"] = round(
+            (result.pop("first_response_at") - started_at) * 1000, 1
+        )
+    result["process_ms"] = round(total_ms, 1)
+    return result
+
+
+def summarize(handler: str, runs: List[Dict]) -> Dict:
+    errors = [r["error"] for r in runs if "error" in r]
+    if errors:
+        return {"handler": handler, "error": errors[0]}
+    failed_jobs = sorted(
+        {
+            f"{job} {status}"
+            for r in runs
+            for job, status in r.get("job_status", {}).items()
+            if status not in JOB_STATUS_OK
+        }
+    )
+    if failed_jobs:
+        return {"handler": handler, "error": f"jobs failed: {', '.join(failed_jobs)}"}
+
+    def median(key: str) -> float:
+        return round(statistics.median(r[key] for r in runs), 1)
+
+    steady = [ms for r in runs for ms in r.get("steady_ms", [])]
+    return {
+        "handler": handler,
+        "runs": len(runs),
+        # from process start to the first response, includes interpreter startup:
+        "ready_ms": median("ready_ms"),
+        "import_ms": median("import_ms"),
+        "first_ms": median("first_ms"),
+        "steady_p50_ms": round(statistics.median(steady), 1) if steady else None,
+        "steady_max_ms": round(max(steady), 1) if steady else None,
+        "first_status": runs[0].get("first_status"),
+        "job_status": runs[0].get("job_status"),
+        "steady_status": sorted(
+            {str(s) for r in runs for s in r.get("steady_status", [])}
+        ),
+    }
+
+
+def git_commit() -> str:
+    p = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True)
+    return p.stdout.strip() if p.returncode == 0 else ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--handlers", nargs="+", default=HANDLERS, choices=HANDLERS)
+    parser.add_argument(
+        "--runs", type=int, default=3, help="fresh processes per handler"
+    )
+    parser.add_argument(
+        "--invocations",
+        type=int,
+        default=5,
+        help="steady state invocations per process",
+    )
+    parser.add_argument(
+        "--answers", type=int, default=100, help="answers of the mentor"
+    )
+    parser.add_argument("--output", help="also write the results (JSON) to this file")
+    args = parser.parse_args()
+    data = synthetic_mentor_data(args.answers)
+    server = start_fake_services(data)
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    env = {
+        **os.environ,
+        **STUB_ENV,
+        "GRAPHQL_ENDPOINT": f"{endpoint}/graphql",
+        "SBERT_ENDPOINT": f"{endpoint}/sbert",
+        "NO_PROXY": "127.0.0.1,localhost",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    }
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for handler in args.handlers:
+            runs = []
+            for _ in range(args.runs):
+                runs.append(run_once(handler, work_dir, env, data, args.invocations))
+                if "error" in runs[-1]:
+                    break
+            results.append(summarize(handler, runs))
+    server.shutdown()
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "answers": args.answers,
+        "invocations": args.invocations,
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if any("error" in r for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+"""
+Runs one handler in a fresh interpreter for benchmark.cold_start:
+
+    python -m benchmark.cold_start_child <config.json> <result.json>
+
+boto3.client/boto3.resource are replaced by in-memory fakes (S3 served from a
+local directory) as soon as boto3 is imported, so its import is still timed.
+Imports are kept to a minimum here, anything imported before the handler
+would be missing from its import time.
+"""
+
+import hashlib
+import importlib
+import importlib.util
+import json
+import os
+import sys
+import time
+import traceback
+
+S3_CHUNK_SIZE = 64 * 1024
+
+
+def _client_error(code: str, operation: str, headers: dict = None):
+    import botocore.exceptions
+
+    return botocore.exceptions.ClientError(
+        {
+            "Error": {"Code": code, "Message": code},
+            "ResponseMetadata": {"HTTPHeaders": headers or {}},
+        },
+        operation,
+    )
+
+
+class FakeBody:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def read(self) -> bytes:
+        return self.data
+
+    def iter_chunks(self, chunk_size: int = S3_CHUNK_SIZE):
+        for start in range(0, len(self.data), chunk_size):
+            end = start + chunk_size
+            yield self.data[start:end]
+
+
+class FakeS3:
+    """
+    Objects are the files under root (key = path relative to root).
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None, IfModifiedSince=None):
+        p = self.__path(Key)
+        if not os.path.isfile(p):
+            raise _client_error("NoSuchKey", "GetObject")
+        with open(p, "rb") as f:
+            data = f.read()
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        if IfNoneMatch == etag or (
+            IfModifiedSince is not None
+            and os.path.getmtime(p) <= IfModifiedSince.timestamp()
+        ):
+            raise _client_error("304", "GetObject", {"etag": etag})
+        return {"Body": FakeBody(data), "ETag": etag, "ContentLength": len(data)}
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        os.makedirs(os.path.dirname(self.__path(Key)), exist_ok=True)
+        with open(Filename, "rb") as src, open(self.__path(Key), "wb") as dst:
+            dst.write(src.read())
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        p = self.__path(Key)
+        if not os.path.isfile(p):
+            raise _client_error("404", "HeadObject")
+        with open(p, "rb") as src, open(Filename, "wb") as dst:
+            dst.write(src.read())
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        if os.path.isfile(self.__path(Key)):
+            os.remove(self.__path(Key))
+        return {}
+
+
+class FakeSQS:
+    def __init__(self):
+        self.messages = []
+
+    def get_queue_url(self, QueueName):
+        return {"QueueUrl": f"https://sqs.local/{QueueName}"}
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        self.messages.append(MessageBody)
+        return {"MessageId": str(len(self.messages))}
+
+
+class FakeTable:
+    def __init__(self, items: list):
+        self.items = {item["id"]: dict(item) for item in items}
+
+    def get_item(self, Key):
+        item = self.items.get(Key["id"])
+        return {"Item": dict(item)} if item else {}
+
+    def put_item(self, Item):
+        self.items[Item["id"]] = dict(Item)
+        return {}
+
+    def update_item(self, Key, ExpressionAttributeValues=None, **kwargs):
+        # only what trainjob.update_status sets
+        item = self.items.setdefault(Key["id"], dict(Key))
+        values = ExpressionAttributeValues or {}
+        if ":s" in values:
+            item["status"] = values[":s"]
+        if ":u" in values:
+            item["updated"] = values[":u"]
+        return {}
+
+
+class FakeDynamoDB:
+    def __init__(self, tables: dict):
+        self.tables = {name: FakeTable(items) for name, items in tables.items()}
+
+    def Table(self, name):
+        return self.tables.setdefault(name, FakeTable([]))
+
+
+class FakeAwsOnImport:
+    """
+    sys.meta_path finder that patches boto3 right after it is executed.
+    """
+
+    def __init__(self, config: dict):
+        self.s3 = FakeS3(config["s3_root"])
+        self.sqs = FakeSQS()
+        self.dynamodb = FakeDynamoDB(config.get("dynamodb", {}))
+
+    def client(self, service, *args, **kwargs):
+        return {"s3": self.s3, "sqs": self.sqs}[service]
+
+    def resource(self, service, *args, **kwargs):
+        return {"dynamodb": self.dynamodb}[service]
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname != "boto3":
+            return None
+        sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(fullname)
+        exec_module = spec.loader.exec_module
+
+        def exec_and_patch(module):
+            exec_module(module)
+            module.client = self.client
+            module.resource = self.resource
+
+        spec.loader.exec_module = exec_and_patch
+        return spec
+
+
+class FakeContext:
+    function_name = "cold-start"
+    aws_request_id = "cold-start"
+
+    def get_remaining_time_in_millis(self) -> int:
+        return 900000
+
+
+def _ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def _status(response):
+    return response.get("statusCode") if isinstance(response, dict) else None
+
+
+def run(config: dict) -> dict:
+    result = {"handler": config["handler"]}
+    aws = FakeAwsOnImport(config)
+    sys.meta_path.insert(0, aws)
+    started = time.perf_counter()
+    try:
+        module = importlib.import_module(config["handler"])
+    except BaseException as e:
+        result["error"] = f"import failed: {type(e).__name__}: {e}"
+        return result
+    result["import_ms"] = _ms(started)
+    context = FakeContext()
+    for i, event in enumerate(config["events"]):
+        started = time.perf_counter()
+        try:
+            response = module.handler(event, context)
+        except Exception as e:
+            traceback.print_exc()
+            result["error"] = f"invocation {i} failed: {type(e).__name__}: {e}"
+            return result
+        elapsed = _ms(started)
+        if i == 0:
+            result["first_ms"] = elapsed
+            # for the time from process start to first response (measured by the parent)
+            result["first_response_at"] = time.time()
+            result["first_status"] = _status(response)
+        else:
+            result.setdefault("steady_ms", []).append(elapsed)
+            result.setdefault("steady_status", []).append(_status(response))
+    # e.g. for trainjob, which has no response but updates its job
+    result["job_status"] = {
+        item["id"]: item.get("status")
+        for table in aws.dynamodb.tables.values()
+        for item in table.items.values()
+    }
+    return result
+
+
+def main():
+    config_file, result_file = sys.argv[1:3]
+    with open(config_file) as f:
+        config = json.load(f)
+    result = run(config)
+    with open(result_file, "w") as f:
+        json.dump(result, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+"""
+Compares question encoding latency of the remote SBERT service with the
+in-process encoder used by LOCAL_ENCODER=true.
+
+    SBERT_ENDPOINT=https://sbert-qa.mentorpal.org/v1 API_SECRET=... \\
+        python -m benchmark.encoder_modes --shared-root shared --count 200
+
+Either mode is skipped if it's not available (no SBERT_ENDPOINT set, or the
+sentence transformer can't be loaded from --shared-root).
+"""
+
+import argparse
+import json
+import os
+from timeit import default_timer as timer
+from typing import Dict, List
+
+import numpy
+
+from module.classifier.encoder import LocalQuestionEncoder, RemoteQuestionEncoder
+
+QUESTIONS_FILE = os.path.join(os.path.dirname(__file__), "cf-questions.json")
+
+
+def load_questions(count: int) -> List[str]:
+    with open(QUESTIONS_FILE) as f:
+        questions = json.load(f)
+    return questions[:count]
+
+
+def time_encoder(encoder, questions: List[str]) -> Dict[str, float]:
+    encoder.encode(questions[0])  # warm up (connection, lazy model init)
+    latencies = []
+    for question in questions:
+        start = timer()
+        encoder.encode(question)
+        latencies.append((timer() - start) * 1000)
+    ms = numpy.array(latencies)
+    return {
+        "count": len(latencies),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(numpy.percentile(ms, 50)),
+        "p95_ms": float(numpy.percentile(ms, 95)),
+        "p99_ms": float(numpy.percentile(ms, 99)),
+    }
+
+
+def max_embedding_difference(local, remote, questions: List[str]) -> float:
+    return max(
+        float(numpy.max(numpy.abs(local.encode(q) - remote.encode(q))))
+        for q in questions
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--shared-root", default=os.environ.get("SHARED_ROOT", "shared")
+    )
+    parser.add_argument("--count", type=int, default=100)
+    args = parser.parse_args()
+    questions = load_questions(args.count)
+    encoders = {}
+    if os.environ.get("SBERT_ENDPOINT"):
+        encoders["remote"] = RemoteQuestionEncoder()
+    try:
+        encoders["local"] = LocalQuestionEncoder(args.shared_root)
+    except Exception as e:
+        print(f"local encoder unavailable: {e}")
+    results = {name: time_encoder(e, questions) for name, e in encoders.items()}
+    if "local" in encoders and "remote" in encoders:
+        results["max_abs_difference"] = max_embedding_difference(
+            encoders["local"], encoders["remote"], questions[:20]
+        )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
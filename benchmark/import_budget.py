@@ -0,0 +1,117 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+"""
+Import-time budget for the lambda handlers: imports each handler in a fresh
+interpreter with `python -X importtime` (best of --runs) and fails (exit 1)
+if any handler's cumulative import time exceeds its budget or it can't be imported.
+
+    python -m benchmark.import_budget
+    python -m benchmark.import_budget --handlers predict status --top 10
+
+Handlers are imported with stub configuration (no network calls are made at import).
+Budgets are in milliseconds and include module level setup like creating boto3 clients.
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+BUDGETS_MS = {
+    "predict": 600,
+    "followup": 3000,
+    "train": 600,
+    "trainjob": 6000,
+    "status": 600,
+    "trainingdata": 300,
+    "authorizer": 300,
+}
+
+STUB_ENV = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "stub",
+    "AWS_SECRET_ACCESS_KEY": "stub",
+    "MODELS_BUCKET": "stub-models",
+    "JOBS_TABLE_NAME": "stub-jobs",
+    "JOBS_SQS_NAME": "stub-jobs",
+    "JWT_SECRET": "stub",
+    "SHARED_ROOT": "shared",
+    "GRAPHQL_ENDPOINT": "http://graphql",
+    "SBERT_ENDPOINT": "http://sbert",
+    "LOG_LEVEL": "WARNING",
+}
+
+IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def import_times(handler: str) -> Optional[List[tuple]]:
+    """
+    (cumulative us, depth, module) for each import, or None if the import failed.
+    """
+    p = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {handler}"],
+        env={**os.environ, **STUB_ENV},
+        capture_output=True,
+        text=True,
+    )
+    if p.returncode != 0:
+        sys.stderr.write(p.stderr.strip().splitlines()[-1] + "\n")
+        return None
+    times = []
+    for line in p.stderr.splitlines():
+        m = IMPORT_TIME.match(line)
+        if m:
+            times.append((int(m.group(2)), (len(m.group(3)) - 1) // 2, m.group(4)))
+    return times
+
+
+def measure(handler: str, runs: int, top: int) -> Dict:
+    best = None
+    for _ in range(runs):
+        times = import_times(handler)
+        if times is None:
+            return {"handler": handler, "error": "import failed"}
+        total = next(us for us, depth, name in times if depth == 0 and name == handler)
+        if best is None or total < best[0]:
+            best = (total, times)
+    total, times = best
+    # the heaviest direct imports of the handler
+    children = sorted(
+        ((us, name) for us, depth, name in times if depth == 1), reverse=True
+    )[:top]
+    return {
+        "handler": handler,
+        "import_ms": round(total / 1000, 1),
+        "top_imports_ms": {name: round(us / 1000, 1) for us, name in children},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--handlers", nargs="+", default=list(BUDGETS_MS))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="multiply budgets (slow machines)"
+    )
+    args = parser.parse_args()
+    results = []
+    for handler in args.handlers:
+        r = measure(handler, args.runs, args.top)
+        r["budget_ms"] = BUDGETS_MS[handler] * args.scale
+        r["ok"] = "error" not in r and r["import_ms"] <= r["budget_ms"]
+        results.append(r)
+    print(json.dumps(results, indent=2))
+    if not all(r["ok"] for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
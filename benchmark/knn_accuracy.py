@@ -0,0 +1,170 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+"""
+Compares the accuracy of the lr_transformer (ridge) and knn_transformer
+(nearest neighbor) classifiers on the fixture mentors in tests/fixtures/data:
+their test.csv where there is one, otherwise the last paraphrase of each
+question (held out of training). Also times adding a paraphrase:
+refitting the ridge classifier vs appending to the knn index.
+
+Uses the sentence transformer in --shared if it loads, otherwise (or with
+--encoder hashing) a hashed bag of words, whose absolute accuracies
+are lower but still compare the two classifiers.
+
+    python -m benchmark.knn_accuracy --k 1 5 10
+"""
+
+import argparse
+import csv
+import json
+import os
+import tempfile
+import time
+from typing import List, Tuple
+
+import numpy
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import RidgeClassifier
+
+from module.classifier.knn import (
+    NearestNeighborScorer,
+    append_knn_index,
+    normalize_rows,
+    save_knn_index,
+)
+from module.utils import normalize_strings
+
+EMBEDDING_SIZE = 768
+FIXTURES = os.path.join("tests", "fixtures", "data")
+
+Examples = Tuple[List[str], List[str]]
+
+
+def load_fixture(mentor_dir: str) -> Tuple[Examples, Examples]:
+    """
+    Returns (training, test) questions and answers of a fixture mentor.
+    """
+    with open(os.path.join(mentor_dir, "data.csv")) as f:
+        rows = list(csv.DictReader(f))
+    test_file = os.path.join(mentor_dir, "test.csv")
+    has_test_file = os.path.isfile(test_file)
+    x_train: List[str] = []
+    y_train: List[str] = []
+    x_test: List[str] = []
+    y_test: List[str] = []
+    for row in rows:
+        questions = [row["question"]] + [p for p in row["paraphrases"].split("|") if p]
+        if not has_test_file and len(questions) > 2:
+            x_test.append(questions.pop())
+            y_test.append(row["answer"])
+        x_train.extend(questions)
+        y_train.extend([row["answer"]] * len(questions))
+    if has_test_file:
+        with open(test_file) as f:
+            for row in csv.reader(f):
+                if row[0].lower() != "question":
+                    x_test.append(row[0])
+                    y_test.append(row[1])
+    return (normalize_strings(x_train), y_train), (normalize_strings(x_test), y_test)
+
+
+def load_encoder(name: str, shared_root: str):
+    """
+    Returns (encoder name, function of a list of strings to their embeddings).
+    """
+    if name != "hashing":
+        try:
+            from module.classifier.arch.lr_transformer.embeddings import (
+                TransformerEmbeddings,
+            )
+
+            transformer = TransformerEmbeddings(shared_root)
+            return "transformer", lambda texts: numpy.asarray(
+                transformer.get_embeddings(texts, show_progress_bar=False)
+            )
+        except Exception as e:
+            if name == "transformer":
+                raise
+            print(f"sentence transformer unavailable ({e}), using hashing")
+    vectorizer = HashingVectorizer(
+        n_features=EMBEDDING_SIZE, ngram_range=(1, 2), alternate_sign=False
+    )
+    return "hashing", lambda texts: vectorizer.transform(texts).toarray()
+
+
+def ms_since(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def bench(mentor: str, encode, ks: List[int]) -> List[dict]:
+    (x_train, y_train), (x_test, y_test) = load_fixture(os.path.join(FIXTURES, mentor))
+    if not x_test or len(set(y_train)) < 2:
+        return []
+    e_train = numpy.asarray(encode(x_train), dtype=numpy.float32)
+    e_test = numpy.asarray(encode(x_test), dtype=numpy.float32)
+    y_test = numpy.asarray(y_test)
+    base = {"mentor": mentor, "train": len(x_train), "test": len(x_test)}
+    started = time.perf_counter()
+    ridge = RidgeClassifier().fit(e_train, y_train)
+    fit_ms = ms_since(started)
+    results = [
+        {
+            **base,
+            "arch": "lr_transformer",
+            "accuracy": round(float(numpy.mean(ridge.predict(e_test) == y_test)), 4),
+            "add_paraphrase_ms": fit_ms,
+        }
+    ]
+    with tempfile.TemporaryDirectory() as model_dir:
+        save_knn_index(model_dir, e_train, y_train)
+        started = time.perf_counter()
+        append_knn_index(model_dir, e_test[:1], [str(y_test[0])])
+        append_ms = ms_since(started)
+    embeddings = normalize_rows(e_train)
+    for k in ks:
+        scorer = NearestNeighborScorer(embeddings, y_train, k)
+        class_indices, _ = scorer.score(e_test)
+        results.append(
+            {
+                **base,
+                "arch": f"knn_transformer (k={k})",
+                "accuracy": round(
+                    float(numpy.mean(scorer.classes[class_indices] == y_test)), 4
+                ),
+                "add_paraphrase_ms": append_ms,
+            }
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument(
+        "--encoder", choices=["auto", "transformer", "hashing"], default="auto"
+    )
+    parser.add_argument("--shared", default="shared")
+    args = parser.parse_args()
+    encoder, encode = load_encoder(args.encoder, args.shared)
+    mentors = sorted(
+        m
+        for m in os.listdir(FIXTURES)
+        if os.path.isfile(os.path.join(FIXTURES, m, "data.csv"))
+    )
+    print(
+        json.dumps(
+            {
+                "encoder": encoder,
+                "results": [r for m in mentors for r in bench(m, encode, args.k)],
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
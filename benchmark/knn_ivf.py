@@ -0,0 +1,106 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+"""
+Compares exact and IVF (approximate) nearest neighbor scoring on synthetic
+knn_transformer indexes (clustered paraphrases of many answers):
+build time, recall@1 against exact search, top-1 answer agreement
+and time to score a question, for several numbers of probed lists.
+
+    python -m benchmark.knn_ivf --rows 20000 100000 --probes 4 8 16
+"""
+
+import argparse
+import json
+import time
+from timeit import timeit
+
+import numpy
+
+from module.classifier.ivf import IvfIndex, build_ivf, ivf_recall_at_1
+from module.classifier.knn import NearestNeighborScorer, normalize_rows
+
+EMBEDDING_SIZE = 768
+PARAPHRASES_PER_ANSWER = 10
+
+
+def synthetic_index(n_rows: int, seed: int = 0):
+    """
+    Normalized embeddings of paraphrases (noisy copies of a center per answer),
+    their answer ids and 200 questions (other noisy copies).
+    """
+    rng = numpy.random.default_rng(seed)
+    n_answers = max(2, n_rows // PARAPHRASES_PER_ANSWER)
+    centers = rng.normal(size=(n_answers, EMBEDDING_SIZE)).astype(numpy.float32)
+    answers = numpy.arange(n_rows) % n_answers
+    embeddings = centers[answers] + rng.normal(
+        scale=0.8, size=(n_rows, EMBEDDING_SIZE)
+    ).astype(numpy.float32)
+    questions = centers[rng.integers(n_answers, size=200)] + rng.normal(
+        scale=0.8, size=(200, EMBEDDING_SIZE)
+    ).astype(numpy.float32)
+    return normalize_rows(embeddings), [f"a{i}" for i in answers], questions
+
+
+def score_us(scorer: NearestNeighborScorer, questions: numpy.ndarray) -> float:
+    """
+    Time to score one question (they are scored one at a time, like predict does).
+    """
+    return round(
+        timeit(lambda: [scorer.score(q) for q in questions], number=1)
+        / len(questions)
+        * 1e6,
+        1,
+    )
+
+
+def bench(n_rows: int, probes: list) -> list:
+    embeddings, labels, questions = synthetic_index(n_rows)
+    started = time.perf_counter()
+    centroids, order, offsets = build_ivf(embeddings)
+    build_ms = round((time.perf_counter() - started) * 1000)
+    embeddings = embeddings[order]
+    labels = [labels[i] for i in order]
+    exact = NearestNeighborScorer(embeddings, labels)
+    exact_answers = exact.classes[exact.score(questions)[0]]
+    results = [
+        {
+            "rows": n_rows,
+            "search": "exact",
+            "score_us": score_us(exact, questions),
+        }
+    ]
+    for n_probe in probes:
+        index = IvfIndex(embeddings, centroids, offsets, n_probe)
+        scorer = NearestNeighborScorer(embeddings, labels, ivf=index)
+        answers = scorer.classes[scorer.score(questions)[0]]
+        results.append(
+            {
+                "rows": n_rows,
+                "search": "ivf",
+                "lists": len(centroids),
+                "probes": n_probe,
+                "build_ms": build_ms,
+                "recall_at_1": round(ivf_recall_at_1(index), 4),
+                "answer_agreement": round(
+                    float(numpy.mean(answers == exact_answers)), 4
+                ),
+                "score_us": score_us(scorer, questions),
+            }
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--probes", type=int, nargs="+", default=[4, 8, 16])
+    args = parser.parse_args()
+    print(json.dumps([r for n in args.rows for r in bench(n, args.probes)], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+"""
+Micro-benchmark of scoring one embedded question:
+RidgeClassifier.predict + decision_function (the previous predict path)
+against the precompiled LinearScorer.
+
+    python -m benchmark.linear_scorer --classes 50 200 1000
+"""
+
+import argparse
+import json
+from timeit import timeit
+
+import numpy
+from sklearn.linear_model import RidgeClassifier
+
+from module.classifier.scorer import LinearScorer
+
+EMBEDDING_SIZE = 768
+
+
+def train(n_classes: int) -> RidgeClassifier:
+    rng = numpy.random.default_rng(0)
+    x = rng.normal(size=(n_classes * 3, EMBEDDING_SIZE))
+    y = numpy.array([f"answer{i % n_classes}" for i in range(len(x))])
+    return RidgeClassifier().fit(x, y)
+
+
+def sklearn_path(model: RidgeClassifier, x) -> tuple:
+    prediction = model.predict([x])
+    decision = model.decision_function([x])
+    return prediction[0], max(decision[0])
+
+
+def scorer_path(scorer: LinearScorer, x) -> tuple:
+    class_indices, confidences = scorer.score([x])
+    return scorer.classes[class_indices[0]], confidences[0]
+
+
+def bench(n_classes: int, number: int) -> dict:
+    model = train(n_classes)
+    scorer = LinearScorer.from_model(model)
+    x = numpy.random.default_rng(1).normal(size=EMBEDDING_SIZE)
+    assert sklearn_path(model, x)[0] == scorer_path(scorer, x)[0]
+    sklearn_us = timeit(lambda: sklearn_path(model, x), number=number) / number * 1e6
+    scorer_us = timeit(lambda: scorer_path(scorer, x), number=number) / number * 1e6
+    return {
+        "classes": n_classes,
+        "sklearn_us": round(sklearn_us, 1),
+        "scorer_us": round(scorer_us, 1),
+        "speedup": round(sklearn_us / scorer_us, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--classes", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+    print(json.dumps([bench(n, args.number) for n in args.classes], indent=2))
+
+
+if __name__ == "__main__":
+    main()
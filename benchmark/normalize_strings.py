@@ -0,0 +1,75 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+"""
+Time to sanitize all the text of a large (synthetic) mentor: the previous
+character by character sanitize_string, the regex one, and normalize_strings,
+plus the time to index the whole mentor.
+
+    python -m benchmark.normalize_strings --answers 5000
+"""
+
+import argparse
+import json
+from string import ascii_letters, digits, whitespace
+from timeit import timeit
+from typing import List
+
+from module.utils import normalize_strings, sanitize_string
+
+from .synthetic import synthetic_mentor, synthetic_mentor_data
+
+
+def sanitize_string_before(input_string: str) -> str:
+    input_string = input_string.strip().casefold().replace("\u00a0", " ")
+    return "".join(
+        [ch for ch in input_string if ch in (ascii_letters + digits + whitespace)]
+    )
+
+
+def mentor_text(data: dict) -> List[str]:
+    """
+    What the mentor indexes sanitize: questions, paraphrases and transcripts.
+    """
+    texts = []
+    for answer in data["answers"]:
+        texts.append(answer["question"]["question"])
+        texts.extend(answer["question"]["paraphrases"])
+        texts.append(answer["transcript"])
+    return texts
+
+
+def report(n_answers: int, number: int) -> dict:
+    data = synthetic_mentor_data(n_answers)
+    texts = mentor_text(data)
+    expected = [sanitize_string_before(t) for t in texts]
+    assert [sanitize_string(t) for t in texts] == expected
+    assert normalize_strings(texts) == expected
+
+    def ms(f) -> float:
+        return round(timeit(f, number=number) / number * 1000, 2)
+
+    return {
+        "answers": n_answers,
+        "strings": len(texts),
+        "chars": sum(len(t) for t in texts),
+        "before_ms": ms(lambda: [sanitize_string_before(t) for t in texts]),
+        "sanitize_string_ms": ms(lambda: [sanitize_string(t) for t in texts]),
+        "normalize_strings_ms": ms(lambda: normalize_strings(texts)),
+        "mentor_load_ms": ms(lambda: synthetic_mentor("synthetic", data)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--answers", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--number", type=int, default=5, help="timed repetitions")
+    args = parser.parse_args()
+    print(json.dumps([report(n, args.number) for n in args.answers], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+"""
+Latency of asking a panel of mentors the same question with one
+predict.panel_handler request vs one predict.handler request per mentor
+(one after another, the panel UI sends them concurrently),
+and the number of SBERT encodes and feedback writes each takes.
+
+    LOG_LEVEL=WARNING python -m benchmark.panel --mentors 4 8 --sbert-ms 30 --graphql-ms 40
+
+Mentors are synthetic, with models trained on random embeddings.
+SBERT and the feedback mutations are stubbed and take --sbert-ms and --graphql-ms.
+The embedding cache is cleared before each request, as if every request
+was answered by a different container.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from timeit import default_timer as timer
+from typing import Callable, Dict, Iterator, List
+from unittest.mock import patch
+
+import numpy
+
+from module.classifier.dao import Dao
+from module.classifier.encoder import EMBEDDING_CACHE
+
+from .import_budget import STUB_ENV
+from .predict_latency import QUESTIONS_FILE, stub_encoding
+from .synthetic import (
+    stubbed_mentor_api,
+    synthetic_mentor_data,
+    train_synthetic_model,
+)
+
+TARGETS = ["requests", "panel"]
+
+
+@contextmanager
+def stubbed_network(
+    mentor_data: dict, sbert_ms: float, graphql_ms: float, calls: Dict[str, int]
+) -> Iterator[None]:
+    def encode(question: str) -> dict:
+        calls["sbert"] += 1
+        time.sleep(sbert_ms / 1000)
+        return stub_encoding(question)
+
+    def create_user_questions(user_questions: List[dict]) -> List[str]:
+        calls["feedback"] += 1
+        time.sleep(graphql_ms / 1000)
+        return [uuid.uuid4().hex[:24] for _ in user_questions]
+
+    with stubbed_mentor_api(mentor_data), patch(
+        "module.classifier.encoder.sbert_encode", side_effect=encode
+    ), patch(
+        "module.feedback.create_user_question_from_input",
+        side_effect=lambda uq: create_user_questions([uq])[0],
+    ), patch(
+        "module.feedback.create_user_questions", side_effect=create_user_questions
+    ):
+        yield
+
+
+def requests_call(predict, mentors: List[str]) -> Callable[[str], None]:
+    def call(question: str):
+        for mentor in mentors:
+            EMBEDDING_CACHE.clear()
+            event = {
+                "headers": {},
+                "queryStringParameters": {
+                    "mentor": mentor,
+                    "query": question,
+                    "chatsessionid": "benchmark",
+                },
+            }
+            response = predict.handler(event, {})
+            assert response["statusCode"] == 200, response
+
+    return call
+
+
+def panel_call(predict, mentors: List[str]) -> Callable[[str], None]:
+    def call(question: str):
+        EMBEDDING_CACHE.clear()
+        event = {
+            "headers": {},
+            "body": json.dumps(
+                {"mentors": mentors, "chatsessionid": "benchmark", "question": question}
+            ),
+        }
+        response = predict.panel_handler(event, {})
+        assert response["statusCode"] == 200, response
+
+    return call
+
+
+def bench(
+    n_mentors: int, answers: int, count: int, sbert_ms: float, graphql_ms: float
+) -> List[dict]:
+    import predict
+
+    data = synthetic_mentor_data(answers)
+    mentors = [f"synthetic-{i}" for i in range(n_mentors)]
+    with open(QUESTIONS_FILE) as f:
+        questions = json.load(f)[:count]
+    calls = {"sbert": 0, "feedback": 0}
+    results = []
+    with tempfile.TemporaryDirectory() as data_root, stubbed_network(
+        data, sbert_ms, graphql_ms, calls
+    ):
+        dao = Dao(predict.SHARED, data_root)
+        for mentor in mentors:
+            train_synthetic_model(data_root, mentor, data)
+            dao.find_classifier(mentor)  # loaded once, like a warm container
+        targets = {
+            "requests": requests_call(predict, mentors),
+            "panel": panel_call(predict, mentors),
+        }
+        with patch.object(predict, "classifier_dao", dao), patch.object(
+            predict, "fetch_model", return_value=True
+        ):
+            for target, call in targets.items():
+                call(questions[0])  # warm up
+                calls.update(sbert=0, feedback=0)
+                latencies = []
+                for question in questions:
+                    started = timer()
+                    call(question)
+                    latencies.append((timer() - started) * 1000)
+                ms = numpy.array(latencies)
+                results.append(
+                    {
+                        "mentors": n_mentors,
+                        "target": target,
+                        "p50_ms": round(float(numpy.percentile(ms, 50)), 2),
+                        "p95_ms": round(float(numpy.percentile(ms, 95)), 2),
+                        "sbert_calls_per_question": calls["sbert"] / len(questions),
+                        "feedback_writes_per_question": calls["feedback"]
+                        / len(questions),
+                    }
+                )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mentors", type=int, nargs="+", default=[4, 8])
+    parser.add_argument("--answers", type=int, default=100)
+    parser.add_argument("--count", type=int, default=50, help="questions")
+    parser.add_argument("--sbert-ms", type=float, default=30)
+    parser.add_argument("--graphql-ms", type=float, default=40)
+    args = parser.parse_args()
+    # predict reads its configuration at import:
+    for key, value in STUB_ENV.items():
+        os.environ.setdefault(key, value)
+    results = []
+    for n in args.mentors:
+        results.extend(
+            bench(n, args.answers, args.count, args.sbert_ms, args.graphql_ms)
+        )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
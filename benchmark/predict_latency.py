@@ -0,0 +1,196 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+"""
+In-process latency and throughput of answering questions, for the exact match,
+classifier and off topic paths, through TransformersQuestionClassifierPrediction.evaluate
+and through predict.handler, at several mentor sizes.
+
+    LOG_LEVEL=WARNING python -m benchmark.predict_latency
+    LOG_LEVEL=WARNING python -m benchmark.predict_latency --answers 100 5000 --count 500
+
+Mentors are synthetic (--answers) or graphql fixtures (tests/fixtures/graphql),
+with a model trained on random embeddings. Network calls are stubbed:
+SBERT returns a random embedding per question and feedback isn't sent, so the
+numbers are the service's own cost. Questions for the classifier and off topic
+paths come from benchmark/cf-questions.json, the path is forced with OFF_TOPIC_THRESHOLD.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
+from timeit import default_timer as timer
+from typing import Callable, Dict, Iterator, List
+from unittest.mock import patch
+
+import numpy
+
+from module.classifier.dao import Dao
+from module.classifier.encoder import EMBEDDING_CACHE
+from module.classifier.predict import TransformersQuestionClassifierPrediction
+from module.utils import sanitize_string
+
+from .import_budget import STUB_ENV
+from .synthetic import (
+    EMBEDDING_SIZE,
+    stubbed_mentor_api,
+    synthetic_mentor_data,
+    train_synthetic_model,
+)
+
+QUESTIONS_FILE = os.path.join(os.path.dirname(__file__), "cf-questions.json")
+FIXTURES_DIR = os.path.join(
+    os.path.dirname(__file__), "..", "tests", "fixtures", "graphql"
+)
+# forces every classifier prediction to be accepted, or to be off topic:
+PATH_THRESHOLDS = {"classifier": "-1000", "off_topic": "1000"}
+PATHS = ["exact", *PATH_THRESHOLDS]
+TARGETS = ["evaluate", "handler"]
+
+
+def stub_encoding(question: str) -> dict:
+    seed = int.from_bytes(
+        hashlib.blake2b(question.encode(), digest_size=4).digest(), "big"
+    )
+    return {"encoding": numpy.random.default_rng(seed).normal(size=EMBEDDING_SIZE)}
+
+
+@contextmanager
+def stubbed_network(mentor_data: dict) -> Iterator[None]:
+    with stubbed_mentor_api(mentor_data), patch(
+        "module.classifier.encoder.sbert_encode", side_effect=stub_encoding
+    ), patch(
+        "module.feedback.create_user_question_from_input",
+        side_effect=lambda _: uuid.uuid4().hex[:24],
+    ):
+        yield
+
+
+def fixture_mentor_data(name: str) -> dict:
+    with open(os.path.join(FIXTURES_DIR, f"{name}.json")) as f:
+        return json.load(f)["data"]["mentor"]
+
+
+def path_questions(
+    path: str, classifier: TransformersQuestionClassifierPrediction, count: int
+) -> List[str]:
+    if path == "exact":
+        questions = [
+            q["question_text"] for q in classifier.mentor.questions_by_id.values()
+        ]
+    else:
+        with open(QUESTIONS_FILE) as f:
+            # (excluding any that would match a mentor question exactly)
+            questions = [
+                q
+                for q in json.load(f)
+                if sanitize_string(q) not in classifier.mentor.questions_by_text
+            ]
+    return [questions[i % len(questions)] for i in range(count)]
+
+
+def time_calls(f: Callable[[str], None], questions: List[str]) -> Dict[str, float]:
+    f(questions[0])  # warm up
+    EMBEDDING_CACHE.clear()
+    latencies = []
+    started = timer()
+    for question in questions:
+        start = timer()
+        f(question)
+        latencies.append((timer() - start) * 1000)
+    elapsed = timer() - started
+    ms = numpy.array(latencies)
+    return {
+        "count": len(latencies),
+        "p50_ms": round(float(numpy.percentile(ms, 50)), 3),
+        "p95_ms": round(float(numpy.percentile(ms, 95)), 3),
+        "p99_ms": round(float(numpy.percentile(ms, 99)), 3),
+        "questions_per_sec": round(len(latencies) / elapsed, 1),
+    }
+
+
+def handler_call(predict, mentor_id: str) -> Callable[[str], None]:
+    def call(question: str):
+        event = {
+            "headers": {},
+            "queryStringParameters": {
+                "mentor": mentor_id,
+                "query": question,
+                "chatsessionid": "benchmark",
+            },
+        }
+        response = predict.handler(event, {})
+        assert response["statusCode"] == 200, response
+
+    return call
+
+
+def report(
+    name: str, data: dict, count: int, targets: List[str], paths: List[str]
+) -> List[dict]:
+    import predict
+
+    results = []
+    with tempfile.TemporaryDirectory() as data_root, stubbed_network(data):
+        train_synthetic_model(data_root, name, data)
+        classifier = TransformersQuestionClassifierPrediction(name, data_root)
+        dao = Dao(predict.SHARED, data_root)
+        dao.find_classifier(name)  # loaded once, like a warm container
+        calls = {
+            "evaluate": lambda q: classifier.evaluate(q, "benchmark"),
+            "handler": handler_call(predict, name),
+        }
+        with patch.object(predict, "classifier_dao", dao), patch.object(
+            predict, "fetch_model", return_value=True
+        ):
+            for path in paths:
+                questions = path_questions(path, classifier, count)
+                env = (
+                    {"OFF_TOPIC_THRESHOLD": PATH_THRESHOLDS[path]}
+                    if path in PATH_THRESHOLDS
+                    else {}
+                )
+                with patch.dict(os.environ, env):
+                    for target in targets:
+                        results.append(
+                            {
+                                "mentor": name,
+                                "answers": len(data["answers"]),
+                                "target": target,
+                                "path": path,
+                                **time_calls(calls[target], questions),
+                            }
+                        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--answers", type=int, nargs="*", default=[10, 100, 1000])
+    parser.add_argument("--fixtures", nargs="*", default=["clint"])
+    parser.add_argument("--count", type=int, default=200, help="questions per path")
+    parser.add_argument("--targets", nargs="+", default=TARGETS, choices=TARGETS)
+    parser.add_argument("--paths", nargs="+", default=PATHS, choices=PATHS)
+    args = parser.parse_args()
+    # predict reads its configuration at import:
+    for key, value in STUB_ENV.items():
+        os.environ.setdefault(key, value)
+    mentors = {
+        **{f"synthetic-{n}": synthetic_mentor_data(n) for n in args.answers},
+        **{name: fixture_mentor_data(name) for name in args.fixtures},
+    }
+    results = []
+    for name, data in mentors.items():
+        results.extend(report(name, data, args.count, args.targets, args.paths))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+"""
+Memory report for the per-class response table that
+TransformersQuestionClassifierPrediction builds at load.
+
+    python -m benchmark.response_table --answers 1000
+"""
+
+import argparse
+import json
+import tempfile
+from timeit import timeit
+
+import numpy
+
+from module.classifier.predict import TransformersQuestionClassifierPrediction
+from module.utils import deep_getsizeof
+
+from .synthetic import (
+    EMBEDDING_SIZE,
+    synthetic_mentor,
+    synthetic_mentor_data,
+    train_synthetic_model,
+)
+
+
+def report(n_answers: int) -> dict:
+    data = synthetic_mentor_data(n_answers)
+    mentor = synthetic_mentor("synthetic", data)
+    with tempfile.TemporaryDirectory() as data_root:
+        train_synthetic_model(data_root, mentor.id, data)
+        classifier = TransformersQuestionClassifierPrediction(mentor, data_root)
+    seen = set()
+    mentor_bytes = deep_getsizeof(classifier.mentor, seen)
+    # objects shared with the mentor (transcripts, media) are not counted again:
+    table_bytes = deep_getsizeof(classifier.responses, seen)
+    scorer_bytes = deep_getsizeof(classifier.scorer, seen)
+    predict = classifier._TransformersQuestionClassifierPrediction__get_prediction
+    x = numpy.random.default_rng(0).normal(size=EMBEDDING_SIZE)
+    number = 2000
+    return {
+        "answers": n_answers,
+        "classes": len(classifier.responses),
+        "response_table_bytes": table_bytes,
+        "response_table_bytes_per_class": round(
+            table_bytes / len(classifier.responses)
+        ),
+        "mentor_bytes": mentor_bytes,
+        "scorer_bytes": scorer_bytes,
+        "prediction_us": round(
+            timeit(lambda: predict(x), number=number) / number * 1e6, 1
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--answers", type=int, nargs="+", default=[1000])
+    args = parser.parse_args()
+    print(json.dumps([report(n) for n in args.answers], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+"""
+Synthetic mentors (GraphQL-shaped data and trained models) for benchmarks
+that must run without the network or the sentence transformer.
+"""
+
+import os
+from contextlib import contextmanager
+from typing import Iterator, List
+from unittest.mock import patch
+
+import joblib
+import numpy
+from sklearn.linear_model import RidgeClassifier
+
+from module.classifier import ARCH_LR_TRANSFORMER, mentor_model_path
+from module.mentor import Mentor
+
+EMBEDDING_SIZE = 768
+
+
+def _media(answer_id: str) -> dict:
+    return {
+        "webMedia": {
+            "type": "video",
+            "tag": "web",
+            "url": f"https://videourl.org/{answer_id}/web.mp4",
+            "transparentVideoUrl": "",
+        },
+        "mobileMedia": {
+            "type": "video",
+            "tag": "mobile",
+            "url": f"https://videourl.org/{answer_id}/mobile.mp4",
+            "transparentVideoUrl": "",
+        },
+        "vttMedia": {
+            "type": "subtitles",
+            "tag": "en",
+            "url": f"https://videourl.org/{answer_id}/en.vtt",
+        },
+    }
+
+
+def synthetic_mentor_data(n_answers: int, n_paraphrases: int = 3) -> dict:
+    """
+    Data in the shape returned by api.fetch_mentor_data,
+    with n_answers answered questions and one off topic utterance.
+    """
+    answers = []
+    questions = []
+    for i in range(n_answers):
+        question_id = f"q{i:06d}"
+        answer_id = f"a{i:06d}"
+        answers.append(
+            {
+                "_id": answer_id,
+                "status": "COMPLETE",
+                "transcript": f"This is my answer number {i}, it is a fairly typical answer.",
+                "markdownTranscript": f"This is my answer number **{i}**.",
+                "question": {
+                    "_id": question_id,
+                    "question": f"What do you think about topic {i}?",
+                    "type": "QUESTION",
+                    "name": "",
+                    "paraphrases": [
+                        f"How do you feel about topic {i} version {p}?"
+                        for p in range(n_paraphrases)
+                    ],
+                },
+                "externalVideoIds": {"wistiaId": ""},
+                **_media(answer_id),
+            }
+        )
+        questions.append({"question": {"_id": question_id}, "topics": []})
+    answers.append(
+        {
+            "_id": "offtopic",
+            "status": "COMPLETE",
+            "transcript": "I never recorded an answer for that.",
+            "markdownTranscript": "I never recorded an answer for that.",
+            "question": {
+                "_id": "q_offtopic",
+                "question": "",
+                "type": "UTTERANCE",
+                "name": "_OFF_TOPIC_",
+                "paraphrases": [],
+            },
+            "externalVideoIds": {"wistiaId": ""},
+            **_media("offtopic"),
+        }
+    )
+    return {
+        "mentorType": "VIDEO",
+        "subjects": [],
+        "topics": [],
+        "questions": questions,
+        "answers": answers,
+        "orphanedCompleteAnswers": [],
+    }
+
+
+@contextmanager
+def stubbed_mentor_api(data: dict) -> Iterator[None]:
+    with patch("module.mentor.fetch_mentor_data", return_value=data), patch(
+        "module.mentor.fetch_mentor_graded_user_questions", return_value=[]
+    ):
+        yield
+
+
+def synthetic_mentor(mentor_id: str, data: dict) -> Mentor:
+    with stubbed_mentor_api(data):
+        return Mentor(mentor_id)
+
+
+def answer_ids(data: dict) -> List[str]:
+    return [
+        a["_id"]
+        for a in data["answers"]
+        if a["_id"] and a["question"]["type"] != "UTTERANCE"
+    ]
+
+
+def train_synthetic_model(
+    data_root: str, mentor_id: str, data: dict, samples_per_answer: int = 2
+) -> RidgeClassifier:
+    """
+    Trains a RidgeClassifier on random embeddings (one cluster per answer)
+    and saves it where TransformersQuestionClassifierPrediction loads it from.
+    """
+    ids = answer_ids(data)
+    rng = numpy.random.default_rng(0)
+    centers = rng.normal(size=(len(ids), EMBEDDING_SIZE))
+    x = numpy.repeat(centers, samples_per_answer, axis=0)
+    x += rng.normal(scale=0.1, size=x.shape)
+    y = numpy.repeat(ids, samples_per_answer)
+    model = RidgeClassifier().fit(x, y)
+    model_dir = mentor_model_path(data_root, mentor_id, ARCH_LR_TRANSFORMER)
+    os.makedirs(model_dir, exist_ok=True)
+    joblib.dump(model, os.path.join(model_dir, "model.pkl"))
+    return model
@@ -0,0 +1,71 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+"""
+Compares classifier weights stored as float32, float16 and int8 (with scales):
+bytes per classifier, top-1 agreement with float32 and time to score a question.
+
+    python -m benchmark.weights_precision --classes 50 200 1000
+"""
+
+import argparse
+import json
+from timeit import timeit
+
+import numpy
+from sklearn.linear_model import RidgeClassifier
+
+from module.classifier.scorer import PRECISIONS, LinearScorer
+
+EMBEDDING_SIZE = 768
+
+
+def weights_nbytes(scorer: LinearScorer) -> int:
+    return (
+        scorer.coef.nbytes
+        + scorer.intercept.nbytes
+        + (0 if scorer.scales is None else scorer.scales.nbytes)
+    )
+
+
+def bench(n_classes: int, number: int) -> list:
+    rng = numpy.random.default_rng(0)
+    centers = rng.normal(size=(n_classes, EMBEDDING_SIZE))
+    y = numpy.repeat(numpy.arange(n_classes), 4)
+    x_train = centers[y] + rng.normal(scale=0.8, size=(len(y), EMBEDDING_SIZE))
+    x_test = centers[y] + rng.normal(scale=1.2, size=(len(y), EMBEDDING_SIZE))
+    full = LinearScorer.from_model(RidgeClassifier().fit(x_train, y))
+    results = []
+    for precision in PRECISIONS:
+        scorer = full.with_precision(precision)
+        x = x_test[:1]
+        results.append(
+            {
+                "classes": n_classes,
+                "precision": precision,
+                "weights_bytes": weights_nbytes(scorer),
+                "train_agreement": full.agreement(scorer, x_train),
+                "test_agreement": full.agreement(scorer, x_test),
+                "score_us": round(
+                    timeit(lambda: scorer.score(x), number=number) / number * 1e6, 1
+                ),
+            }
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--classes", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--number", type=int, default=1000)
+    args = parser.parse_args()
+    print(
+        json.dumps([r for n in args.classes for r in bench(n, args.number)], indent=2)
+    )
+
+
+if __name__ == "__main__":
+    main()
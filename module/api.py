@@ -8,10 +8,10 @@ import json
 import os
 import csv
 from io import StringIO
-import requests
 from timeit import default_timer as timer
 from datetime import timedelta
-from typing import Dict, List, TypedDict, Tuple
+from typing import Dict, List, Optional, TypedDict, Tuple
+from .http_client import get_http_client
 from .types import AnswerInfo
 import logging
 
@@ -28,15 +28,15 @@ class GQLQueryBody(TypedDict):
     variables: dict
 
 
-def get_off_topic_threshold() -> float:
+def get_off_topic_threshold(default: float = OFF_TOPIC_THRESHOLD_DEFAULT) -> float:
     try:
         return (
             float(str(os.environ.get("OFF_TOPIC_THRESHOLD") or ""))
             if "OFF_TOPIC_THRESHOLD" in os.environ
-            else OFF_TOPIC_THRESHOLD_DEFAULT
+            else default
         )
     except ValueError:
-        return OFF_TOPIC_THRESHOLD_DEFAULT
+        return default
 
 
 def sbert_encode(question: str):
@@ -45,7 +45,8 @@ def sbert_encode(question: str):
         f"{SECRET_HEADER_NAME}": f"{SECRET_HEADER_VALUE}",
     }
     start = timer()
-    res = requests.get(
+    res = get_http_client().get(
+        "sbert_encode",
         f"{os.environ.get('SBERT_ENDPOINT')}/encode",
         params={"query": question},
         headers=headers,
@@ -62,8 +63,10 @@ def sbert_cos_sim_weight(a: str, b: str) -> float:
         f"{SECRET_HEADER_NAME}": f"{SECRET_HEADER_VALUE}",
     }
     start = timer()
-    res = requests.post(
+    res = get_http_client().post(
+        "sbert_cos_sim_weight",
         f"{os.environ.get('SBERT_ENDPOINT')}/encode/cos_sim_weight",
+        idempotent=True,
         json={"a": a, "b": b},
         headers=headers,
     )
@@ -80,8 +83,10 @@ def sbert_paraphrase(sentences: list) -> float:
         f"{SECRET_HEADER_NAME}": f"{SECRET_HEADER_VALUE}",
     }
     start = timer()
-    res = requests.post(
+    res = get_http_client().post(
+        "sbert_paraphrase",
         f"{os.environ.get('SBERT_ENDPOINT')}/paraphrase",
+        idempotent=True,
         json={"sentences": sentences},
         headers=headers,
     )
@@ -282,8 +287,14 @@ query MentorCanEdit($mentor: ID!){
 def __auth_gql(query: GQLQueryBody, headers: Dict[str, str] = {}) -> dict:
     final_headers = {**headers, f"{SECRET_HEADER_NAME}": f"{SECRET_HEADER_VALUE}"}
     # SSL is not valid for alb so have to turn off validation
-    res = requests.post(
-        os.environ.get("GRAPHQL_ENDPOINT"), json=query, headers=final_headers
+    # queries are safe to retry, mutations are not
+    is_mutation = query["query"].lstrip().startswith("mutation")
+    res = get_http_client().post(
+        "graphql_mutation" if is_mutation else "graphql_query",
+        os.environ.get("GRAPHQL_ENDPOINT"),
+        idempotent=not is_mutation,
+        json=query,
+        headers=final_headers,
     )
     res.raise_for_status()
     return res.json()
@@ -321,6 +332,24 @@ def query_user_can_edit_mentor(mentor: str) -> GQLQueryBody:
     return {"query": GQL_QUERY_USER_CAN_EDIT_MENTOR, "variables": {"mentor": mentor}}
 
 
+def user_question_input(
+    mentor: str,
+    question: str,
+    answer_id: str,
+    chat_session_id: str,
+    answer_type: str,
+    confidence: float,
+) -> dict:
+    return {
+        "mentor": mentor,
+        "question": question,
+        "classifierAnswer": answer_id,
+        "classifierAnswerType": answer_type,
+        "confidence": float(confidence),
+        "chatSessionId": chat_session_id,
+    }
+
+
 def mutation_create_user_question(
     mentor: str,
     question: str,
@@ -332,18 +361,29 @@ def mutation_create_user_question(
     return {
         "query": GQL_CREATE_USER_QUESTION,
         "variables": {
-            "userQuestion": {
-                "mentor": mentor,
-                "question": question,
-                "classifierAnswer": answer_id,
-                "classifierAnswerType": answer_type,
-                "confidence": float(confidence),
-                "chatSessionId": chat_session_id,
-            }
+            "userQuestion": user_question_input(
+                mentor, question, answer_id, chat_session_id, answer_type, confidence
+            )
         },
     }
 
 
+def mutation_create_user_questions(user_questions: List[dict]) -> GQLQueryBody:
+    """
+    A single mutation document that creates all the given user questions,
+    using one aliased userQuestionCreate field (q0, q1, ...) per question.
+    """
+    aliases = [f"q{i}" for i in range(len(user_questions))]
+    params = ", ".join(f"${a}: UserQuestionCreateInput!" for a in aliases)
+    fields = "\n".join(
+        f"    {a}: userQuestionCreate(userQuestion: ${a}) {{ _id }}" for a in aliases
+    )
+    return {
+        "query": f"mutation UserQuestionCreateBatch({params}) {{\n{fields}\n}}",
+        "variables": dict(zip(aliases, user_questions)),
+    }
+
+
 def fetch_training_data(mentor: str):
     data = fetch_mentor_data(mentor)
     data_dict = {}
@@ -489,14 +529,61 @@ def create_user_question(
     answer_type: str,
     confidence: float,
 ) -> str:
-    tdjson = __auth_gql(
-        mutation_create_user_question(
+    return create_user_question_from_input(
+        user_question_input(
             mentor, question, answer_id, chat_session_id, answer_type, confidence
         )
     )
+
+
+def create_user_question_from_input(user_question: dict) -> str:
+    tdjson = __auth_gql(
+        {
+            "query": GQL_CREATE_USER_QUESTION,
+            "variables": {"userQuestion": user_question},
+        }
+    )
     if "errors" in tdjson:
         raise Exception(json.dumps(tdjson.get("errors")))
     try:
         return tdjson["data"]["userQuestionCreate"]["_id"]
     except KeyError:
         return "error"
+
+
+def create_user_questions(user_questions: List[dict]) -> List[str]:
+    """
+    Creates many user questions (see user_question_input) with one request.
+    Returns the created ids in the same order, "error" for any not created.
+    """
+    if not user_questions:
+        return []
+    tdjson = __auth_gql(mutation_create_user_questions(user_questions))
+    if "errors" in tdjson:
+        raise Exception(json.dumps(tdjson.get("errors")))
+    return [i or "error" for i in __created_ids(tdjson, len(user_questions))]
+
+
+def create_user_questions_or_none(user_questions: List[dict]) -> List[Optional[str]]:
+    """
+    Like create_user_questions, but a response with errors (some or all of the
+    user questions rejected) doesn't raise: returns None for each user question
+    that was not created. Still raises if the request itself fails.
+    """
+    if not user_questions:
+        return []
+    tdjson = __auth_gql(mutation_create_user_questions(user_questions))
+    if "errors" in tdjson:
+        logging.warning("user questions rejected: %s", json.dumps(tdjson["errors"]))
+    return __created_ids(tdjson, len(user_questions))
+
+
+def __created_ids(tdjson: dict, n: int) -> List[Optional[str]]:
+    data = tdjson.get("data") or {}
+    ids = []
+    for i in range(n):
+        try:
+            ids.append(data[f"q{i}"]["_id"])
+        except (KeyError, TypeError):
+            ids.append(None)
+    return ids
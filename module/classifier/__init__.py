@@ -9,6 +9,23 @@ from dataclasses import dataclass
 from module.mentor import Media
 
 ARCH_LR_TRANSFORMER = "module.classifier.arch.lr_transformer"
+ARCH_KNN_TRANSFORMER = "module.classifier.arch.knn_transformer"
+ARCHS = [ARCH_LR_TRANSFORMER, ARCH_KNN_TRANSFORMER]
+# the file training writes last, whose mtime (or ETag) is the model's version:
+MODEL_FILE_BY_ARCH = {
+    ARCH_LR_TRANSFORMER: "model.pkl",
+    ARCH_KNN_TRANSFORMER: "knn.json",
+}
+
+
+def get_classifier_arch() -> str:
+    """
+    CLASSIFIER_ARCH, the architecture predict loads (default lr_transformer).
+    """
+    arch = os.environ.get("CLASSIFIER_ARCH") or ARCH_LR_TRANSFORMER
+    if arch not in ARCHS:
+        raise ValueError(f"unknown CLASSIFIER_ARCH {arch}")
+    return arch
 
 
 def mentor_model_path(models_path: str, mentor_id: str, arch: str, p: str = "") -> str:
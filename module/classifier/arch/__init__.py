@@ -4,3 +4,23 @@
 # The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
 #
 #
+from typing import List, Tuple
+
+from module.mentor import Mentor
+from module.utils import normalize_strings
+
+
+def mentor_training_data(mentor: Mentor) -> Tuple[List[str], List[str]]:
+    """
+    The sanitized text of every question and paraphrase and its answer id.
+    """
+    x_train = []
+    y_train = []
+    for question in mentor.questions_by_id.values():
+        answer_id = question["answer_id"]
+        x_train.append(question["question_text"])
+        y_train.append(answer_id)
+        for paraphrase in question["paraphrases"]:
+            x_train.append(paraphrase)
+            y_train.append(answer_id)
+    return normalize_strings(x_train), y_train
@@ -0,0 +1,101 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+import os
+from typing import Dict, Union
+
+import numpy
+
+from module.api import update_training
+from module.classifier import ARCH_KNN_TRANSFORMER, mentor_model_path
+from module.classifier.arch import mentor_training_data
+from module.classifier.arch.lr_transformer.embeddings import TransformerEmbeddings
+from module.classifier.arch.lr_transformer.train import (
+    QuestionClassifierTrainingResult,
+)
+from module.classifier.knn import (
+    KNN_EMBEDDINGS_FILE,
+    KNN_INDEX_FILE,
+    KNN_IVF_FILE,
+    append_knn_index,
+    knn_row_key,
+    knn_rows_to_add,
+    load_knn_scorer,
+    normalize_rows,
+    save_knn_index,
+)
+from module.logger import get_logger
+from module.mentor import MENTOR_BUNDLE, Mentor, save_mentor_bundle
+from module.utils import file_hash
+
+log = get_logger("train-knn")
+
+
+class KnnQuestionClassifierTraining:
+    """
+    "Trains" a nearest neighbor classifier: stores the normalized embedding
+    of every question and paraphrase with its answer id (see module.classifier.knn).
+    If the previous index is in the output dir (trainjob downloads it),
+    new questions and paraphrases are appended to it instead of encoding
+    every row again.
+    """
+
+    # in the order they are uploaded, the index last;
+    # the ivf file is only written for large mentors (KNN_IVF_MIN_ROWS)
+    MODEL_FILES = [MENTOR_BUNDLE, KNN_EMBEDDINGS_FILE, KNN_IVF_FILE, KNN_INDEX_FILE]
+    # the files of the previous index, which training appends to
+    PREVIOUS_MODEL_FILES = [KNN_EMBEDDINGS_FILE, KNN_IVF_FILE, KNN_INDEX_FILE]
+
+    def __init__(
+        self,
+        mentor: Union[str, Mentor],
+        shared_root: str = "shared",
+        output_dir: str = "out",
+        auth_headers: Dict[str, str] = {},
+    ):
+        if isinstance(mentor, str):
+            log.info("loading mentor id {}...".format(mentor))
+            mentor = Mentor(mentor, auth_headers)
+        self.mentor = mentor
+        self.model_path = mentor_model_path(output_dir, mentor.id, ARCH_KNN_TRANSFORMER)
+        self.transformer = TransformerEmbeddings(shared_root)
+
+    def train(self) -> QuestionClassifierTrainingResult:
+        x_train, y_train = mentor_training_data(self.mentor)
+        keys = [knn_row_key(x) for x in x_train]
+        update_training(self.mentor.id)
+        os.makedirs(self.model_path, exist_ok=True)
+        added = knn_rows_to_add(self.model_path, keys, y_train)
+        ivf_recall = None
+        if added is None:
+            embeddings = normalize_rows(self.transformer.get_embeddings(x_train))
+            ivf_recall = save_knn_index(self.model_path, embeddings, y_train, keys)
+        elif added:
+            append_knn_index(
+                self.model_path,
+                self.transformer.get_embeddings([x_train[i] for i in added]),
+                [y_train[i] for i in added],
+                [keys[i] for i in added],
+            )
+        if added is not None:
+            log.info(f"appended {len(added)} rows to the index")
+        # the accuracy of exact search over the rows of the index
+        scorer = load_knn_scorer(self.model_path)
+        scorer.ivf = None
+        class_indices, _ = scorer.score(scorer.embeddings)
+        training_accuracy = float(numpy.mean(class_indices == scorer.label_indices))
+        save_mentor_bundle(
+            os.path.join(self.model_path, MENTOR_BUNDLE),
+            self.mentor,
+            file_hash(os.path.join(self.model_path, KNN_INDEX_FILE)),
+        )
+        if ivf_recall is not None:
+            log.info(
+                f"built ivf index of {len(y_train)} rows, recall@1 {ivf_recall:.3f}"
+            )
+        return QuestionClassifierTrainingResult(
+            None, training_accuracy, self.model_path
+        )
@@ -16,6 +16,6 @@ class TransformerEmbeddings:
             path.join(shared_root, "sentence-transformer")
         )
 
-    def get_embeddings(self, data: List[str]):
-        embeddings = self.transformer.encode(data, show_progress_bar=True)
+    def get_embeddings(self, data: List[str], show_progress_bar: bool = True):
+        embeddings = self.transformer.encode(data, show_progress_bar=show_progress_bar)
         return embeddings
@@ -5,6 +5,7 @@
 #
 #
 import os
+from os import environ
 
 import joblib
 import numpy as np
@@ -17,13 +18,16 @@ from module.classifier import (
     mentor_model_path,
     ARCH_LR_TRANSFORMER,
 )
-from module.mentor import Mentor
+from module.classifier.model_artifact import save_scorer
+from module.classifier.scorer import LinearScorer, PRECISION_FLOAT32
+from module.mentor import MENTOR_BUNDLE, Mentor, save_mentor_bundle
 from .embeddings import TransformerEmbeddings
 from module.api import update_training
-from module.utils import sanitize_string
+from module.classifier.arch import mentor_training_data
 from typing import Union, Tuple, List, Dict
 from dataclasses import dataclass
 from module.logger import get_logger
+from module.utils import file_hash
 
 log = get_logger("train")
 
@@ -36,6 +40,11 @@ class QuestionClassifierTrainingResult:
 
 
 class TransformersQuestionClassifierTraining:
+    # in the order they are uploaded, model.pkl last
+    MODEL_FILES = ["model.bin", MENTOR_BUNDLE, "model.pkl"]
+    # the files of the previous model training builds on (none, it retrains)
+    PREVIOUS_MODEL_FILES: List[str] = []
+
     def __init__(
         self,
         mentor: Union[str, Mentor],
@@ -72,7 +81,25 @@ class TransformersQuestionClassifierTraining:
         # )
         update_training(self.mentor.id)
         os.makedirs(self.model_path, exist_ok=True)
-        joblib.dump(classifier, os.path.join(self.model_path, "model.pkl"))
+        model_file = os.path.join(self.model_path, "model.pkl")
+        joblib.dump(classifier, model_file)
+        # files predict uses only if they were trained along with model.pkl
+        model_hash = file_hash(model_file)
+        # compact, memory-mappable copy of the weights, preferred by predict:
+        save_scorer(
+            os.path.join(self.model_path, "model.bin"),
+            self.reduce_precision(
+                LinearScorer.from_model(classifier),
+                x_train,
+                environ.get("MODEL_WEIGHTS_PRECISION", PRECISION_FLOAT32),
+                float(environ.get("MODEL_PRECISION_MIN_AGREEMENT", "0.99")),
+            ),
+            model_hash,
+        )
+        # the mentor data predict needs, so it doesn't have to query graphql:
+        save_mentor_bundle(
+            os.path.join(self.model_path, MENTOR_BUNDLE), self.mentor, model_hash
+        )
         # this is identical to all the models and is kept in the shared folder:
         # joblib.dump(self.transformer, os.path.join(self.model_path, "transformer.pkl"))
         return QuestionClassifierTrainingResult(
@@ -80,20 +107,7 @@ class TransformersQuestionClassifierTraining:
         )
 
     def __load_training_data(self) -> Tuple[List[str], List[str]]:
-        x_train = []
-        y_train = []
-        for key in self.mentor.questions_by_id:
-            question = self.mentor.questions_by_id[key]
-            current_question = sanitize_string(question["question_text"])
-            answer_id = question["answer_id"]
-            x_train.append(current_question)  # Add current question to training sample.
-            y_train.append(answer_id)
-            for paraphrase in question[
-                "paraphrases"
-            ]:  # Add paraphrases to training sample.
-                x_train.append(sanitize_string(paraphrase))
-                y_train.append(answer_id)
-        return x_train, y_train
+        return mentor_training_data(self.mentor)
 
     def __load_transformer_embeddings(
         self, x_train: List[str], y_train: List[str]
@@ -122,6 +136,28 @@ class TransformersQuestionClassifierTraining:
         classifier.fit(x_train, y_train)
         return classifier
 
+    @staticmethod
+    def reduce_precision(
+        scorer: LinearScorer, x_train: np.ndarray, precision: str, min_agreement: float
+    ) -> LinearScorer:
+        """
+        Returns the scorer with weights in the given precision if its top-1
+        predictions on the training set agree with full precision at least
+        min_agreement of the time, otherwise the full precision scorer.
+        """
+        if precision == PRECISION_FLOAT32:
+            return scorer
+        reduced = scorer.with_precision(precision)
+        agreement = scorer.agreement(reduced, x_train)
+        if agreement < min_agreement:
+            log.warning(
+                f"{precision} weights agree with {PRECISION_FLOAT32} on {agreement:.4f} "
+                f"of the training set (min {min_agreement}), keeping {PRECISION_FLOAT32}"
+            )
+            return scorer
+        log.info(f"{precision} weights agreement on training set: {agreement:.4f}")
+        return reduced
+
     @staticmethod
     def calculate_accuracy(predictions: List[str], labels: List[str]) -> float:
         return accuracy_score(labels, predictions)
@@ -4,33 +4,174 @@
 # The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
 #
 #
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
 from os import environ
-from typing import Dict
-import pylru
+from typing import Dict, Optional, Union
+from module.classifier import get_classifier_arch
 from .predict import TransformersQuestionClassifierPrediction
 
 
 class Entry:
-    def __init__(self, classifier: TransformersQuestionClassifierPrediction):
+    def __init__(
+        self,
+        classifier: TransformersQuestionClassifierPrediction,
+        version: Union[str, float],
+    ):
         self.classifier = classifier
-        self.last_trained_at = self.classifier.get_last_trained_at()
+        self.version = version
+        self.nbytes = classifier.estimate_nbytes()
 
 
 class Dao:
-    def __init__(self, shared_root: str, data_root: str):
+    """
+    LRU cache of classifiers by mentor id, bounded by the estimated bytes
+    of the cached classifiers (CACHE_MAX_BYTES) and their number (CACHE_MAX_SIZE).
+
+    A cached classifier is reloaded when its model changes:
+    the step that downloads models calls set_model_version with a token
+    (e.g. the s3 ETag), so cache hits don't touch the filesystem.
+    Mentors without a version token fall back to the model file mtime.
+
+    Concurrent loads of the same mentor are coalesced: one caller loads
+    the classifier and the others wait for (and share) its result or error.
+    If a changed model fails to load with a ValueError (e.g. only some of
+    its files were fetched yet), the cached classifier keeps being served
+    and the load is retried on the next call.
+    """
+
+    def __init__(
+        self,
+        shared_root: str,
+        data_root: str,
+        max_bytes: Optional[int] = None,
+        max_size: Optional[int] = None,
+        arch: Optional[str] = None,
+    ):
         self.shared_root = shared_root
         self.data_root = data_root
-        self.cache = pylru.lrucache(int(environ.get("CACHE_MAX_SIZE", "1000")))
+        # architecture of the models in data_root, CLASSIFIER_ARCH by default
+        self.arch = arch or get_classifier_arch()
+        self.max_bytes = (
+            max_bytes
+            if max_bytes is not None
+            else int(environ.get("CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+        )
+        self.max_size = (
+            max_size
+            if max_size is not None
+            else int(environ.get("CACHE_MAX_SIZE", "1000"))
+        )
+        self.cache: "OrderedDict[str, Entry]" = OrderedDict()
+        self.versions: Dict[str, str] = {}
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self.stale = 0
+        self.loading: Dict[str, Future] = {}
+
+    def set_model_version(self, mentor_id: str, version: Optional[str]):
+        with self.lock:
+            if version is None:
+                self.versions.pop(mentor_id, None)
+            else:
+                self.versions[mentor_id] = version
 
     def find_classifier(
         self, mentor_id: str, auth_headers: Dict[str, str] = {}
     ) -> TransformersQuestionClassifierPrediction:
-        if mentor_id in self.cache:
-            e = self.cache[mentor_id]
-            if e and e.last_trained_at >= e.classifier.get_last_trained_at():
+        with self.lock:
+            e = self.cache.get(mentor_id)
+            version = self.versions.get(mentor_id)
+            if e is not None:
+                if version is not None and e.version == version:
+                    self.cache.move_to_end(mentor_id)
+                    self.hits += 1
+                    return e.classifier
+        if e is not None and version is None and not isinstance(e.version, str):
+            # no version token, compare the model file's mtime
+            if e.version >= e.classifier.get_last_trained_at():
+                with self.lock:
+                    self.hits += 1
                 return e.classifier
-        c = TransformersQuestionClassifierPrediction(
-            mentor_id, self.data_root, auth_headers
-        )
-        self.cache[mentor_id] = Entry(c)
-        return c
+        with self.lock:
+            future = self.loading.get(mentor_id)
+            if future is not None:
+                self.coalesced += 1
+                loader = False
+            else:
+                future = self.loading[mentor_id] = Future()
+                loader = True
+        if not loader:
+            return future.result()
+        try:
+            c = TransformersQuestionClassifierPrediction(
+                mentor_id,
+                self.data_root,
+                auth_headers,
+                self.shared_root,
+                previous_mentor=e.classifier.mentor if e is not None else None,
+                arch=self.arch,
+            )
+            entry = Entry(
+                c, version if version is not None else c.get_last_trained_at()
+            )
+            with self.lock:
+                self.misses += 1
+                if e is not None:
+                    self.reloads += 1
+                self.__put(mentor_id, entry)
+            future.set_result(c)
+            return c
+        except ValueError as err:
+            if e is None:
+                future.set_exception(err)
+                raise
+            logging.warning(
+                "failed to reload classifier for mentor {}, serving the cached one: {}".format(
+                    mentor_id, err
+                )
+            )
+            with self.lock:
+                self.stale += 1
+            future.set_result(e.classifier)
+            return e.classifier
+        except BaseException as err:
+            future.set_exception(err)
+            raise
+        finally:
+            with self.lock:
+                del self.loading[mentor_id]
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "entries": len(self.cache),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+                "coalesced": self.coalesced,
+                "stale": self.stale,
+            }
+
+    def __put(self, mentor_id: str, entry: Entry):
+        if mentor_id in self.cache:
+            self.bytes -= self.cache.pop(mentor_id).nbytes
+        if entry.nbytes > self.max_bytes:
+            # still returned to the caller, just not cached
+            return
+        self.cache[mentor_id] = entry
+        self.bytes += entry.nbytes
+        while self.bytes > self.max_bytes or len(self.cache) > self.max_size:
+            _, evicted = self.cache.popitem(last=False)
+            self.bytes -= evicted.nbytes
+            self.evictions += 1
@@ -0,0 +1,91 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+import numpy
+
+
+class EmbeddingCache:
+    """
+    LRU cache of question embeddings with a time to live,
+    bounded by the total bytes of the cached embeddings (and keys).
+    Embeddings are stored as read-only float32 arrays.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float = 3600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[numpy.ndarray]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            embedding, expires, size = entry
+            if expires < time.time():
+                self.__remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def set(self, key: Hashable, embedding) -> numpy.ndarray:
+        embedding = numpy.array(embedding, dtype=numpy.float32)
+        embedding.setflags(write=False)
+        size = embedding.nbytes + _key_size(key)
+        if size > self.max_bytes:
+            return embedding
+        with self.lock:
+            if key in self.entries:
+                self.__remove(key)
+            self.entries[key] = (embedding, time.time() + self.ttl, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self.__remove(next(iter(self.entries)))
+                self.evictions += 1
+        return embedding
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def __remove(self, key: Hashable):
+        _, _, size = self.entries.pop(key)
+        self.bytes -= size
+
+
+def _key_size(key: Hashable) -> int:
+    if isinstance(key, tuple):
+        return sum(len(str(k)) for k in key)
+    return len(str(key))
@@ -0,0 +1,197 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+import fcntl
+import hashlib
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import numpy
+
+MAGIC = 0x31424D45  # "EMB1"
+# header fields (int64): magic, embedding size, capacity (rows), rows written so far
+_MAGIC, _DIM, _CAPACITY, _COUNT = range(4)
+
+
+def text_key(text: str) -> int:
+    """
+    64 bit hash of the text, 0 is reserved for empty rows.
+    """
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1
+
+
+class EmbeddingStore:
+    """
+    Append-only on-disk embedding store meant for /tmp,
+    which (unlike process memory) survives across warm lambda invocations.
+
+    Files in directory:
+        header.i64   magic, embedding size, capacity and number of rows written
+        keys.u64     text_key of the text embedded in each row (the hash index)
+        vectors.f32  fixed width float32 matrix (capacity x embedding size)
+
+    All files are opened with numpy.memmap. Rows are written as a ring:
+    once capacity rows have been written the oldest row is overwritten,
+    which bounds disk usage. Writers (threads and processes sharing the
+    directory) serialize on an flock; readers don't lock, instead they
+    re-check a row's key after copying it, as writers clear the key before
+    overwriting a row.
+    """
+
+    def __init__(self, directory: str, capacity: int):
+        self.directory = directory
+        self.capacity = capacity
+        self.header = None
+        self.keys = None
+        self.vectors = None
+        self.rows: Dict[int, int] = {}  # text_key => row
+        self.indexed_count = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def get(self, text: str) -> Optional[numpy.ndarray]:
+        key = text_key(text)
+        with self.lock:
+            if not self.__open():
+                self.misses += 1
+                return None
+            self.__refresh_index()
+            row = self.rows.get(key)
+            if row is not None and self.keys[row] == key:
+                embedding = numpy.array(self.vectors[row])
+                if self.keys[row] == key:
+                    self.hits += 1
+                    return embedding
+            if row is not None:
+                del self.rows[key]  # row has been overwritten since
+            self.misses += 1
+            return None
+
+    def set(self, text: str, embedding) -> None:
+        key = text_key(text)
+        embedding = numpy.asarray(embedding, dtype=numpy.float32).ravel()
+        with self.lock:
+            try:
+                if not self.__open(len(embedding)):
+                    return
+                with self.__file_lock():
+                    self.__refresh_index()
+                    row = self.rows.get(key)
+                    if row is not None and self.keys[row] == key:
+                        return  # written by another process meanwhile
+                    count = int(self.header[_COUNT])
+                    row = count % self.capacity
+                    self.keys[row] = 0
+                    self.vectors[row] = embedding
+                    self.keys[row] = key
+                    self.header[_COUNT] = count + 1
+                    self.writes += 1
+            except OSError as e:
+                logging.warning("failed to write embedding store: %s", e)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "rows": min(self.indexed_count, self.capacity),
+            "capacity": self.capacity,
+        }
+
+    def __open(self, dim: int = 0) -> bool:
+        """
+        Maps the store files, creating them if needed (and dim is known).
+        """
+        if self.header is not None and (not dim or int(self.header[_DIM]) == dim):
+            return True
+        if not self.__map() or (dim and int(self.header[_DIM]) != dim):
+            if not dim:
+                return False
+            with self.__file_lock():
+                if not self.__map() or int(self.header[_DIM]) != dim:
+                    self.__create(dim)
+        return True
+
+    def __map(self) -> bool:
+        try:
+            header = numpy.memmap(self.__path("header.i64"), numpy.int64, "r+")
+            if (
+                len(header) != 4
+                or header[_MAGIC] != MAGIC
+                or header[_CAPACITY] != self.capacity
+            ):
+                return False
+            dim = int(header[_DIM])
+            self.keys = numpy.memmap(self.__path("keys.u64"), numpy.uint64, "r+")
+            self.vectors = numpy.memmap(
+                self.__path("vectors.f32"),
+                numpy.float32,
+                "r+",
+                shape=(self.capacity, dim),
+            )
+            self.header = header
+            self.rows = {}
+            self.indexed_count = 0
+            return True
+        except (OSError, ValueError):
+            self.header = None
+            return False
+
+    def __create(self, dim: int):
+        # new files are swapped in with os.replace, so other processes
+        # never see (or have mapped) a partially created file.
+        # The header goes last: a store without a valid header is ignored.
+        for name, dtype, shape, values in [
+            ("keys.u64", numpy.uint64, (self.capacity,), None),
+            ("vectors.f32", numpy.float32, (self.capacity, dim), None),
+            ("header.i64", numpy.int64, (4,), [MAGIC, dim, self.capacity, 0]),
+        ]:
+            tmp_path = self.__path(f".{name}.{os.getpid()}.tmp")
+            m = numpy.memmap(tmp_path, dtype, "w+", shape=shape)
+            if values is not None:
+                m[:] = values
+            m.flush()
+            del m
+            os.replace(tmp_path, self.__path(name))
+        self.__map()
+
+    def __refresh_index(self):
+        count = int(self.header[_COUNT])
+        if count == self.indexed_count:
+            return
+        if (
+            count < self.indexed_count
+            or count - self.indexed_count >= self.capacity
+            or len(self.rows) > 2 * self.capacity
+        ):
+            keys = numpy.array(self.keys)
+            self.rows = {int(k): row for row, k in enumerate(keys) if k}
+        else:
+            for n in range(self.indexed_count, count):
+                row = n % self.capacity
+                key = int(self.keys[row])
+                if key:
+                    self.rows[key] = row
+        self.indexed_count = count
+
+    def __path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @contextmanager
+    def __file_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.__path(".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
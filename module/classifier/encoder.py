@@ -0,0 +1,200 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from os import environ, path
+from timeit import default_timer as timer
+from datetime import timedelta
+from typing import Dict, List, Union
+
+import numpy
+
+from module.api import sbert_encode
+from module.utils import normalize_strings, sanitize_string, use_local_encoder
+from .embedding_cache import EmbeddingCache
+from .embedding_store import EmbeddingStore, text_key
+
+
+class RemoteQuestionEncoder:
+    """
+    Encodes questions with the shared SBERT service (SBERT_ENDPOINT/encode).
+    """
+
+    def __init__(self):
+        self.name = f"remote:{environ.get('SBERT_ENDPOINT')}"
+
+    def encode(self, question: str) -> numpy.ndarray:
+        encoding_json = sbert_encode(question)
+        return numpy.array(encoding_json["encoding"])
+
+    def encode_batch(self, questions: List[str]) -> numpy.ndarray:
+        """
+        The SBERT service encodes one query per request,
+        so the requests are sent concurrently and cost about one round trip.
+        """
+        if len(questions) <= 1:
+            return numpy.array([self.encode(q) for q in questions])
+        workers = min(len(questions), int(environ.get("SBERT_ENCODE_WORKERS", "8")))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return numpy.array(list(executor.map(self.encode, questions)))
+
+
+class LocalQuestionEncoder:
+    """
+    Encodes questions in process with the same (quantized) sentence transformer
+    that TransformersQuestionClassifierTraining uses to embed training data.
+    Questions are sanitized like the training data (mentor_training_data),
+    so predict sees exactly the embeddings the classifier was trained on.
+    """
+
+    def __init__(self, shared_root: str):
+        # sentence_transformers/torch are not part of the predict image by default,
+        # so only import them when local encoding is actually requested
+        from module.classifier.arch.lr_transformer.embeddings import (
+            TransformerEmbeddings,
+        )
+
+        self.name = f"local:{path.abspath(shared_root)}"
+        self.embeddings = TransformerEmbeddings(shared_root)
+
+    def encode(self, question: str) -> numpy.ndarray:
+        start = timer()
+        embedding = self.embeddings.get_embeddings(
+            [sanitize_string(question)], show_progress_bar=False
+        )
+        end = timer()
+        logging.info("local encode execution time: %s", timedelta(seconds=end - start))
+        return numpy.array(embedding[0])
+
+    def encode_batch(self, questions: List[str]) -> numpy.ndarray:
+        return numpy.array(
+            self.embeddings.get_embeddings(
+                normalize_strings(questions), show_progress_bar=False
+            )
+        )
+
+
+class CachedQuestionEncoder:
+    """
+    Looks up embeddings in a process wide EmbeddingCache before encoding.
+    Entries are keyed by the encoder identity and the question as it is encoded
+    (an encoder may not sanitize it), so they are shared by the classifiers
+    of all mentors.
+    """
+
+    def __init__(self, encoder, cache: EmbeddingCache):
+        self.encoder = encoder
+        self.cache = cache
+        self.name = encoder.name
+
+    def encode(self, question: str) -> numpy.ndarray:
+        key = (self.name, question)
+        embedding = self.cache.get(key)
+        if embedding is None:
+            embedding = self.cache.set(key, self.encoder.encode(question))
+        return embedding
+
+    def encode_batch(self, questions: List[str]) -> numpy.ndarray:
+        keys = [(self.name, question) for question in questions]
+        embeddings = {k: self.cache.get(k) for k in keys}
+        missing = {}  # key => first question with that key
+        for key, question in zip(keys, questions):
+            if embeddings[key] is None and key not in missing:
+                missing[key] = question
+        if missing:
+            encoded = self.encoder.encode_batch(list(missing.values()))
+            for key, embedding in zip(missing, encoded):
+                embeddings[key] = self.cache.set(key, embedding)
+        return numpy.array([embeddings[k] for k in keys])
+
+
+class StoredQuestionEncoder:
+    """
+    Looks up embeddings in an on-disk EmbeddingStore (in /tmp) before encoding,
+    so they survive the python process being recycled in a warm container.
+    Keyed by the question as it is encoded, like CachedQuestionEncoder.
+    """
+
+    def __init__(self, encoder, store: EmbeddingStore):
+        self.encoder = encoder
+        self.store = store
+        self.name = encoder.name
+
+    def encode(self, question: str) -> numpy.ndarray:
+        embedding = self.store.get(question)
+        if embedding is None:
+            embedding = self.encoder.encode(question)
+            self.store.set(question, embedding)
+        return embedding
+
+    def encode_batch(self, questions: List[str]) -> numpy.ndarray:
+        embeddings = [self.store.get(q) for q in questions]
+        missing = [i for i, e in enumerate(embeddings) if e is None]
+        if missing:
+            encoded = self.encoder.encode_batch([questions[i] for i in missing])
+            for i, embedding in zip(missing, encoded):
+                embeddings[i] = embedding
+                self.store.set(questions[i], embedding)
+        return numpy.array(embeddings)
+
+
+QuestionEncoder = Union[
+    RemoteQuestionEncoder,
+    LocalQuestionEncoder,
+    CachedQuestionEncoder,
+    StoredQuestionEncoder,
+]
+
+QUESTION_ENCODERS: Dict[str, QuestionEncoder] = {}
+# classifiers may be loaded concurrently (e.g. by the warm up)
+QUESTION_ENCODERS_LOCK = threading.Lock()
+
+EMBEDDING_CACHE = EmbeddingCache(
+    int(environ.get("EMBEDDING_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    float(environ.get("EMBEDDING_CACHE_TTL_SEC", "3600")),
+)
+
+
+def find_or_load_question_encoder(shared_root: str) -> QuestionEncoder:
+    """
+    Returns the encoder configured by LOCAL_ENCODER, loading it once per process.
+    Falls back to the remote SBERT service when the local model can't be loaded.
+    Unless EMBEDDING_CACHE_MAX_BYTES=0, the encoder is wrapped with EMBEDDING_CACHE,
+    and with an on-disk EmbeddingStore if EMBEDDING_STORE_DIR is set.
+    """
+    key = path.abspath(shared_root) if use_local_encoder() else "remote"
+    with QUESTION_ENCODERS_LOCK:
+        if key not in QUESTION_ENCODERS:
+            encoder = __load_question_encoder(shared_root)
+            store_dir = environ.get("EMBEDDING_STORE_DIR")
+            if store_dir:
+                encoder = StoredQuestionEncoder(
+                    encoder,
+                    EmbeddingStore(
+                        # one store per encoder, embeddings of encoders aren't compatible
+                        path.join(store_dir, f"{text_key(encoder.name):016x}"),
+                        int(environ.get("EMBEDDING_STORE_MAX_ROWS", "20000")),
+                    ),
+                )
+            if EMBEDDING_CACHE.max_bytes > 0:
+                encoder = CachedQuestionEncoder(encoder, EMBEDDING_CACHE)
+            QUESTION_ENCODERS[key] = encoder
+        return QUESTION_ENCODERS[key]
+
+
+def __load_question_encoder(shared_root: str) -> QuestionEncoder:
+    if use_local_encoder():
+        try:
+            return LocalQuestionEncoder(shared_root)
+        except Exception as e:
+            logging.warning(
+                "failed to load local encoder from %s, falling back to remote: %s",
+                shared_root,
+                e,
+            )
+    return RemoteQuestionEncoder()
@@ -0,0 +1,169 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+import botocore
+
+from module.logger import get_logger
+
+log = get_logger("freshness")
+
+ETAG_SUFFIX = ".etag"
+
+
+class ModelFreshnessChecker:
+    """
+    Keeps model files in a local directory (e.g. /tmp/models) in sync with s3.
+
+    A file is re-checked at most once every `interval` seconds, whether it was
+    found in s3 or not, so most requests don't make an s3 round trip
+    (or touch the file system) at all: a model may be served up to `interval`
+    seconds stale, and a new model may take as long to be found.
+    Checks compare the s3 ETag (IfNoneMatch) rather than the file mtime;
+    the ETag of each downloaded file is also kept next to it,
+    so a fresh process with a warm /tmp can still make conditional requests.
+    """
+
+    def __init__(self, s3, bucket: str, local_root: str, interval: float = 10):
+        self.s3 = s3
+        self.bucket = bucket
+        self.local_root = local_root
+        self.interval = interval
+        self.etags: Dict[str, Optional[str]] = {}
+        # whether the local copy exists, as of the last check
+        self.exists: Dict[str, bool] = {}
+        self.checked_at: Dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.skipped = 0
+        self.not_modified = 0
+        self.downloads = 0
+        self.not_found = 0
+
+    def local_path(self, relative_path: str) -> str:
+        return os.path.join(self.local_root, relative_path)
+
+    def etag(self, relative_path: str) -> Optional[str]:
+        """
+        The ETag of the local copy of the file, if known.
+        """
+        with self.lock:
+            if relative_path in self.etags:
+                return self.etags[relative_path]
+        try:
+            with open(self.local_path(relative_path) + ETAG_SUFFIX) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def fetch(self, relative_path: str, force: bool = False) -> bool:
+        """
+        Makes sure the local copy of the file is up to date
+        (within `interval`, or now if force). Returns False if the file is not in s3.
+        """
+        local_file = self.local_path(relative_path)
+        with self.lock:
+            checked_at = self.checked_at.get(relative_path)
+            if (
+                not force
+                and checked_at is not None
+                and time.monotonic() - checked_at < self.interval
+            ):
+                self.skipped += 1
+                return self.exists[relative_path]
+            exists = self.exists.get(relative_path)
+        if exists is None:
+            exists = os.path.exists(local_file)
+        etag = self.etag(relative_path) if exists else None
+        conditions = {}
+        if etag:
+            conditions["IfNoneMatch"] = etag
+        elif exists:
+            conditions["IfModifiedSince"] = datetime.utcfromtimestamp(
+                os.path.getmtime(local_file)
+            )
+        try:
+            r = self.s3.get_object(Bucket=self.bucket, Key=relative_path, **conditions)
+        except botocore.exceptions.ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code == "304":
+                log.debug(f"{relative_path} not updated in s3 since last fetch")
+                headers = e.response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+                self.__checked(relative_path, etag or headers.get("etag"))
+                with self.lock:
+                    self.not_modified += 1
+                return True
+            if code in ["404", "NoSuchKey"]:
+                log.debug(f"{relative_path} not found in s3")
+                self.__remove(relative_path)
+                with self.lock:
+                    self.not_found += 1
+                return False
+            log.error(e)
+            raise e
+        self.__write(local_file, r)
+        self.__checked(relative_path, r.get("ETag"))
+        with self.lock:
+            self.downloads += 1
+        log.debug(f"{relative_path} downloaded (version {r.get('VersionId')})")
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "files": sum(self.exists.values()),
+                "skipped": self.skipped,
+                "not_modified": self.not_modified,
+                "downloads": self.downloads,
+                "not_found": self.not_found,
+            }
+
+    def __checked(self, relative_path: str, etag: Optional[str]):
+        with self.lock:
+            self.etags[relative_path] = etag
+            self.exists[relative_path] = True
+            self.checked_at[relative_path] = time.monotonic()
+
+    def __remove(self, relative_path: str):
+        """
+        Removes the local copy, and remembers the file is absent
+        (so it is only re-checked after `interval`, like a present file).
+        """
+        with self.lock:
+            self.etags[relative_path] = None
+            self.exists[relative_path] = False
+            self.checked_at[relative_path] = time.monotonic()
+        for f in [
+            self.local_path(relative_path),
+            self.local_path(relative_path) + ETAG_SUFFIX,
+        ]:
+            try:
+                os.remove(f)
+            except FileNotFoundError:
+                pass
+
+    def __write(self, local_file: str, r: dict):
+        """
+        Writes to a temp file first, so readers never see a partial model.
+        """
+        directory = os.path.dirname(local_file)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in r["Body"].iter_chunks(chunk_size=64 * 1024):
+                    f.write(chunk)
+            os.replace(tmp_path, local_file)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        with open(local_file + ETAG_SUFFIX, "w") as f:
+            f.write(r.get("ETag") or "")
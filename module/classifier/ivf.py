@@ -0,0 +1,169 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+import math
+from os import environ
+from typing import Tuple
+
+import numpy
+
+
+def get_ivf_min_rows() -> int:
+    """
+    Nearest neighbor indexes with at least this many rows get (and use) an IVF index.
+    """
+    return int(environ.get("KNN_IVF_MIN_ROWS", "20000"))
+
+
+def get_ivf_probes() -> int:
+    return int(environ.get("KNN_IVF_PROBES", "8"))
+
+
+def top_k(similarities: numpy.ndarray, k: int) -> numpy.ndarray:
+    """
+    Column indices of the k highest similarities of each row (in no particular order).
+    """
+    if k < similarities.shape[1]:
+        return numpy.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    return numpy.broadcast_to(numpy.arange(similarities.shape[1]), similarities.shape)
+
+
+def exact_search(
+    embeddings, queries: numpy.ndarray, k: int
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Returns (row ids, similarities) of the k rows most similar to each query.
+    """
+    similarities = queries @ embeddings.T
+    ids = top_k(similarities, k)
+    return ids, similarities[numpy.arange(len(queries))[:, numpy.newaxis], ids]
+
+
+class IvfIndex:
+    """
+    Inverted file index over the rows of an embeddings matrix whose rows are
+    ordered by list: list i holds rows offsets[i] to offsets[i + 1].
+    A query scans the n_probe lists whose centroids are most similar to it
+    (more if they have fewer than k rows) instead of every row.
+    Rows past offsets[-1] (appended after the index was built) are in no list
+    and always scanned.
+    """
+
+    def __init__(self, embeddings, centroids, offsets, n_probe: int = 8):
+        self.embeddings = embeddings
+        self.centroids = numpy.asarray(centroids, dtype=numpy.float32)
+        self.offsets = numpy.asarray(offsets, dtype=numpy.int64)
+        self.n_probe = max(1, n_probe)
+
+    def search(
+        self, queries: numpy.ndarray, k: int
+    ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Returns (row ids, similarities) of (approximately) the k rows
+        most similar to each query. k must not exceed the number of rows.
+        """
+        n_rows = len(self.embeddings)
+        indexed_rows = int(self.offsets[-1])
+        ids = numpy.empty((len(queries), k), dtype=numpy.int64)
+        similarities = numpy.empty((len(queries), k), dtype=numpy.float32)
+        probes = numpy.argsort(-(queries @ self.centroids.T), axis=1)
+        for i, (query, lists) in enumerate(zip(queries, probes)):
+            ranges = [(indexed_rows, n_rows)] if n_rows > indexed_rows else []
+            n_candidates = n_rows - indexed_rows
+            for probed, list_index in enumerate(lists):
+                if probed >= self.n_probe and n_candidates >= k:
+                    break
+                start = int(self.offsets[list_index])
+                end = int(self.offsets[list_index + 1])
+                if end > start:
+                    ranges.append((start, end))
+                    n_candidates += end - start
+            candidate_ids = numpy.concatenate([numpy.arange(s, e) for s, e in ranges])
+            candidate_similarities = numpy.concatenate(
+                [self.embeddings[s:e] @ query for s, e in ranges]
+            )
+            top = top_k(candidate_similarities[numpy.newaxis], k)[0]
+            ids[i] = candidate_ids[top]
+            similarities[i] = candidate_similarities[top]
+        return ids, similarities
+
+
+def train_centroids(
+    embeddings: numpy.ndarray, n_lists: int, iterations: int = 10, seed: int = 0
+) -> numpy.ndarray:
+    """
+    Spherical k-means (on a sample of at most 64 rows per list)
+    of normalized embeddings. Returns normalized centroids.
+    """
+    rng = numpy.random.default_rng(seed)
+    n_sample = min(len(embeddings), 64 * n_lists)
+    sample = numpy.asarray(
+        embeddings[numpy.sort(rng.choice(len(embeddings), n_sample, replace=False))]
+    )
+    centroids = sample[rng.choice(n_sample, n_lists, replace=False)]
+    for _ in range(iterations):
+        assignments = (sample @ centroids.T).argmax(axis=1)
+        sums = numpy.zeros_like(centroids)
+        numpy.add.at(sums, assignments, sample)
+        norms = numpy.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        # restart empty lists from random rows
+        sums[empty] = sample[rng.choice(n_sample, int(empty.sum()))]
+        norms[empty] = 1
+        centroids = sums / norms
+    return centroids.astype(numpy.float32)
+
+
+def assign_lists(
+    embeddings, centroids: numpy.ndarray, batch_size: int = 4096
+) -> numpy.ndarray:
+    lists = []
+    for start in range(0, len(embeddings), batch_size):
+        end = start + batch_size
+        lists.append((embeddings[start:end] @ centroids.T).argmax(axis=1))
+    return numpy.concatenate(lists)
+
+
+def build_ivf(
+    embeddings: numpy.ndarray, n_lists: int = 0
+) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """
+    Clusters normalized embeddings into n_lists lists (KNN_IVF_LISTS,
+    by default the square root of the number of rows).
+    Returns (centroids, the order of the rows by list, offsets of the lists).
+    """
+    n_lists = n_lists or int(environ.get("KNN_IVF_LISTS", "0"))
+    n_lists = min(len(embeddings), n_lists or max(1, round(math.sqrt(len(embeddings)))))
+    centroids = train_centroids(embeddings, n_lists)
+    lists = assign_lists(embeddings, centroids)
+    order = numpy.argsort(lists, kind="stable")
+    offsets = numpy.concatenate(
+        [[0], numpy.cumsum(numpy.bincount(lists, minlength=n_lists))]
+    )
+    return centroids, order, offsets
+
+
+def ivf_recall_at_1(
+    index: IvfIndex, sample_size: int = 1000, batch_size: int = 100, seed: int = 0
+) -> float:
+    """
+    Fraction of (a sample of) the rows whose most similar other row
+    the index finds as well as exact search.
+    """
+    rng = numpy.random.default_rng(seed)
+    n_rows = len(index.embeddings)
+    if n_rows < 2:
+        return 1.0
+    rows = numpy.sort(rng.choice(n_rows, min(n_rows, sample_size), replace=False))
+    found = 0
+    for batch in numpy.array_split(rows, math.ceil(len(rows) / batch_size)):
+        queries = numpy.asarray(index.embeddings[batch])
+        exact = queries @ index.embeddings.T
+        exact[numpy.arange(len(batch)), batch] = -numpy.inf
+        ids, similarities = index.search(queries, 2)
+        similarities[ids == batch[:, numpy.newaxis]] = -numpy.inf
+        found += int(numpy.sum(similarities.max(axis=1) >= exact.max(axis=1) - 1e-6))
+    return found / len(rows)
@@ -0,0 +1,317 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+import hashlib
+import json
+import logging
+import os
+from collections import Counter
+from os import environ
+from typing import List, Optional, Tuple
+
+import numpy
+
+from module.classifier import ARCH_KNN_TRANSFORMER, MODEL_FILE_BY_ARCH
+from module.utils import file_hash
+from .ivf import (
+    IvfIndex,
+    build_ivf,
+    exact_search,
+    get_ivf_min_rows,
+    get_ivf_probes,
+    ivf_recall_at_1,
+)
+
+# in the model dir of ARCH_KNN_TRANSFORMER:
+# one normalized float32 row per training question/paraphrase (appendable)
+KNN_EMBEDDINGS_FILE = "knn.f32"
+# centroids of the IVF index of large indexes (see module.classifier.ivf)
+KNN_IVF_FILE = "knn.ivf"
+# the answer id of each row (and so the number of rows), written last
+KNN_INDEX_FILE = MODEL_FILE_BY_ARCH[ARCH_KNN_TRANSFORMER]
+KNN_INDEX_VERSION = 2
+# rows appended since the IVF index was built are always scanned: past this
+# fraction of the indexed rows, training rebuilds the index instead of appending
+KNN_MAX_APPENDED_FRACTION = 0.1
+# cosine similarity, not comparable with the lr_transformer decision scores:
+KNN_OFF_TOPIC_THRESHOLD_DEFAULT = 0.5
+# rows of knn.f32 hashed to check it was written along with knn.json:
+# enough to tell trainings apart without paging in the whole file on load
+KNN_HASH_SAMPLE_ROWS = 64
+
+
+def normalize_rows(x) -> numpy.ndarray:
+    x = numpy.atleast_2d(numpy.asarray(x, dtype=numpy.float32))
+    norms = numpy.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return x / norms
+
+
+class NearestNeighborScorer:
+    """
+    Scores embedded questions by cosine similarity to every training
+    question and paraphrase (rows of one normalized float32 matrix):
+    the top k neighbors vote for their answer, weighted by similarity.
+    The confidence is the highest similarity among the winning answer's neighbors.
+    With an ivf index, neighbors are searched approximately.
+    Same interface as LinearScorer (classes and score).
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        labels: List[str],
+        k: int = 5,
+        ivf: Optional[IvfIndex] = None,
+    ):
+        self.embeddings = embeddings
+        self.classes = numpy.asarray(sorted(set(labels)))
+        self.label_indices = numpy.searchsorted(self.classes, numpy.asarray(labels))
+        self.k = max(1, min(k, len(labels)))
+        self.ivf = ivf
+
+    @property
+    def n_features(self) -> int:
+        return self.embeddings.shape[1]
+
+    def score(self, embedded_questions) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Returns (class indices, confidences), one of each per question.
+        """
+        queries = normalize_rows(embedded_questions)
+        neighbors, neighbor_similarities = (
+            self.ivf.search(queries, self.k)
+            if self.ivf is not None
+            else exact_search(self.embeddings, queries, self.k)
+        )
+        rows = numpy.arange(len(queries))[:, numpy.newaxis]
+        neighbor_classes = self.label_indices[neighbors]
+        votes = numpy.zeros((len(queries), len(self.classes)), numpy.float32)
+        numpy.add.at(votes, (rows, neighbor_classes), neighbor_similarities)
+        class_indices = votes.argmax(axis=1)
+        confidences = numpy.where(
+            neighbor_classes == class_indices[:, numpy.newaxis],
+            neighbor_similarities,
+            -numpy.inf,
+        ).max(axis=1)
+        return class_indices, confidences
+
+
+def knn_row_key(text: str) -> str:
+    """
+    Identifies the question (or paraphrase) text of a row of the index.
+    """
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def save_knn_index(
+    model_dir: str, embeddings, labels: List[str], keys: Optional[List[str]] = None
+) -> Optional[float]:
+    """
+    Writes the (normalized) embeddings and their labels, replacing any index.
+    keys (knn_row_key of the text of each row) let training append
+    new rows later (see knn_rows_to_add).
+    With at least KNN_IVF_MIN_ROWS rows, also builds an IVF index
+    (the rows are stored in the order of its lists)
+    and returns its recall@1 against exact search.
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    embeddings = normalize_rows(embeddings)
+    labels = list(labels)
+    ivf = None
+    recall = None
+    if len(labels) >= get_ivf_min_rows():
+        centroids, order, offsets = build_ivf(embeddings)
+        embeddings = embeddings[order]
+        labels = [labels[i] for i in order]
+        keys = [keys[i] for i in order] if keys is not None else None
+        recall = ivf_recall_at_1(
+            IvfIndex(embeddings, centroids, offsets, get_ivf_probes())
+        )
+        _write_file(model_dir, KNN_IVF_FILE, centroids.tobytes())
+        ivf = {
+            "offsets": offsets.tolist(),
+            "recall_at_1": recall,
+            "hash": file_hash(os.path.join(model_dir, KNN_IVF_FILE)),
+        }
+    else:
+        # an ivf file of a previous (larger) index must not be uploaded with this one
+        try:
+            os.remove(os.path.join(model_dir, KNN_IVF_FILE))
+        except FileNotFoundError:
+            pass
+    _write_file(model_dir, KNN_EMBEDDINGS_FILE, embeddings.tobytes())
+    _write_index(model_dir, embeddings.shape[1], labels, ivf, keys)
+    return recall
+
+
+def knn_rows_to_add(
+    model_dir: str, keys: List[str], labels: List[str]
+) -> Optional[List[int]]:
+    """
+    The positions of the rows (keys and labels of the training data)
+    that are not in the index in model_dir, for append_knn_index.
+    None if the index has to be rebuilt instead: there is no (valid) index,
+    it has rows that are no longer in the training data, or appending
+    would leave too many rows out of the IVF index (or not build one).
+    """
+    try:
+        index = _read_index(model_dir)
+        load_knn_scorer(model_dir)  # the files were written together
+    except (OSError, ValueError, KeyError):
+        return None
+    if "keys" not in index:
+        return None
+    remaining = Counter(zip(index["keys"], index["labels"]))
+    added = []
+    for i, row in enumerate(zip(keys, labels)):
+        if remaining[row] > 0:
+            remaining[row] -= 1
+        else:
+            added.append(i)
+    if any(n > 0 for n in remaining.values()):
+        return None
+    n_rows = len(index["labels"]) + len(added)
+    if not index.get("ivf"):
+        return added if n_rows < get_ivf_min_rows() else None
+    if not os.path.exists(os.path.join(model_dir, KNN_IVF_FILE)):
+        return None
+    indexed_rows = index["ivf"]["offsets"][-1]
+    if n_rows - indexed_rows > indexed_rows * KNN_MAX_APPENDED_FRACTION:
+        return None
+    return added
+
+
+def append_knn_index(
+    model_dir: str, embeddings, labels: List[str], keys: Optional[List[str]] = None
+) -> None:
+    """
+    Adds rows (e.g. the embeddings of new paraphrases) without retraining.
+    Rows are written past the end of the index first, and only become
+    part of it when the index file is replaced, so readers never see
+    a partial append.
+    """
+    index = _read_index(model_dir)
+    dim, existing_labels = index["dim"], index["labels"]
+    embeddings = normalize_rows(embeddings)
+    if embeddings.shape[1] != dim:
+        raise ValueError(f"expected embeddings of size {dim}")
+    with open(os.path.join(model_dir, KNN_EMBEDDINGS_FILE), "r+b") as f:
+        f.seek(len(existing_labels) * dim * 4)
+        f.write(embeddings.tobytes())
+        f.truncate()
+    # appended rows are in no ivf list (always scanned) until the next training
+    _write_index(
+        model_dir,
+        dim,
+        existing_labels + list(labels),
+        index.get("ivf"),
+        index["keys"] + list(keys) if "keys" in index and keys is not None else None,
+    )
+
+
+def load_knn_scorer(model_dir: str, k: int = 0) -> NearestNeighborScorer:
+    """
+    The embeddings are a read-only memmap. k defaults to KNN_NEIGHBORS (5).
+    The IVF index is used if there is one and at least KNN_IVF_MIN_ROWS rows.
+    Raises ValueError if the files were not written along with the index
+    (e.g. a knn.f32 of another training, with rows in another order).
+    """
+    index = _read_index(model_dir)
+    dim, labels = index["dim"], index["labels"]
+    embeddings_file = os.path.join(model_dir, KNN_EMBEDDINGS_FILE)
+    if os.path.getsize(embeddings_file) < len(labels) * dim * 4:
+        raise ValueError(f"{embeddings_file} has fewer rows than its index")
+    embeddings = numpy.memmap(
+        embeddings_file, numpy.float32, "r", shape=(len(labels), dim)
+    )
+    if _rows_hash(embeddings) != index["hash"]:
+        raise ValueError(f"{embeddings_file} was not written along with its index")
+    ivf = (
+        _load_ivf(model_dir, embeddings, index["ivf"])
+        if index.get("ivf") and len(labels) >= get_ivf_min_rows()
+        else None
+    )
+    return NearestNeighborScorer(
+        embeddings, labels, k or int(environ.get("KNN_NEIGHBORS", "5")), ivf
+    )
+
+
+def _load_ivf(model_dir: str, embeddings, ivf: dict) -> Optional[IvfIndex]:
+    ivf_file = os.path.join(model_dir, KNN_IVF_FILE)
+    if not os.path.exists(ivf_file):
+        logging.warning(f"{ivf_file} not found, using exact search")
+        return None
+    if file_hash(ivf_file) != ivf["hash"]:
+        raise ValueError(f"{ivf_file} was not written along with its index")
+    offsets = ivf["offsets"]
+    centroids = numpy.fromfile(ivf_file, dtype=numpy.float32)
+    if len(centroids) != (len(offsets) - 1) * embeddings.shape[1]:
+        raise ValueError(f"{ivf_file} does not match its index")
+    return IvfIndex(
+        embeddings,
+        centroids.reshape(len(offsets) - 1, embeddings.shape[1]),
+        offsets,
+        get_ivf_probes(),
+    )
+
+
+def _read_index(model_dir: str) -> dict:
+    with open(os.path.join(model_dir, KNN_INDEX_FILE)) as f:
+        index = json.load(f)
+    if index.get("version") != KNN_INDEX_VERSION:
+        raise ValueError(f"unsupported knn index version {index.get('version')}")
+    return index
+
+
+def _write_index(
+    model_dir: str,
+    dim: int,
+    labels: List[str],
+    ivf: Optional[dict] = None,
+    keys: Optional[List[str]] = None,
+) -> None:
+    index = {
+        "version": KNN_INDEX_VERSION,
+        "dim": dim,
+        "labels": labels,
+        # of (a sample of) the rows of knn.f32 in the index, checked on load
+        "hash": _rows_hash(
+            numpy.memmap(
+                os.path.join(model_dir, KNN_EMBEDDINGS_FILE),
+                numpy.float32,
+                "r",
+                shape=(len(labels), dim),
+            )
+        ),
+    }
+    if keys is not None:
+        index["keys"] = keys
+    if ivf:
+        # offsets of the lists of the rows in knn.f32 (centroids in knn.ivf)
+        index["ivf"] = ivf
+    _write_file(
+        model_dir, KNN_INDEX_FILE, json.dumps(index, separators=(",", ":")).encode()
+    )
+
+
+def _rows_hash(rows: numpy.ndarray) -> str:
+    """
+    Of the shape and KNN_HASH_SAMPLE_ROWS evenly spaced rows
+    (including the first and last), so only those are read from a memmap.
+    """
+    n_sampled = min(len(rows), KNN_HASH_SAMPLE_ROWS)
+    sample = numpy.unique(numpy.linspace(0, len(rows) - 1, n_sampled).astype(int))
+    h = hashlib.sha256(repr(rows.shape).encode())
+    h.update(numpy.ascontiguousarray(rows[sample]).tobytes())
+    return h.hexdigest()
+
+
+def _write_file(model_dir: str, file_name: str, data: bytes) -> None:
+    tmp_path = os.path.join(model_dir, f"{file_name}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, os.path.join(model_dir, file_name))
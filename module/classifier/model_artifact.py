@@ -0,0 +1,171 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+import json
+import os
+import struct
+from typing import Optional, Tuple
+
+import numpy
+
+from .scorer import LinearScorer
+
+MAGIC = b"MCLF"
+VERSION = 2
+DTYPE_FLOAT32 = 0
+DTYPE_FLOAT16 = 1
+# int8 coef rows, each with a float32 scale stored right after the intercept:
+DTYPE_INT8 = 2
+DTYPES = {
+    DTYPE_FLOAT32: numpy.float32,
+    DTYPE_FLOAT16: numpy.float16,
+    DTYPE_INT8: numpy.int8,
+}
+# magic, version, dtype, n_classes, coef rows, n_features,
+# offsets of coef, intercept and classes (json string table), classes length,
+# sha256 of the model.pkl trained along with the artifact (zeros if unknown)
+HEADER = struct.Struct("<4sIIIII4Q32s")
+ALIGNMENT = 64
+
+
+def save_linear_model(
+    file_path: str, coef, intercept, classes, scales=None, model_hash: str = ""
+) -> None:
+    """
+    Writes a linear classifier as a compact artifact that can be memory-mapped:
+    a header, raw coef (rows x features; float32, float16 or int8 with scales)
+    and float32 intercept, and a json string table with the classes.
+    model_hash: file_hash of the model.pkl the artifact is a copy of.
+    """
+    coef = numpy.atleast_2d(coef)
+    dtype = next((code for code, t in DTYPES.items() if coef.dtype == t), DTYPE_FLOAT32)
+    if (dtype == DTYPE_INT8) != (scales is not None):
+        raise ValueError("scales are required for, and only for, int8 weights")
+    coef = numpy.ascontiguousarray(coef, dtype=DTYPES[dtype])
+    intercept = numpy.ascontiguousarray(
+        numpy.atleast_1d(intercept), dtype=numpy.float32
+    )
+    classes_bytes = json.dumps([str(c) for c in classes]).encode("utf-8")
+    coef_offset = _align(HEADER.size)
+    intercept_offset = _align(coef_offset + coef.nbytes)
+    sections = [
+        (coef_offset, coef.tobytes()),
+        (intercept_offset, intercept.tobytes()),
+    ]
+    classes_offset = _align(intercept_offset + intercept.nbytes)
+    if scales is not None:
+        sections.append(
+            (classes_offset, numpy.asarray(scales, dtype=numpy.float32).tobytes())
+        )
+        classes_offset = _align(classes_offset + intercept.nbytes)
+    sections.append((classes_offset, classes_bytes))
+    header = HEADER.pack(
+        MAGIC,
+        VERSION,
+        dtype,
+        len(classes),
+        coef.shape[0],
+        coef.shape[1],
+        coef_offset,
+        intercept_offset,
+        classes_offset,
+        len(classes_bytes),
+        bytes.fromhex(model_hash),
+    )
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        for offset, data in [(0, header)] + sections:
+            f.seek(offset)
+            f.write(data)
+    os.replace(tmp_path, file_path)
+
+
+def save_model(file_path: str, model, model_hash: str = "") -> None:
+    save_linear_model(
+        file_path, model.coef_, model.intercept_, model.classes_, None, model_hash
+    )
+
+
+def save_scorer(file_path: str, scorer: LinearScorer, model_hash: str = "") -> None:
+    save_linear_model(
+        file_path,
+        scorer.coef,
+        scorer.intercept,
+        scorer.classes,
+        scorer.scales,
+        model_hash,
+    )
+
+
+def read_model_hash(file_path: str) -> Optional[str]:
+    """
+    The model_hash the artifact was saved with, None if it has none
+    (or is not a supported artifact).
+    """
+    with open(file_path, "rb") as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    magic, version, *_, model_hash = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION or not any(model_hash):
+        return None
+    return model_hash.hex()
+
+
+def load_linear_model(
+    file_path: str,
+) -> Tuple[numpy.ndarray, numpy.ndarray, list, Optional[numpy.ndarray]]:
+    """
+    Returns (coef, intercept, classes, scales); the arrays are read-only memmaps,
+    so the weights are shared through the page cache by all processes using them.
+    scales is None unless the weights are int8.
+    """
+    with open(file_path, "rb") as f:
+        (
+            magic,
+            version,
+            dtype,
+            n_classes,
+            rows,
+            n_features,
+            coef_offset,
+            intercept_offset,
+            classes_offset,
+            classes_length,
+            _,
+        ) = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or dtype not in DTYPES:
+            raise ValueError(f"unsupported model artifact {file_path}")
+        f.seek(classes_offset)
+        classes = json.loads(f.read(classes_length).decode("utf-8"))
+    coef = numpy.memmap(
+        file_path, DTYPES[dtype], "r", offset=coef_offset, shape=(rows, n_features)
+    )
+    intercept = numpy.memmap(
+        file_path, numpy.float32, "r", offset=intercept_offset, shape=(rows,)
+    )
+    scales = (
+        numpy.memmap(
+            file_path,
+            numpy.float32,
+            "r",
+            offset=_align(intercept_offset + intercept.nbytes),
+            shape=(rows,),
+        )
+        if dtype == DTYPE_INT8
+        else None
+    )
+    if len(classes) != n_classes:
+        raise ValueError(f"corrupt model artifact {file_path}")
+    return coef, intercept, classes, scales
+
+
+def load_scorer(file_path: str) -> LinearScorer:
+    return LinearScorer(*load_linear_model(file_path))
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
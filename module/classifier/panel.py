@@ -0,0 +1,67 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+import threading
+from concurrent.futures import Executor
+from typing import Callable, List, Optional
+
+import numpy
+
+from module.classifier import QuestionClassiferPredictionResult
+from module.feedback import record_user_questions
+from .predict import TransformersQuestionClassifierPrediction
+
+
+def evaluate_panel(
+    classifiers: List[TransformersQuestionClassifierPrediction],
+    question: str,
+    chat_session_id: str,
+    executor: Optional[Executor] = None,
+    canned_question_match_disabled: bool = False,
+) -> List[QuestionClassiferPredictionResult]:
+    """
+    Asks a panel of mentors (their classifiers) the same question:
+    the question is encoded at most once (not at all if it is canned
+    for every mentor), scored by the classifiers concurrently (with executor)
+    and the feedback of all mentors is recorded with one mutation.
+    Results are returned in the same order as the classifiers.
+    """
+    if not classifiers:
+        return []
+    encode = _once(lambda: classifiers[0].encoder.encode(question))
+
+    def evaluate(classifier: TransformersQuestionClassifierPrediction):
+        return classifier.evaluate_unrecorded(
+            question, chat_session_id, encode, canned_question_match_disabled
+        )
+
+    evaluations = (
+        list(executor.map(evaluate, classifiers))
+        if executor is not None
+        else [evaluate(c) for c in classifiers]
+    )
+    feedback_ids = record_user_questions(
+        [user_question for _, user_question in evaluations]
+    )
+    for (result, _), feedback_id in zip(evaluations, feedback_ids):
+        result.feedback_id = feedback_id
+    return [result for result, _ in evaluations]
+
+
+def _once(f: Callable[[], numpy.ndarray]) -> Callable[[], numpy.ndarray]:
+    """
+    f, called at most once by any number of threads.
+    """
+    lock = threading.Lock()
+    value: List[numpy.ndarray] = []
+
+    def call() -> numpy.ndarray:
+        with lock:
+            if not value:
+                value.append(f())
+        return value[0]
+
+    return call
@@ -4,24 +4,49 @@
 # The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
 #
 #
+import copy
 import logging
 import random
-import joblib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+from typing import Callable, Dict, List, Optional, TypeVar, Union, Tuple
 import numpy
-from typing import Dict, Union, Tuple
 from module.classifier import (
     AnswerMedia,
     ExternalVideoIds,
     mentor_model_path,
+    ARCH_KNN_TRANSFORMER,
     ARCH_LR_TRANSFORMER,
+    MODEL_FILE_BY_ARCH,
     QuestionClassiferPredictionResult,
     Media,
 )
-from module.api import create_user_question, get_off_topic_threshold, sbert_encode
-from module.mentor import Mentor
-from module.utils import file_last_updated_at, sanitize_string
+from module.api import (
+    OFF_TOPIC_THRESHOLD_DEFAULT,
+    get_off_topic_threshold,
+    user_question_input,
+)
+from module.feedback import record_user_question, record_user_questions
+from module.fuzzy_match import ANSWER_TYPE_FUZZY, get_fuzzy_match_threshold
+from module.mentor import MENTOR_BUNDLE, Mentor, load_mentor_bundle
+from module.utils import (
+    deep_getsizeof,
+    file_hash,
+    file_last_updated_at,
+    get_shared_root,
+    normalize_strings,
+    sanitize_string,
+)
+from .encoder import find_or_load_question_encoder
+from .knn import KNN_OFF_TOPIC_THRESHOLD_DEFAULT, NearestNeighborScorer, load_knn_scorer
+from .model_artifact import load_scorer, read_model_hash
+from .scorer import LinearScorer
 
+T = TypeVar("T")
 AnswerIdTextAndMedia = Tuple[str, str, str, Media, Media, Media, str]
+Prediction = Tuple[str, str, str, AnswerMedia, float, ExternalVideoIds, bool, str]
+AnswerResponse = Tuple[str, str, str, AnswerMedia, ExternalVideoIds, str]
 
 
 class TransformersQuestionClassifierPrediction:
@@ -30,20 +55,59 @@ class TransformersQuestionClassifierPrediction:
         mentor: Union[str, Mentor],
         data_path: str,
         auth_headers: Dict[str, str] = {},
+        shared_root: str = "",
+        previous_mentor: Optional[Mentor] = None,
+        arch: str = ARCH_LR_TRANSFORMER,
     ):
-        if isinstance(mentor, str):
-            logging.info("loading mentor id {}...".format(mentor))
-            mentor = Mentor(mentor, auth_headers)
+        """
+        previous_mentor: the mentor of a classifier this one replaces
+        (when the model changed). If the mentor isn't loaded from
+        the bundle, a copy of it is refreshed incrementally.
+        arch: the architecture of the model (lr_transformer or knn_transformer).
+        """
         assert isinstance(
-            mentor, Mentor
+            mentor, (str, Mentor)
         ), "invalid type for mentor (expected mentor.Mentor or string id for a mentor, encountered {}".format(
             type(mentor)
         )
-        self.mentor = mentor
+        mentor_id = mentor if isinstance(mentor, str) else mentor.id
+        self.arch = arch
+        self.model_dir = mentor_model_path(data_path, mentor_id, arch)
         self.model_file = mentor_model_path(
-            data_path, mentor.id, ARCH_LR_TRANSFORMER, "model.pkl"
+            data_path, mentor_id, arch, MODEL_FILE_BY_ARCH[arch]
+        )
+        self.artifact_file = mentor_model_path(data_path, mentor_id, arch, "model.bin")
+        started = time.perf_counter()
+        # files trained along with the model are saved with its hash,
+        # which (unlike file mtimes) survives being copied to a new container
+        self.model_hash = (
+            file_hash(self.model_file) if path.exists(self.model_file) else None
+        )
+        # the mentor data (graphql or bundle) and the model are independent,
+        # load them concurrently
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            scorer = executor.submit(_timed, self.__load_scorer)
+            if isinstance(mentor, str):
+                mentor = self.__load_mentor(
+                    mentor,
+                    self.model_dir,
+                    self.model_hash,
+                    auth_headers,
+                    previous_mentor,
+                )
+            mentor_loaded = time.perf_counter()
+            self.scorer, scorer_ms = scorer.result()
+        self.mentor = mentor
+        self.responses = self.__build_responses()
+        self.encoder = find_or_load_question_encoder(shared_root or get_shared_root())
+        logging.info(
+            "loaded classifier for mentor {} in {}ms (mentor {}ms, model {}ms)".format(
+                mentor_id,
+                round((time.perf_counter() - started) * 1000),
+                round((mentor_loaded - started) * 1000),
+                scorer_ms,
+            )
         )
-        self.model = self.__load_model()
 
     def evaluate(
         self,
@@ -51,41 +115,244 @@ class TransformersQuestionClassifierPrediction:
         chat_session_id: str,
         canned_question_match_disabled: bool = False,
     ) -> QuestionClassiferPredictionResult:
+        result, user_question = self.evaluate_unrecorded(
+            question,
+            chat_session_id,
+            lambda: self.encoder.encode(question),
+            canned_question_match_disabled,
+        )
+        result.feedback_id = record_user_question(user_question)
+        return result
+
+    def evaluate_unrecorded(
+        self,
+        question: str,
+        chat_session_id: str,
+        encode: Callable[[], numpy.ndarray],
+        canned_question_match_disabled: bool = False,
+    ) -> Tuple[QuestionClassiferPredictionResult, dict]:
+        """
+        Like evaluate, but leaves recording the feedback to the caller:
+        returns the result (without a feedback_id) and its user question input.
+        encode returns the embedded question, it isn't called for canned questions.
+        """
         sanitized_question = sanitize_string(question)
         if not canned_question_match_disabled:
-            if sanitized_question in self.mentor.questions_by_text:
-                q = self.mentor.questions_by_text[sanitized_question]
-                answer_id = q["answer_id"]
-                answer = q["answer"]
-                markdown_answer = q["markdown_answer"]
-                answer_media = q["answer_media"]
-                external_video_ids = q["external_video_ids"]
-                question_id = q["id"]
-                feedback_id = create_user_question(
+            canned = self.__find_canned(sanitized_question)
+            if canned is not None:
+                q, answer_type, confidence = canned
+                return self.__canned_result(q, None, confidence), user_question_input(
                     self.mentor.id,
                     question,
-                    answer_id,
+                    q["answer_id"],
                     chat_session_id,
-                    (
-                        "PARAPHRASE"
-                        if sanitized_question != sanitize_string(q["question_text"])
-                        else "EXACT"
-                    ),
-                    1.0,
+                    answer_type,
+                    confidence,
                 )
-                return QuestionClassiferPredictionResult(
-                    answer_id,
-                    answer,
-                    markdown_answer,
-                    answer_media,
-                    1.0,
-                    feedback_id,
-                    external_video_ids,
-                    answer_missing=False,
-                    question_id=question_id,
+        prediction = self.__get_prediction(encode())
+        return self.__classifier_result(prediction, None), user_question_input(
+            self.mentor.id,
+            question,
+            prediction[0],
+            chat_session_id,
+            self.__classifier_answer_type(prediction[4]),
+            prediction[4],
+        )
+
+    def evaluate_batch(
+        self,
+        questions: List[str],
+        chat_session_id: str,
+        canned_question_match_disabled: bool = False,
+    ) -> List[QuestionClassiferPredictionResult]:
+        """
+        Evaluates many questions at once: the questions that are not canned
+        are encoded with one encoder call and scored with a single
+        decision_function call, and all feedback is recorded with one mutation.
+        Results are returned in the same order as the questions.
+        """
+        sanitized_questions = normalize_strings(questions)
+        canned = [
+            None if canned_question_match_disabled else self.__find_canned(s)
+            for s in sanitized_questions
+        ]
+        to_classify = [i for i, q in enumerate(canned) if q is None]
+        predictions: Dict[int, Prediction] = {}
+        if to_classify:
+            embedded_questions = self.encoder.encode_batch(
+                [questions[i] for i in to_classify]
+            )
+            predictions = dict(
+                zip(to_classify, self.__get_predictions(embedded_questions))
+            )
+        user_questions = []
+        for i, question in enumerate(questions):
+            if canned[i] is not None:
+                q, answer_type, confidence = canned[i]
+                user_questions.append(
+                    user_question_input(
+                        self.mentor.id,
+                        question,
+                        q["answer_id"],
+                        chat_session_id,
+                        answer_type,
+                        confidence,
+                    )
+                )
+            else:
+                prediction = predictions[i]
+                user_questions.append(
+                    user_question_input(
+                        self.mentor.id,
+                        question,
+                        prediction[0],
+                        chat_session_id,
+                        self.__classifier_answer_type(prediction[4]),
+                        prediction[4],
+                    )
                 )
-        encoding_json = sbert_encode(question)
-        embedded_question = numpy.array(encoding_json["encoding"])
+        feedback_ids = record_user_questions(user_questions)
+        return [
+            (
+                self.__canned_result(canned[i][0], feedback_id, canned[i][2])
+                if canned[i] is not None
+                else self.__classifier_result(predictions[i], feedback_id)
+            )
+            for i, feedback_id in enumerate(feedback_ids)
+        ]
+
+    def get_last_trained_at(self) -> float:
+        return file_last_updated_at(self.model_file)
+
+    def estimate_nbytes(self) -> int:
+        """
+        Approximate memory held by this classifier (mentor data, weights and
+        response table), not counting the encoder shared by all classifiers.
+        """
+        seen: set = set()
+        return sum(
+            deep_getsizeof(o, seen) for o in [self.mentor, self.scorer, self.responses]
+        )
+
+    @staticmethod
+    def __load_mentor(
+        mentor_id: str,
+        model_dir: str,
+        model_hash: Optional[str],
+        auth_headers: Dict[str, str],
+        previous_mentor: Optional[Mentor],
+    ) -> Mentor:
+        """
+        Loads the mentor from the bundle written by training if it was
+        trained along with the model, otherwise from graphql.
+        """
+        bundle_file = path.join(model_dir, MENTOR_BUNDLE)
+        if path.exists(bundle_file):
+            try:
+                logging.info("loading mentor from path {}...".format(bundle_file))
+                return load_mentor_bundle(bundle_file, model_hash)
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning("failed to load {}: {}".format(bundle_file, e))
+        if previous_mentor is not None and previous_mentor.id == mentor_id:
+            # the previous classifier may still be answering with its mentor:
+            # refresh a copy (refresh replaces, doesn't mutate, the indexes)
+            mentor = copy.copy(previous_mentor)
+            stats = mentor.refresh(auth_headers)
+            logging.info("refreshed mentor id {}: {}".format(mentor_id, stats))
+            return mentor
+        logging.info("loading mentor id {}...".format(mentor_id))
+        return Mentor(mentor_id, auth_headers)
+
+    def __load_scorer(self) -> Union[LinearScorer, NearestNeighborScorer]:
+        """
+        Prefers the memory-mappable model.bin artifact,
+        unless it is missing or was not trained along with model.pkl.
+        """
+        if self.arch == ARCH_KNN_TRANSFORMER:
+            logging.info("loading knn index from path {}...".format(self.model_dir))
+            return load_knn_scorer(self.model_dir)
+        if path.exists(self.artifact_file):
+            try:
+                if self.model_hash is not None and (
+                    read_model_hash(self.artifact_file) != self.model_hash
+                ):
+                    raise ValueError(
+                        "not trained along with {}".format(self.model_file)
+                    )
+                logging.info("loading model from path {}...".format(self.artifact_file))
+                return load_scorer(self.artifact_file)
+            except (OSError, ValueError) as e:
+                logging.warning("failed to load {}: {}".format(self.artifact_file, e))
+        return LinearScorer.from_model(self.__load_model())
+
+    def __load_model(self):
+        # only needed for models without model.bin,
+        # imported here to keep joblib (and sklearn) off the startup path
+        import joblib
+
+        logging.info("loading model from path {}...".format(self.model_file))
+        return joblib.load(self.model_file)
+
+    def __find_canned(
+        self, sanitized_question: str
+    ) -> Optional[Tuple[dict, str, float]]:
+        """
+        (question dict, answer type, confidence) of an exact (or paraphrase) match,
+        or else of a near match if FUZZY_MATCH_THRESHOLD is set.
+        """
+        q = self.mentor.questions_by_text.get(sanitized_question)
+        if q is not None:
+            return q, self.__canned_answer_type(sanitized_question, q), 1.0
+        threshold = get_fuzzy_match_threshold()
+        fuzzy_questions = getattr(self.mentor, "fuzzy_questions", None)
+        if threshold <= 0 or fuzzy_questions is None:
+            return None
+        match = fuzzy_questions.find(sanitized_question, threshold)
+        if match is None:
+            return None
+        q, similarity = match
+        return q, ANSWER_TYPE_FUZZY, similarity
+
+    def __canned_answer_type(self, sanitized_question: str, q: dict) -> str:
+        return (
+            "PARAPHRASE"
+            if sanitized_question != sanitize_string(q["question_text"])
+            else "EXACT"
+        )
+
+    def __off_topic_threshold(self) -> float:
+        # scores of the architectures are on different scales
+        return get_off_topic_threshold(
+            KNN_OFF_TOPIC_THRESHOLD_DEFAULT
+            if self.arch == ARCH_KNN_TRANSFORMER
+            else OFF_TOPIC_THRESHOLD_DEFAULT
+        )
+
+    def __classifier_answer_type(self, highest_confidence: float) -> str:
+        return (
+            "OFF_TOPIC"
+            if highest_confidence < self.__off_topic_threshold()
+            else "CLASSIFIER"
+        )
+
+    def __canned_result(
+        self, q: dict, feedback_id: Optional[str], confidence: float = 1.0
+    ) -> QuestionClassiferPredictionResult:
+        return QuestionClassiferPredictionResult(
+            q["answer_id"],
+            q["answer"],
+            q["markdown_answer"],
+            q["answer_media"],
+            confidence,
+            feedback_id,
+            q["external_video_ids"],
+            answer_missing=False,
+            question_id=q["id"],
+        )
+
+    def __classifier_result(
+        self, prediction: Prediction, feedback_id: Optional[str]
+    ) -> QuestionClassiferPredictionResult:
         (
             answer_id,
             answer,
@@ -95,20 +362,8 @@ class TransformersQuestionClassifierPrediction:
             external_video_ids,
             answer_missing,
             question_id,
-        ) = self.__get_prediction(embedded_question)
-        feedback_id = create_user_question(
-            self.mentor.id,
-            question,
-            answer_id,
-            chat_session_id,
-            (
-                "OFF_TOPIC"
-                if highest_confidence < get_off_topic_threshold()
-                else "CLASSIFIER"
-            ),
-            highest_confidence,
-        )
-        if highest_confidence < get_off_topic_threshold():
+        ) = prediction
+        if highest_confidence < self.__off_topic_threshold():
             (
                 answer_id,
                 answer,
@@ -129,41 +384,22 @@ class TransformersQuestionClassifierPrediction:
             question_id,
         )
 
-    def get_last_trained_at(self) -> float:
-        return file_last_updated_at(self.model_file)
+    def __get_prediction(self, embedded_question) -> Prediction:
+        return self.__get_predictions([embedded_question])[0]
 
-    def __load_model(self):
-        logging.info("loading model from path {}...".format(self.model_file))
-        return joblib.load(self.model_file)
+    def __get_predictions(self, embedded_questions) -> List[Prediction]:
+        class_indices, confidences = self.scorer.score(embedded_questions)
+        return [
+            self.__prediction_for(c, confidence)
+            for c, confidence in zip(class_indices, confidences)
+        ]
 
-    def __get_prediction(
-        self, embedded_question
-    ) -> Tuple[str, str, str, AnswerMedia, float, ExternalVideoIds, bool, str]:
-        prediction = self.model.predict([embedded_question])
-        decision = self.model.decision_function([embedded_question])
-        if isinstance(decision[0], numpy.ndarray):
-            highest_confidence = max(decision[0])
-        else:
-            # edge-case - just a single number:
-            highest_confidence = decision[0]
-        answer_id = prediction[0]
-        answer_missing = False
-        if answer_id in self.mentor.answer_id_by_answer:
-            answer = self.mentor.answer_id_by_answer[prediction[0]]
-            answer_text = answer["transcript"]
-            answer_markdown_text = answer["markdownTranscript"]
-            question_id = answer["question_id"]
-            answer_key = sanitize_string(answer_text)
-            answer_media = self.mentor.questions_by_answer[answer_key].get(
-                "answer_media"
-            )
-            external_video_ids = self.mentor.questions_by_answer[answer_key].get(
-                "external_video_ids"
-            )
-        else:
+    def __prediction_for(
+        self, class_index: int, highest_confidence: float
+    ) -> Prediction:
+        response = self.responses[class_index]
+        if response is None:
             # answer does not exist, revert to off topic.
-            answer_missing = True
-            highest_confidence = -1
             (
                 answer_id,
                 answer_text,
@@ -172,7 +408,24 @@ class TransformersQuestionClassifierPrediction:
                 external_video_ids,
                 question_id,
             ) = self.__get_offtopic()
-
+            return (
+                answer_id,
+                answer_text,
+                answer_markdown_text,
+                answer_media,
+                -1.0,
+                external_video_ids,
+                True,
+                question_id,
+            )
+        (
+            answer_id,
+            answer_text,
+            answer_markdown_text,
+            answer_media,
+            external_video_ids,
+            question_id,
+        ) = response
         return (
             answer_id,
             answer_text,
@@ -180,10 +433,37 @@ class TransformersQuestionClassifierPrediction:
             answer_media,
             float(highest_confidence),
             external_video_ids,
-            answer_missing,
+            False,
             question_id,
         )
 
+    def __build_responses(self) -> List[Optional[AnswerResponse]]:
+        """
+        The complete response for each class of the scorer (by class index),
+        or None if the class' answer no longer exists (answer_missing).
+        Built once at load, so a prediction is just an argmax and an index.
+        """
+        responses: List[Optional[AnswerResponse]] = []
+        for answer_id in self.scorer.classes:
+            answer = self.mentor.answer_id_by_answer.get(answer_id)
+            if answer is None:
+                responses.append(None)
+                continue
+            q = self.mentor.questions_by_answer.get(
+                sanitize_string(answer["transcript"]), {}
+            )
+            responses.append(
+                (
+                    str(answer_id),
+                    answer["transcript"],
+                    answer["markdownTranscript"],
+                    q.get("answer_media"),
+                    q.get("external_video_ids"),
+                    answer["question_id"],
+                )
+            )
+        return responses
+
     def __get_offtopic(self) -> AnswerIdTextAndMedia:
         try:
             id, text, markdownText, answer_media, external_video_ids = random.choice(
@@ -199,3 +479,9 @@ class TransformersQuestionClassifierPrediction:
                 {"wistiaId": ""},
                 "",
             )
+
+
+def _timed(f: Callable[[], T]) -> Tuple[T, int]:
+    started = time.perf_counter()
+    result = f()
+    return result, round((time.perf_counter() - started) * 1000)
@@ -0,0 +1,112 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+from typing import Optional, Tuple
+
+import numpy
+
+PRECISION_FLOAT32 = "float32"
+PRECISION_FLOAT16 = "float16"
+PRECISION_INT8 = "int8"
+PRECISIONS = [PRECISION_FLOAT32, PRECISION_FLOAT16, PRECISION_INT8]
+
+
+class LinearScorer:
+    """
+    Scores embedded questions against a trained linear classifier
+    (e.g. sklearn's RidgeClassifier) with a single matrix product.
+
+    Computes what model.predict and model.decision_function would,
+    without sklearn's input validation and in one pass:
+    the weights are kept as contiguous float32 arrays,
+    or float16 / int8 with one float32 scale per row (see with_precision).
+    """
+
+    def __init__(self, coef, intercept, classes, scales=None):
+        coef = numpy.atleast_2d(coef)
+        self.coef = numpy.ascontiguousarray(
+            coef,
+            dtype=(
+                coef.dtype
+                if coef.dtype in (numpy.float16, numpy.int8)
+                else numpy.float32
+            ),
+        )
+        self.intercept = numpy.ascontiguousarray(
+            numpy.atleast_1d(intercept), dtype=numpy.float32
+        )
+        self.scales: Optional[numpy.ndarray] = (
+            None
+            if scales is None
+            else numpy.ascontiguousarray(scales, dtype=numpy.float32)
+        )
+        self.classes = numpy.asarray(classes)
+
+    @classmethod
+    def from_model(cls, model) -> "LinearScorer":
+        return cls(model.coef_, model.intercept_, model.classes_)
+
+    @property
+    def n_features(self) -> int:
+        return self.coef.shape[1]
+
+    @property
+    def precision(self) -> str:
+        return self.coef.dtype.name
+
+    def with_precision(self, precision: str) -> "LinearScorer":
+        """
+        A copy of this scorer with the weights stored as float32, float16
+        or int8 (symmetric, one scale per row).
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"unsupported precision {precision}")
+        coef = self.coef.astype(numpy.float32)
+        if self.scales is not None:
+            coef *= self.scales[:, numpy.newaxis]
+        if precision == PRECISION_INT8:
+            scales = numpy.abs(coef).max(axis=1) / 127
+            scales[scales == 0] = 1
+            coef = numpy.rint(coef / scales[:, numpy.newaxis]).clip(-127, 127)
+            return LinearScorer(
+                coef.astype(numpy.int8), self.intercept, self.classes, scales
+            )
+        return LinearScorer(coef.astype(precision), self.intercept, self.classes)
+
+    def agreement(self, other: "LinearScorer", embedded_questions) -> float:
+        """
+        Fraction of questions for which both scorers predict the same class.
+        """
+        class_indices, _ = self.score(embedded_questions)
+        other_class_indices, _ = other.score(embedded_questions)
+        return float(numpy.mean(class_indices == other_class_indices))
+
+    def decision_function(self, embedded_questions) -> numpy.ndarray:
+        """
+        Scores of shape (n_questions, n_classes),
+        or (n_questions,) for a binary classifier (same as sklearn).
+        """
+        x = numpy.asarray(embedded_questions, dtype=numpy.float32)
+        # reduced precision weights are widened per call (numpy has no fast
+        # mixed-type matmul), trading some latency for resident memory:
+        coef = self.coef.astype(numpy.float32, copy=False)
+        scores = numpy.atleast_2d(x) @ coef.T
+        if self.scales is not None:
+            scores *= self.scales
+        scores += self.intercept
+        return scores.ravel() if self.coef.shape[0] == 1 else scores
+
+    def score(self, embedded_questions) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Returns (class indices, confidences), one of each per question.
+        The confidence is the decision score of the predicted class.
+        """
+        scores = self.decision_function(embedded_questions)
+        if scores.ndim == 1:
+            # edge-case - binary classifier, just a single number per question:
+            return (scores > 0).astype(numpy.intp), scores
+        class_indices = scores.argmax(axis=1)
+        return class_indices, scores[numpy.arange(len(scores)), class_indices]
@@ -0,0 +1,114 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+from module.classifier import ARCH_LR_TRANSFORMER, MODEL_FILE_BY_ARCH
+from module.logger import get_logger
+
+log = get_logger("warmup")
+
+
+def recent_mentors(
+    s3, bucket: str, n: int, arch: str = ARCH_LR_TRANSFORMER
+) -> List[str]:
+    """
+    Ids of the n mentors whose models were trained most recently
+    (the s3 listing is the only usage history a new container has).
+    """
+    suffix = f"/{arch}/{MODEL_FILE_BY_ARCH[arch]}"
+    models = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket):
+        for o in page.get("Contents", []):
+            if o["Key"].endswith(suffix):
+                models.append((o["LastModified"], o["Key"][: -len(suffix)]))
+    return [mentor for _, mentor in sorted(models, reverse=True)[:n]]
+
+
+def warm_up(
+    dao,
+    mentors: List[str],
+    fetch_model: Callable[[str], bool],
+    max_bytes: int,
+    deadline: float,
+    workers: int = 8,
+) -> List[Dict]:
+    """
+    Downloads models and loads classifiers for the mentors concurrently,
+    until the dao cache holds max_bytes or time.monotonic() reaches deadline.
+    Returns a report per mentor, in order: status (loaded, not_found, error,
+    over_budget, past_deadline or loading, i.e. still loading at the deadline)
+    and load_ms. The reports are copies taken at the deadline: loads still
+    running then keep going, but don't change them.
+    """
+    mentors = list(dict.fromkeys(mentors))
+    report = {
+        mentor: {"mentor": mentor, "status": "past_deadline"} for mentor in mentors
+    }
+    queue = list(reversed(mentors))
+    lock = threading.Lock()
+
+    def load(mentor: str):
+        started = time.perf_counter()
+        result = {}
+        try:
+            if not fetch_model(mentor):
+                result["status"] = "not_found"
+                return
+            dao.find_classifier(mentor)
+            result["status"] = "loaded"
+        except Exception as e:
+            log.exception(e)
+            result["status"] = "error"
+            result["error"] = str(e)
+        finally:
+            result["load_ms"] = round((time.perf_counter() - started) * 1000)
+            with lock:
+                report[mentor].update(result)
+
+    def over_budget() -> bool:
+        return dao.stats()["bytes"] >= max_bytes
+
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    running = set()
+    try:
+        while queue or running:
+            while queue and len(running) < workers and not over_budget():
+                mentor = queue.pop()
+                with lock:
+                    report[mentor]["status"] = "loading"
+                running.add(executor.submit(load, mentor))
+            if not running:
+                break
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            _, running = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+    finally:
+        # don't wait for loads still running at the deadline
+        executor.shutdown(wait=False)
+    with lock:
+        for mentor in queue:
+            if over_budget():
+                report[mentor]["status"] = "over_budget"
+        return [dict(report[mentor]) for mentor in mentors]
+
+
+def deadline_from(context, deadline_sec: Optional[float], margin_sec: float) -> float:
+    """
+    time.monotonic() deadline for a warm up: deadline_sec from now, but never
+    later than margin_sec before the lambda invocation times out.
+    """
+    remaining = (
+        context.get_remaining_time_in_millis() / 1000 - margin_sec
+        if context is not None and hasattr(context, "get_remaining_time_in_millis")
+        else None
+    )
+    limits = [t for t in [deadline_sec, remaining] if t is not None]
+    return time.monotonic() + (min(limits) if limits else 60)
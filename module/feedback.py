@@ -0,0 +1,343 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from itertools import count
+from os import environ
+from typing import Callable, Deque, List, Optional, Tuple
+
+from module.api import (
+    create_user_question_from_input,
+    create_user_questions,
+    create_user_questions_or_none,
+)
+from module.utils import props_to_bool
+
+_object_id_counter = count(int.from_bytes(os.urandom(3), "big"))
+_object_id_process = os.urandom(5)
+
+
+def new_feedback_id() -> str:
+    """
+    A new mongo ObjectId (as hex) generated on the client, so the feedback id
+    is known before the user question is actually written.
+    """
+    timestamp = int(time.time()).to_bytes(4, "big")
+    counter = (next(_object_id_counter) % 0x1000000).to_bytes(3, "big")
+    return (timestamp + _object_id_process + counter).hex()
+
+
+class FeedbackRecorder:
+    """
+    Write-behind recorder for user question feedback.
+
+    Records are queued (with a client generated _id) and written with batched
+    userQuestionCreate mutations, either by a background thread (when a batch
+    is full or flush_interval has passed) or by an explicit flush.
+    The queue is bounded: when it is full it is flushed synchronously.
+    Records that are not written are spilled as json files to spill_dir
+    and retried on a later flush: whole batches that could not be sent,
+    or just the records graphql rejected. Records rejected max_attempts
+    times are dropped (and logged).
+    """
+
+    def __init__(
+        self,
+        flush_fn: Callable[
+            [List[dict]], List[Optional[str]]
+        ] = create_user_questions_or_none,
+        batch_size: int = 25,
+        max_queue: int = 1000,
+        flush_interval: float = 1.0,
+        spill_dir: str = "/tmp/feedback-spill",
+        max_spill_files: int = 1000,
+        max_attempts: int = 5,
+        background: bool = True,
+    ):
+        """
+        flush_fn writes a batch and returns the created id of each record,
+        None for a record that was rejected. It raises if the batch wasn't sent.
+        """
+        self.flush_fn = flush_fn
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.flush_interval = flush_interval
+        self.spill_dir = spill_dir
+        self.max_spill_files = max_spill_files
+        self.max_attempts = max_attempts
+        self.background = background
+        self.queue: Deque[dict] = deque()
+        self.oldest_queued_at = 0.0
+        # when this process last spilled records that are still to be written
+        self.spilled_at = 0.0
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.stats = {
+            "recorded": 0,
+            "flushed": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "rejected": 0,
+            # created with another id than the feedback id returned to the client
+            "mismatched": 0,
+            "spilled": 0,
+            "dropped": 0,
+        }
+
+    def record(self, user_question: dict) -> str:
+        """
+        Queues the user question and returns its (client generated) feedback id.
+        """
+        feedback_id = new_feedback_id()
+        with self.lock:
+            if not self.queue:
+                self.oldest_queued_at = time.time()
+            self.queue.append({**user_question, "_id": feedback_id})
+            self.stats["recorded"] += 1
+            queued = len(self.queue)
+        if queued >= self.max_queue:
+            self.flush()
+        elif self.background:
+            self.__ensure_thread()
+            if queued >= self.batch_size:
+                self.wakeup.set()
+        return feedback_id
+
+    def flush_due(self) -> int:
+        """
+        Flushes if a batch is full, or the oldest queued (or spilled) record
+        has waited longer than flush_interval (e.g. because the background
+        thread was frozen between lambda invocations).
+        """
+        now = time.time()
+        with self.lock:
+            due = (
+                len(self.queue) >= self.batch_size
+                or (self.queue and now - self.oldest_queued_at >= self.flush_interval)
+                or (self.spilled_at and now - self.spilled_at >= self.flush_interval)
+            )
+        return self.flush() if due else 0
+
+    def flush(self) -> int:
+        """
+        Writes all queued and previously spilled records.
+        Returns the number of records written.
+        """
+        with self.flush_lock:
+            flushed = self.__flush_spilled()
+            while True:
+                with self.lock:
+                    batch = [
+                        self.queue.popleft()
+                        for _ in range(min(self.batch_size, len(self.queue)))
+                    ]
+                    if self.queue:
+                        self.oldest_queued_at = time.time()
+                if not batch:
+                    return flushed
+                rejected = self.__write(batch)
+                if rejected is None:
+                    self.__spill(batch, 0)
+                    continue
+                flushed += len(batch) - len(rejected)
+                if rejected:
+                    self.__spill(rejected, 1)
+
+    def __write(self, batch: List[dict]) -> Optional[List[dict]]:
+        """
+        Returns the records graphql rejected, or None if the batch wasn't sent.
+        """
+        try:
+            ids = self.flush_fn(batch)
+        except Exception as e:
+            self.stats["failed_flushes"] += 1
+            logging.error("failed to flush %s user questions: %s", len(batch), e)
+            return None
+        rejected = [uq for i, uq in enumerate(batch) if i >= len(ids) or not ids[i]]
+        mismatched = [
+            (uq["_id"], ids[i])
+            for i, uq in enumerate(batch)
+            if i < len(ids) and ids[i] and ids[i] != uq["_id"]
+        ]
+        if mismatched:
+            # e.g. graphql ignores _id: the feedback ids given out don't exist
+            self.stats["mismatched"] += len(mismatched)
+            logging.error(
+                "%s user questions created with other ids than their feedback ids: %s",
+                len(mismatched),
+                json.dumps(mismatched),
+            )
+        self.stats["flushes"] += 1
+        self.stats["flushed"] += len(batch) - len(rejected)
+        self.stats["rejected"] += len(rejected)
+        return rejected
+
+    def __spill(self, batch: List[dict], attempts: int):
+        """
+        attempts: how many times graphql has rejected the records.
+        """
+        if attempts >= self.max_attempts:
+            self.stats["dropped"] += len(batch)
+            logging.error(
+                "dropping %s user questions rejected %s times: %s",
+                len(batch),
+                attempts,
+                json.dumps(batch),
+            )
+            return
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            spilled = sorted(
+                f for f in os.listdir(self.spill_dir) if f.endswith(".json")
+            )
+            for f in spilled[: max(0, len(spilled) - self.max_spill_files + 1)]:
+                self.__remove_spilled(os.path.join(self.spill_dir, f))
+            name = f"{time.time_ns()}-{uuid.uuid4().hex}.json"
+            tmp_path = os.path.join(self.spill_dir, f".{name}.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({"attempts": attempts, "records": batch}, f)
+            os.replace(tmp_path, os.path.join(self.spill_dir, name))
+            self.stats["spilled"] += len(batch)
+            with self.lock:
+                self.spilled_at = self.spilled_at or time.time()
+        except OSError as e:
+            self.stats["dropped"] += len(batch)
+            logging.error("failed to spill %s user questions: %s", len(batch), e)
+
+    def __remove_spilled(self, file_path: str):
+        try:
+            with open(file_path) as f:
+                self.stats["dropped"] += len(_spilled_records(json.load(f))[0])
+            os.remove(file_path)
+        except (OSError, ValueError):
+            pass
+
+    def __flush_spilled(self) -> int:
+        """
+        Records that were never sent are queued again (and written in full
+        batches), records that were rejected are retried file by file.
+        """
+        with self.lock:
+            self.spilled_at = 0.0
+        if not os.path.isdir(self.spill_dir):
+            return 0
+        flushed = 0
+        unsent = []
+        for name in sorted(os.listdir(self.spill_dir)):
+            if not name.endswith(".json"):
+                continue
+            file_path = os.path.join(self.spill_dir, name)
+            claimed_path = f"{file_path}.{os.getpid()}.sending"
+            try:
+                # claim the file, so no other process sends it too
+                os.rename(file_path, claimed_path)
+                with open(claimed_path) as f:
+                    records, attempts = _spilled_records(json.load(f))
+            except (OSError, ValueError):
+                continue
+            if attempts == 0:
+                unsent.extend(records)
+                os.remove(claimed_path)
+                continue
+            rejected = self.__write(records)
+            if rejected is None:
+                os.rename(claimed_path, file_path)
+                with self.lock:
+                    self.spilled_at = time.time()
+                break
+            os.remove(claimed_path)
+            flushed += len(records) - len(rejected)
+            if rejected:
+                self.__spill(rejected, attempts + 1)
+        if unsent:
+            with self.lock:
+                self.queue.extendleft(reversed(unsent))
+                self.oldest_queued_at = time.time()
+        return flushed
+
+    def __ensure_thread(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.__run, name="feedback-recorder", daemon=True
+                )
+                self.thread.start()
+
+    def __run(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush_due()
+            except Exception as e:
+                logging.error("feedback recorder flush failed: %s", e)
+
+
+def _spilled_records(spilled) -> Tuple[List[dict], int]:
+    """
+    (records, attempts) of a spill file (a plain list of records in older files).
+    """
+    if isinstance(spilled, list):
+        return spilled, 0
+    return spilled["records"], spilled["attempts"]
+
+
+def use_feedback_write_behind() -> bool:
+    return props_to_bool("FEEDBACK_WRITE_BEHIND", environ)
+
+
+_recorder = None
+
+
+def get_feedback_recorder() -> FeedbackRecorder:
+    global _recorder
+    if _recorder is None:
+        _recorder = FeedbackRecorder(
+            batch_size=int(environ.get("FEEDBACK_BATCH_SIZE", "25")),
+            max_queue=int(environ.get("FEEDBACK_MAX_QUEUE", "1000")),
+            flush_interval=float(environ.get("FEEDBACK_FLUSH_INTERVAL_SEC", "1.0")),
+            spill_dir=environ.get("FEEDBACK_SPILL_DIR", "/tmp/feedback-spill"),
+            max_attempts=int(environ.get("FEEDBACK_MAX_ATTEMPTS", "5")),
+        )
+    return _recorder
+
+
+def record_user_question(user_question: dict) -> str:
+    """
+    Records a user question (see api.user_question_input), returns its feedback id.
+    Written behind with FEEDBACK_WRITE_BEHIND=true, otherwise immediately.
+    """
+    if use_feedback_write_behind():
+        return get_feedback_recorder().record(user_question)
+    return create_user_question_from_input(user_question)
+
+
+def record_user_questions(user_questions: List[dict]) -> List[str]:
+    if use_feedback_write_behind():
+        recorder = get_feedback_recorder()
+        return [recorder.record(uq) for uq in user_questions]
+    return create_user_questions(user_questions)
+
+
+def flush_feedback():
+    """
+    Call at the end of an invocation: the background thread doesn't run
+    while a lambda container is frozen between invocations, and a frozen
+    container may never be thawed. Writes all queued (and spilled) records,
+    only batches that can't be sent are left spilled to this container's disk.
+    """
+    if _recorder is not None:
+        _recorder.flush()
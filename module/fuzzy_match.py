@@ -0,0 +1,105 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+import math
+from collections import Counter
+from os import environ
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# recorded as an existing classifierAnswerType (graphql has no FUZZY),
+# told apart from an exact paraphrase match by a confidence below 1
+ANSWER_TYPE_FUZZY = "PARAPHRASE"
+
+
+def get_fuzzy_match_threshold() -> float:
+    """
+    FUZZY_MATCH_THRESHOLD (0-1), the minimum similarity for a question to be
+    answered as a near match of a canned question. 0 (the default) disables it.
+    """
+    try:
+        return float(environ.get("FUZZY_MATCH_THRESHOLD") or 0)
+    except ValueError:
+        return 0.0
+
+
+def trigrams(text: str) -> Set[str]:
+    if not text:
+        return set()
+    padded = f" {' '.join(text.split())} "
+    return {a + b + c for a, b, c in zip(padded, padded[1:], padded[2:])}
+
+
+class FuzzyQuestionIndex:
+    """
+    Approximate lookup of sanitized question texts by the similarity
+    (Dice coefficient) of their sets of character trigrams, which stays high
+    for a typo, a missing word or reordered words.
+    Candidates are found with an inverted index from trigram to texts,
+    scanning only the postings of the rarest trigrams of the question
+    that any text similar enough must share (prefix filtering), so the long
+    postings of common trigrams (e.g. " wh") are not scanned at all.
+    """
+
+    def __init__(self, questions_by_text: Dict[str, Any]):
+        self.texts: List[str] = []
+        self.values: List[Any] = []
+        self.sizes: List[int] = []
+        self.postings: Dict[str, List[int]] = {}
+        for text, value in questions_by_text.items():
+            grams = trigrams(text)
+            if not grams:
+                continue
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(len(self.values))
+            self.texts.append(text)
+            self.values.append(value)
+            self.sizes.append(len(grams))
+
+    def find(self, text: str, threshold: float) -> Optional[Tuple[Any, float]]:
+        """
+        The value of the most similar text and the similarity, if it is at least
+        threshold and no text as similar has a different value.
+        """
+        grams = trigrams(text)
+        if not grams or threshold > 1:
+            return None
+        # a text with a similarity >= threshold shares at least min_shared
+        # trigrams (2n / (len(grams) + size) >= threshold, with n <= size),
+        # so it shares one of any len(grams) - min_shared + 1 of them
+        min_shared = max(1, math.ceil(threshold * len(grams) / (2 - threshold) - 1e-9))
+        rarest = sorted(grams, key=lambda g: len(self.postings.get(g, ())))
+        prefix = rarest[: max(0, len(grams) - min_shared + 1)]
+        unscanned = len(grams) - len(prefix)
+        shared: Counter = Counter()
+        for gram in prefix:
+            shared.update(self.postings.get(gram, ()))
+        # the most similar texts are found first (in order of the upper bound
+        # of their similarity), and the others are not scored at all
+        bounds = []
+        for i, n in shared.items():
+            size = self.sizes[i]
+            upper_bound = 2 * min(n + unscanned, size) / (len(grams) + size)
+            if upper_bound >= threshold:
+                bounds.append((upper_bound, i, n))
+        bounds.sort(reverse=True)
+        best: List[int] = []
+        best_score = 0.0
+        for upper_bound, i, n in bounds:
+            if upper_bound < best_score:
+                break
+            if unscanned:
+                n = len(grams & trigrams(self.texts[i]))
+            score = 2 * n / (len(grams) + self.sizes[i])
+            if score > best_score:
+                best, best_score = [i], score
+            elif score == best_score:
+                best.append(i)
+        if best_score < threshold:
+            return None
+        value = self.values[best[0]]
+        if any(self.values[i] != value for i in best[1:]):
+            return None  # ambiguous
+        return value, best_score
@@ -0,0 +1,158 @@
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+#
+import logging
+import random
+import threading
+import time
+from os import environ
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS_CODES = [429, 502, 503, 504]
+
+
+class EndpointStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "mean_ms": round(self.total_ms / self.calls, 1) if self.calls else 0.0,
+            "max_ms": round(self.max_ms, 1),
+        }
+
+
+class HttpClient:
+    """
+    HTTP client shared by all calls to graphql and sbert:
+    keeps one requests.Session (keep-alive connection pool) per host
+    for the life of the process, so warm invocations reuse connections.
+    Every request has connect/read timeouts. Idempotent requests are retried
+    on connection errors, timeouts and 429/502/503/504, at most `retries` times,
+    with exponential backoff and full jitter.
+    Latency and error counters are kept per endpoint (a name given by the caller).
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10,
+        retries: int = 2,
+        backoff: float = 0.1,
+        pool_size: int = 10,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.sessions: Dict[str, requests.Session] = {}
+        self.endpoints: Dict[str, EndpointStats] = {}
+        self.lock = threading.Lock()
+
+    def get(self, endpoint: str, url: str, **kwargs) -> requests.Response:
+        return self.request(endpoint, "GET", url, idempotent=True, **kwargs)
+
+    def post(
+        self, endpoint: str, url: str, idempotent: bool = False, **kwargs
+    ) -> requests.Response:
+        return self.request(endpoint, "POST", url, idempotent=idempotent, **kwargs)
+
+    def request(
+        self, endpoint: str, method: str, url: str, idempotent: bool, **kwargs
+    ) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        session = self.session(url)
+        retries = self.retries if idempotent else 0
+        started = time.perf_counter()
+        try:
+            for attempt in range(retries + 1):
+                try:
+                    res = session.request(method, url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    if attempt == retries:
+                        raise
+                    logging.warning(f"{endpoint} request failed, retrying: {e}")
+                else:
+                    if attempt == retries or res.status_code not in RETRY_STATUS_CODES:
+                        break
+                    logging.warning(f"{endpoint} returned {res.status_code}, retrying")
+                self.__count(endpoint, retries=1)
+                time.sleep(random.uniform(0, self.backoff * 2**attempt))
+        except Exception:
+            self.__count(endpoint, errors=1)
+            raise
+        finally:
+            self.__record(endpoint, (time.perf_counter() - started) * 1000)
+        if res.status_code >= 400:
+            self.__count(endpoint, errors=1)
+        return res
+
+    def session(self, url: str) -> requests.Session:
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.sessions[host] = session
+            return session
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            return {name: s.to_dict() for name, s in self.endpoints.items()}
+
+    def __endpoint(self, endpoint: str) -> EndpointStats:
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = EndpointStats()
+        return self.endpoints[endpoint]
+
+    def __count(self, endpoint: str, errors: int = 0, retries: int = 0):
+        with self.lock:
+            s = self.__endpoint(endpoint)
+            s.errors += errors
+            s.retries += retries
+
+    def __record(self, endpoint: str, ms: float):
+        with self.lock:
+            s = self.__endpoint(endpoint)
+            s.calls += 1
+            s.total_ms += ms
+            s.max_ms = max(s.max_ms, ms)
+
+
+_http_client: Optional[HttpClient] = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """
+    The process wide client, configured by HTTP_CONNECT_TIMEOUT_SEC,
+    HTTP_READ_TIMEOUT_SEC, HTTP_RETRIES and HTTP_POOL_SIZE.
+    """
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = HttpClient(
+                connect_timeout=float(environ.get("HTTP_CONNECT_TIMEOUT_SEC", "3.05")),
+                read_timeout=float(environ.get("HTTP_READ_TIMEOUT_SEC", "10")),
+                retries=int(environ.get("HTTP_RETRIES", "2")),
+                pool_size=int(environ.get("HTTP_POOL_SIZE", "10")),
+            )
+        return _http_client
@@ -4,11 +4,22 @@
 # The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
 #
 #
+import gzip
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 
 from module.api import fetch_mentor_data, fetch_mentor_graded_user_questions
-from module.utils import sanitize_string
-from typing import Dict
+from module.fuzzy_match import FuzzyQuestionIndex, get_fuzzy_match_threshold
+from module.utils import normalize_strings, sanitize_string
+from typing import Dict, List, Optional, Tuple
+
+# written by training next to model.pkl, so predict can skip the graphql queries
+MENTOR_BUNDLE = "mentor.json.gz"
+MENTOR_BUNDLE_VERSION = 1
 
 
 @dataclass
@@ -28,69 +39,105 @@ class Mentor(object):
         self.questions_by_text = {}
         self.questions_by_answer = {}
         self.answer_id_by_answer = {}
+        self.fuzzy_questions: Optional[FuzzyQuestionIndex] = None
         self.load(auth_headers)
 
+    @classmethod
+    def from_bundle(cls, bundle: dict) -> "Mentor":
+        """
+        Rebuilds a mentor from the output of to_bundle, without any graphql queries.
+        """
+        if bundle.get("version") != MENTOR_BUNDLE_VERSION:
+            raise ValueError(
+                f"unsupported mentor bundle version {bundle.get('version')}"
+            )
+        questions = bundle["questions"]
+        mentor = cls.__new__(cls)
+        mentor.id = bundle["id"]
+        mentor.topics = bundle["topics"]
+        mentor.utterances_by_type = bundle["utterances_by_type"]
+        mentor.answer_id_by_answer = bundle["answer_id_by_answer"]
+        for index in ["questions_by_id", "questions_by_text", "questions_by_answer"]:
+            setattr(mentor, index, {k: questions[i] for k, i in bundle[index].items()})
+        mentor.fuzzy_questions = _fuzzy_index(mentor.questions_by_text)
+        return mentor
+
+    def to_bundle(self) -> dict:
+        """
+        All the data predict needs, as json.
+        The question dicts shared by several indexes are stored once
+        and the indexes refer to them by position.
+        """
+        questions: list = []
+        positions: Dict[int, int] = {}
+
+        def position(q: dict) -> int:
+            if id(q) not in positions:
+                positions[id(q)] = len(questions)
+                questions.append(q)
+            return positions[id(q)]
+
+        bundle = {
+            "version": MENTOR_BUNDLE_VERSION,
+            "id": self.id,
+            "topics": self.topics,
+            "utterances_by_type": self.utterances_by_type,
+            "answer_id_by_answer": self.answer_id_by_answer,
+        }
+        for index in ["questions_by_id", "questions_by_text", "questions_by_answer"]:
+            bundle[index] = {k: position(q) for k, q in getattr(self, index).items()}
+        bundle["questions"] = questions
+        return bundle
+
     def load(self, auth_headers):
-        data = fetch_mentor_data(self.id, auth_headers)
+        self.refresh(auth_headers)
+
+    def refresh(self, auth_headers: Dict[str, str] = {}) -> Dict[str, int]:
+        """
+        (Re)loads the mentor's data from graphql.
+        Each answer and graded user question is indexed (sanitized texts,
+        question dicts) by a hash of its content, so on a refresh only
+        the entries that changed since the last load are re-indexed.
+        The indexes are swapped in at the end.
+        Returns counts of the entries and of those re-indexed,
+        and the time spent fetching and indexing.
+        """
+        started = time.perf_counter()
+        # the two queries are independent, run them concurrently
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            graded_user_questions = executor.submit(
+                fetch_mentor_graded_user_questions, self.id
+            )
+            data = fetch_mentor_data(self.id, auth_headers)
+            user_question_nodes = graded_user_questions.result()
+        fetched = time.perf_counter()
+        previous_entries = getattr(self, "_Mentor__entries", {})
+        entries: Dict[str, tuple] = {}
+        stats = {
+            "answers": 0,
+            "answers_reindexed": 0,
+            "graded_user_questions": 0,
+            "graded_user_questions_reindexed": 0,
+        }
+
+        def entry(kind: str, content, build) -> tuple:
+            key = _content_hash(content)
+            stats[kind] += 1
+            if key not in entries:
+                if key in previous_entries:
+                    entries[key] = previous_entries[key]
+                else:
+                    entries[key] = build()
+                    stats[f"{kind}_reindexed"] += 1
+            return entries[key]
+
+        topics = []
         for subject in data.get("subjects", []):
-            self.topics.append(subject["name"])
+            topics.append(subject["name"])
         for topic in data.get("topics", []):
-            self.topics.append(topic["name"])
+            topics.append(topic["name"])
         answers = data.get("answers", [])
         already_complete_answers = data.get("orphanedCompleteAnswers", [])
-        all_answers = [*answers, *already_complete_answers]
-        for answer in all_answers:
-            question = answer["question"]
-            if answer["status"] in ["INCOMPLETE", "SKIP"]:
-                continue
-            if answer["status"] == "NONE":
-                mentorType = data.get("mentorType", "VIDEO")
-                if mentorType == "VIDEO":
-                    if (
-                        not (answer["transcript"] or question["name"] == "_IDLE_")
-                        or not answer["webMedia"]
-                        or not answer["mobileMedia"]
-                        or not answer["webMedia"].get("url", "")
-                        or not answer["mobileMedia"].get("url", "")
-                    ):
-                        continue
-                else:
-                    if not answer["transcript"]:
-                        continue
-            answer_media = {
-                "web_media": answer.get("webMedia"),
-                "mobile_media": answer.get("mobileMedia"),
-                "vtt_media": answer.get("vttMedia"),
-            }
-            if question["type"] == "UTTERANCE":
-                if question["name"] not in self.utterances_by_type:
-                    self.utterances_by_type[question["name"]] = []
-                utterance_data = [
-                    answer["_id"],
-                    answer["transcript"],
-                    answer["markdownTranscript"],
-                    answer_media,
-                    answer["externalVideoIds"],
-                ]
-                self.utterances_by_type[question["name"]].append(utterance_data)
-                continue
-            q = {
-                "id": question["_id"],
-                "question_text": question["question"],
-                "paraphrases": question["paraphrases"],
-                "answer": answer["transcript"],
-                "markdown_answer": answer["markdownTranscript"],
-                "answer_id": answer["_id"],
-                "answer_media": answer_media,
-                "external_video_ids": answer["externalVideoIds"],
-                "topics": [],
-            }
-            self.answer_id_by_answer[answer["_id"]] = {
-                "transcript": answer["transcript"],
-                "markdownTranscript": answer["markdownTranscript"],
-                "question_id": question["_id"],
-            }
-            self.questions_by_id[question["_id"]] = q
         # First add primary question texts
         questions = data.get("questions", [])
         questions_from_already_complete_answers = list(
@@ -104,37 +151,193 @@ class Mentor(object):
                 already_complete_answers,
             )
         )
-        for question in [*questions, *questions_from_already_complete_answers]:
-            q = self.questions_by_id.get(question["question"]["_id"], None)
-            if q is not None:
-                for topic in question["topics"]:
-                    self.questions_by_id[q["id"]]["topics"].append(topic["name"])
-                self.questions_by_text[sanitize_string(q["question_text"])] = q
-                self.questions_by_answer[sanitize_string(q["answer"])] = q
-                for paraphrase in q["paraphrases"]:
-                    sanitized_paraphrase = sanitize_string(paraphrase)
-                    if sanitized_paraphrase not in self.questions_by_text:
-                        self.questions_by_text[sanitized_paraphrase] = q
-        user_question_nodes = fetch_mentor_graded_user_questions(self.id)
+        all_questions = [*questions, *questions_from_already_complete_answers]
+        topics_by_question: Dict[str, list] = {}
+        for question in all_questions:
+            topics_by_question.setdefault(question["question"]["_id"], []).extend(
+                topic["name"] for topic in question["topics"]
+            )
+        mentor_type = data.get("mentorType", "VIDEO")
+        utterances_by_type: Dict[str, list] = {}
+        questions_by_id: Dict[str, tuple] = {}
+        answer_id_by_answer = {}
+        for answer in [*answers, *already_complete_answers]:
+            question_topics = topics_by_question.get(answer["question"]["_id"], [])
+            e = entry(
+                "answers",
+                [answer, mentor_type, question_topics],
+                lambda: _index_answer(answer, mentor_type, question_topics),
+            )
+            if e[0] == ANSWER_SKIPPED:
+                continue
+            if e[0] == ANSWER_UTTERANCE:
+                _, name, utterance_data = e
+                utterances_by_type.setdefault(name, []).append(utterance_data)
+                continue
+            _, q, answer_row = e[:3]
+            answer_id_by_answer[q["answer_id"]] = answer_row
+            questions_by_id[q["id"]] = e
+        questions_by_text = {}
+        questions_by_answer = {}
+        for question in all_questions:
+            e = questions_by_id.get(question["question"]["_id"], None)
+            if e is not None:
+                _, q, _, question_text, answer_text, paraphrases = e
+                questions_by_text[question_text] = q
+                questions_by_answer[answer_text] = q
+                for sanitized_paraphrase in paraphrases:
+                    if sanitized_paraphrase not in questions_by_text:
+                        questions_by_text[sanitized_paraphrase] = q
         for user_question in user_question_nodes:
-            question_asked = user_question["question"]
-            target_answer_doc = user_question["graderAnswer"]
-            target_question_doc = target_answer_doc["question"]
-            answer_media = {
-                "web_media": target_answer_doc.get("webMedia", None),
-                "mobile_media": target_answer_doc.get("mobileMedia", None),
-                "vtt_media": target_answer_doc.get("vttMedia", None),
-            }
-            external_video_ids = target_answer_doc["externalVideoIds"]
-            q = {
-                "id": target_question_doc["_id"],
-                "question_text": target_question_doc["question"],
-                "paraphrases": target_question_doc["paraphrases"],
-                "answer": target_answer_doc["transcript"],
-                "markdown_answer": target_answer_doc["markdownTranscript"],
-                "answer_id": target_answer_doc["_id"],
-                "answer_media": answer_media,
-                "topics": [],
-                "external_video_ids": external_video_ids,
-            }
-            self.questions_by_text[sanitize_string(question_asked)] = q
+            question_asked, q = entry(
+                "graded_user_questions",
+                user_question,
+                lambda: _index_graded_user_question(user_question),
+            )
+            questions_by_text[question_asked] = q
+        self.topics = topics
+        self.utterances_by_type = utterances_by_type
+        self.questions_by_id = {k: e[1] for k, e in questions_by_id.items()}
+        self.questions_by_text = questions_by_text
+        self.questions_by_answer = questions_by_answer
+        self.answer_id_by_answer = answer_id_by_answer
+        self.fuzzy_questions = _fuzzy_index(questions_by_text)
+        self.__entries = entries
+        stats["fetch_ms"] = round((fetched - started) * 1000)
+        stats["index_ms"] = round((time.perf_counter() - fetched) * 1000)
+        return stats
+
+
+ANSWER_SKIPPED = "skipped"
+ANSWER_UTTERANCE = "utterance"
+ANSWER_QUESTION = "question"
+
+
+def _content_hash(content) -> str:
+    return hashlib.blake2b(
+        json.dumps(content, sort_keys=True).encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+
+def _fuzzy_index(questions_by_text: Dict[str, dict]) -> Optional[FuzzyQuestionIndex]:
+    # only built when fuzzy matching is enabled
+    if get_fuzzy_match_threshold() <= 0:
+        return None
+    return FuzzyQuestionIndex(questions_by_text)
+
+
+def _index_answer(answer: dict, mentor_type: str, topics: List[str]) -> tuple:
+    """
+    Everything the mentor indexes need from one answer:
+    (ANSWER_SKIPPED,), (ANSWER_UTTERANCE, name, utterance data) or
+    (ANSWER_QUESTION, question dict, answer table row,
+    sanitized question text, sanitized answer, sanitized paraphrases).
+    """
+    question = answer["question"]
+    if answer["status"] in ["INCOMPLETE", "SKIP"]:
+        return (ANSWER_SKIPPED,)
+    if answer["status"] == "NONE":
+        if mentor_type == "VIDEO":
+            if (
+                not (answer["transcript"] or question["name"] == "_IDLE_")
+                or not answer["webMedia"]
+                or not answer["mobileMedia"]
+                or not answer["webMedia"].get("url", "")
+                or not answer["mobileMedia"].get("url", "")
+            ):
+                return (ANSWER_SKIPPED,)
+        else:
+            if not answer["transcript"]:
+                return (ANSWER_SKIPPED,)
+    answer_media = {
+        "web_media": answer.get("webMedia"),
+        "mobile_media": answer.get("mobileMedia"),
+        "vtt_media": answer.get("vttMedia"),
+    }
+    if question["type"] == "UTTERANCE":
+        utterance_data = [
+            answer["_id"],
+            answer["transcript"],
+            answer["markdownTranscript"],
+            answer_media,
+            answer["externalVideoIds"],
+        ]
+        return (ANSWER_UTTERANCE, question["name"], utterance_data)
+    q = {
+        "id": question["_id"],
+        "question_text": question["question"],
+        "paraphrases": question["paraphrases"],
+        "answer": answer["transcript"],
+        "markdown_answer": answer["markdownTranscript"],
+        "answer_id": answer["_id"],
+        "answer_media": answer_media,
+        "external_video_ids": answer["externalVideoIds"],
+        "topics": list(topics),
+    }
+    answer_row = {
+        "transcript": answer["transcript"],
+        "markdownTranscript": answer["markdownTranscript"],
+        "question_id": question["_id"],
+    }
+    question_text, answer_text, *paraphrases = normalize_strings(
+        [q["question_text"], q["answer"], *q["paraphrases"]]
+    )
+    return (
+        ANSWER_QUESTION,
+        q,
+        answer_row,
+        question_text,
+        answer_text,
+        paraphrases,
+    )
+
+
+def _index_graded_user_question(user_question: dict) -> Tuple[str, dict]:
+    """
+    (sanitized question asked, question dict of the answer the grader picked)
+    """
+    question_asked = user_question["question"]
+    target_answer_doc = user_question["graderAnswer"]
+    target_question_doc = target_answer_doc["question"]
+    answer_media = {
+        "web_media": target_answer_doc.get("webMedia", None),
+        "mobile_media": target_answer_doc.get("mobileMedia", None),
+        "vtt_media": target_answer_doc.get("vttMedia", None),
+    }
+    external_video_ids = target_answer_doc["externalVideoIds"]
+    q = {
+        "id": target_question_doc["_id"],
+        "question_text": target_question_doc["question"],
+        "paraphrases": target_question_doc["paraphrases"],
+        "answer": target_answer_doc["transcript"],
+        "markdown_answer": target_answer_doc["markdownTranscript"],
+        "answer_id": target_answer_doc["_id"],
+        "answer_media": answer_media,
+        "topics": [],
+        "external_video_ids": external_video_ids,
+    }
+    return sanitize_string(question_asked), q
+
+
+def save_mentor_bundle(file_path: str, mentor: Mentor, model_hash: str = "") -> None:
+    """
+    model_hash: file_hash of the model trained along with the bundle.
+    """
+    tmp_path = f"{file_path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(
+            {**mentor.to_bundle(), "model_hash": model_hash}, f, separators=(",", ":")
+        )
+    os.replace(tmp_path, file_path)
+
+
+def load_mentor_bundle(file_path: str, model_hash: Optional[str] = None) -> Mentor:
+    """
+    Raises ValueError if model_hash is given and the bundle was not saved with it
+    (i.e. it was trained along with another model).
+    """
+    with gzip.open(file_path, "rt", encoding="utf-8") as f:
+        bundle = json.load(f)
+    if model_hash is not None and bundle.get("model_hash") != model_hash:
+        raise ValueError(f"{file_path} was not trained along with the model")
+    return Mentor.from_bundle(bundle)
@@ -4,13 +4,27 @@
 #
 # The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
 #
+import base64
 import json
 import os
+import time
+from typing import Dict, List, Optional, get_args, get_origin
+from concurrent.futures import ThreadPoolExecutor
 import boto3
-import botocore
 from module.logger import get_logger
-from datetime import datetime
+from module.classifier import (
+    ARCH_KNN_TRANSFORMER,
+    ARCH_LR_TRANSFORMER,
+    MODEL_FILE_BY_ARCH,
+)
 from module.classifier.dao import Dao
+from module.classifier.encoder import EMBEDDING_CACHE
+from module.classifier.freshness import ModelFreshnessChecker
+from module.classifier.knn import KNN_EMBEDDINGS_FILE, KNN_IVF_FILE
+from module.classifier.panel import evaluate_panel
+from module.feedback import flush_feedback
+from module.http_client import get_http_client
+from module.mentor import MENTOR_BUNDLE
 from module.utils import (
     load_sentry,
     append_cors_headers,
@@ -27,6 +41,26 @@ MODELS_BUCKET = require_env("MODELS_BUCKET")
 log.info(f"bucket: {MODELS_BUCKET}")
 s3 = boto3.client("s3")
 MODELS_DIR = "/tmp/models"
+MAX_BATCH_QUESTIONS = int(os.environ.get("MAX_BATCH_QUESTIONS", "50"))
+MAX_PANEL_MENTORS = int(os.environ.get("MAX_PANEL_MENTORS", "10"))
+WARMUP_WORKERS = int(os.environ.get("WARMUP_WORKERS", "8"))
+WARMUP_DEADLINE_MARGIN_SEC = 2
+# fetched after the model file (MODEL_FILE_BY_ARCH), model.bin and the bundle are
+# optional: models trained before they were added don't have them
+# (nor do knn models too small for an ivf index).
+OTHER_MODEL_FILES = {
+    ARCH_LR_TRANSFORMER: ["model.bin", MENTOR_BUNDLE],
+    ARCH_KNN_TRANSFORMER: [KNN_EMBEDDINGS_FILE, KNN_IVF_FILE, MENTOR_BUNDLE],
+}
+model_file_executor = ThreadPoolExecutor(max_workers=8)
+# loads and scores the mentors of a panel (fetch_model uses model_file_executor)
+panel_executor = ThreadPoolExecutor(max_workers=max(1, MAX_PANEL_MENTORS))
+model_freshness = ModelFreshnessChecker(
+    s3,
+    MODELS_BUCKET,
+    MODELS_DIR,
+    float(os.environ.get("MODEL_FRESHNESS_CHECK_INTERVAL_SEC", "10")),
+)
 
 classifier_dao = Dao(SHARED, MODELS_DIR)
 
@@ -41,6 +75,9 @@ def make_response(status, body, event):
 
 def handler(event, context):
     log.debug(json.dumps(event))
+    if "warmup" in event:
+        # direct invocation, to warm up this function's container
+        return warmup_handler(event["warmup"], context)
     if "queryStringParameters" not in event:
         raise Exception("bad request")
     if (
@@ -59,52 +96,175 @@ def handler(event, context):
         else False
     )
     log.info(f"mentor: {mentor}, question: {question}")
-    relative_path = os.path.join(
-        mentor, "module.classifier.arch.lr_transformer", "model.pkl"
-    )
-    model_file = os.path.join(MODELS_DIR, relative_path)
-    if os.path.exists(model_file):
-        log.debug(f"model file exists {model_file}")
-        modified_time = os.path.getmtime(model_file)
-        utc_mod_time = datetime.utcfromtimestamp(modified_time)
-        log.debug(f"model file modified at {utc_mod_time}")
-        try:
-            r = s3.get_object(
-                Bucket=MODELS_BUCKET, Key=relative_path, IfModifiedSince=utc_mod_time
-            )
-            with open(model_file, "wb") as f:
-                for chunk in r["Body"].iter_chunks(chunk_size=4096):
-                    f.write(chunk)
-            log.debug("model file updated")
-        except botocore.exceptions.ClientError as e:
-            if e.response["Error"]["Code"] != "304":
-                log.error(e)
-                raise e
-            log.debug("model file not updated in s3 since last fetch")
-    else:
-        log.debug(f"fetching {model_file} from s3")
-        os.makedirs(os.path.dirname(model_file), exist_ok=True)
-        try:
-            s3.download_file(MODELS_BUCKET, relative_path, model_file)
-        except botocore.exceptions.ClientError as e:
-            if e.response["Error"]["Code"] != "404":
-                log.error(e)
-                raise e
-            body = {"message": f"No models found for mentor {mentor}."}
-            return make_response(404, body, event)
-        log.debug("model file download completed")
+    if not fetch_model(mentor):
+        body = {"message": f"No models found for mentor {mentor}."}
+        return make_response(404, body, event)
 
     if ping:
         # Just load the mentor and nothing else
-        classifier_dao.find_classifier(mentor, auth_headers)
+        find_classifier(mentor, auth_headers)
         body = {"message": f"Successful ping for mentor: {mentor}."}
         return make_response(200, body, event)
 
-    result = classifier_dao.find_classifier(mentor, auth_headers).evaluate(
-        question, chat_session_id
+    result = find_classifier(mentor, auth_headers).evaluate(question, chat_session_id)
+
+    log.debug(f"embedding cache: {EMBEDDING_CACHE.stats()}")
+    log.debug(f"model freshness: {model_freshness.stats()}")
+    log.debug(f"classifier cache: {classifier_dao.stats()}")
+    log.debug(f"http: {get_http_client().stats()}")
+    body = result_to_body(question, result)
+    response = make_response(200, body, event)
+    flush_feedback()
+    return response
+
+
+def batch_handler(event, context):
+    """
+    Answers many questions for one mentor in a single request:
+    POST {"mentor": "...", "chatsessionid": "...", "questions": ["...", ...]}
+    """
+    log.debug(json.dumps(event))
+    if "warmup" in event:
+        return warmup_handler(event["warmup"], context)
+    request = json_body(
+        event, {"mentor": str, "chatsessionid": str, "questions": List[str]}
+    )
+    if request is None:
+        return make_response(400, {"message": "Bad request."}, event)
+    mentor = request["mentor"]
+    questions = request["questions"]
+    if len(questions) > MAX_BATCH_QUESTIONS:
+        body = {"message": f"At most {MAX_BATCH_QUESTIONS} questions per request."}
+        return make_response(400, body, event)
+    log.info(f"mentor: {mentor}, questions: {len(questions)}")
+    if not fetch_model(mentor):
+        body = {"message": f"No models found for mentor {mentor}."}
+        return make_response(404, body, event)
+    results = find_classifier(mentor, get_auth_headers(event)).evaluate_batch(
+        questions, request["chatsessionid"]
     )
+    body = {
+        "results": [
+            result_to_body(question, result)
+            for question, result in zip(questions, results)
+        ]
+    }
+    response = make_response(200, body, event)
+    flush_feedback()
+    return response
+
 
+def panel_handler(event, context):
+    """
+    Asks a panel of mentors the same question in a single request:
+    POST {"mentors": ["...", ...], "chatsessionid": "...", "question": "..."}
+    The question is encoded once and the feedback of all mentors
+    is recorded with one mutation.
+    """
+    log.debug(json.dumps(event))
+    if "warmup" in event:
+        return warmup_handler(event["warmup"], context)
+    request = json_body(
+        event, {"mentors": List[str], "chatsessionid": str, "question": str}
+    )
+    if request is None:
+        return make_response(400, {"message": "Bad request."}, event)
+    mentors = list(dict.fromkeys(request["mentors"]))
+    question = request["question"]
+    if len(mentors) > MAX_PANEL_MENTORS:
+        body = {"message": f"At most {MAX_PANEL_MENTORS} mentors per request."}
+        return make_response(400, body, event)
+    log.info(f"mentors: {mentors}, question: {question}")
+    missing = [
+        mentor
+        for mentor, found in zip(mentors, panel_executor.map(fetch_model, mentors))
+        if not found
+    ]
+    if missing:
+        body = {"message": f"No models found for mentors {', '.join(missing)}."}
+        return make_response(404, body, event)
+    auth_headers = get_auth_headers(event)
+    classifiers = list(
+        panel_executor.map(
+            lambda mentor: find_classifier(mentor, auth_headers),
+            mentors,
+        )
+    )
+    results = evaluate_panel(
+        classifiers, question, request["chatsessionid"], panel_executor
+    )
     body = {
+        "results": [
+            {"mentor": mentor, **result_to_body(question, result)}
+            for mentor, result in zip(mentors, results)
+        ]
+    }
+    response = make_response(200, body, event)
+    flush_feedback()
+    return response
+
+
+def warmup_handler(event, context):
+    """
+    Preloads many mentors concurrently, e.g. before traffic shifts to new containers.
+    Invoke http_answer directly with {"warmup": {...}}, where {...} is either
+    {"mentors": ["id", ...]} or {"recent": N} (the N most recently trained mentors),
+    optionally with "deadline_sec" and "max_bytes" (default CACHE_MAX_BYTES).
+    """
+    from module.classifier.warmup import deadline_from, recent_mentors, warm_up
+
+    mentors = event.get("mentors") or recent_mentors(
+        s3, MODELS_BUCKET, int(event.get("recent", 0)), classifier_dao.arch
+    )
+    started = time.perf_counter()
+    report = warm_up(
+        classifier_dao,
+        mentors,
+        fetch_model,
+        int(event.get("max_bytes", classifier_dao.max_bytes)),
+        deadline_from(context, event.get("deadline_sec"), WARMUP_DEADLINE_MARGIN_SEC),
+        WARMUP_WORKERS,
+    )
+    result = {
+        "mentors": report,
+        "total_ms": round((time.perf_counter() - started) * 1000),
+        "cache": classifier_dao.stats(),
+    }
+    log.info(json.dumps(result))
+    return result
+
+
+def json_body(event, fields: Dict[str, type]) -> Optional[dict]:
+    """
+    The JSON object in the (optionally base64 encoded) body of a POST event,
+    or None if it is missing, isn't valid JSON or lacks any of the fields
+    (with values of the given types, e.g. str or List[str]).
+    """
+    try:
+        body = event.get("body")
+        if event.get("isBase64Encoded") and body:
+            body = base64.b64decode(body)
+        request = json.loads(body) if body else None
+    except ValueError:
+        return None
+    if not isinstance(request, dict) or any(
+        not _is_instance(request.get(field), t) for field, t in fields.items()
+    ):
+        return None
+    return request
+
+
+def _is_instance(value, t) -> bool:
+    if get_origin(t) is list:
+        (item_type,) = get_args(t)
+        return isinstance(value, list) and all(
+            isinstance(item, item_type) for item in value
+        )
+    return isinstance(value, t)
+
+
+def result_to_body(question: str, result) -> dict:
+    return {
         "question": question,
         "question_id": result.question_id,
         "answer_id": result.answer_id,
@@ -117,8 +277,65 @@ def handler(event, context):
         "classifier": "",
         "answer_missing": result.answer_missing,
     }
-    response = make_response(200, body, event)
-    return response
+
+
+def find_classifier(mentor: str, auth_headers: Dict[str, str]):
+    """
+    Training uploads the files of a model one at a time, so they can be
+    fetched while only some of them are new. If they don't load together
+    (ValueError, without a cached classifier to keep serving),
+    all of them are fetched again and loaded once more.
+    """
+    try:
+        return classifier_dao.find_classifier(mentor, auth_headers)
+    except ValueError as e:
+        log.warning(f"failed to load classifier for {mentor}, refetching: {e}")
+        fetch_model(mentor, force=True)
+        return classifier_dao.find_classifier(mentor, auth_headers)
+
+
+def fetch_model(mentor: str, force: bool = False) -> bool:
+    """
+    Makes sure the latest model for the mentor is in MODELS_DIR.
+    Returns False if there is no model for the mentor in s3.
+    force: check every file now, regardless of when it was last checked.
+    """
+    started = time.perf_counter()
+    model_file = MODEL_FILE_BY_ARCH[classifier_dao.arch]
+    other_files = OTHER_MODEL_FILES[classifier_dao.arch]
+    previous_etag = model_freshness.etag(model_file_path(mentor, model_file))
+    if not fetch_model_file(mentor, model_file, force):
+        return False
+    # Fetched after the model file, so a new download is never older than it,
+    # but concurrently with each other. When the model file changed, they are
+    # checked right away, not when their own interval is up:
+    changed = (
+        force
+        or model_freshness.etag(model_file_path(mentor, model_file)) != previous_etag
+    )
+    list(
+        model_file_executor.map(
+            lambda file_name: fetch_model_file(mentor, file_name, changed),
+            other_files,
+        )
+    )
+    log.debug(f"fetched model files in {(time.perf_counter() - started) * 1000:.0f}ms")
+    etags = [
+        model_freshness.etag(model_file_path(mentor, file_name))
+        for file_name in [model_file, *other_files]
+    ]
+    classifier_dao.set_model_version(
+        mentor, "/".join(str(etag) for etag in etags) if etags[0] else None
+    )
+    return True
+
+
+def model_file_path(mentor: str, file_name: str) -> str:
+    return os.path.join(mentor, classifier_dao.arch, file_name)
+
+
+def fetch_model_file(mentor: str, file_name: str, force: bool = False) -> bool:
+    return model_freshness.fetch(model_file_path(mentor, file_name), force)
 
 
 # # for local debugging:
@@ -6,6 +6,8 @@
 #
 from os import path
 import csv
+import json
+import responses
 from module.types import (
     Mentor,
     MentorQuestion,
@@ -72,6 +74,24 @@ def fixture_path(p: str) -> str:
     return path.abspath(path.join(".", "tests", "fixtures", p))
 
 
+def add_graphql_responses(
+    url, mentor_data: dict, graded_user_questions_data: dict, rsps=responses
+):
+    """
+    Answers the graded user questions query with graded_user_questions_data
+    and any other graphql request with mentor_data,
+    regardless of the order of the requests (mentors query them concurrently).
+    """
+
+    def callback(request):
+        query = json.loads(request.body)["query"]
+        if "query GradedUserQuestions" in query:
+            return (200, {}, json.dumps(graded_user_questions_data))
+        return (200, {}, json.dumps(mentor_data))
+
+    rsps.add_callback(responses.POST, url, callback=callback)
+
+
 def fixture_mentor_data(mentor_id: str, p: str) -> str:
     return fixture_path(path.join("data", mentor_id, p))
 
@@ -5,11 +5,15 @@
 # The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
 #
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from os import path
 from shutil import copytree
 import re
 import responses
 import pytest
+from module.classifier import dao as dao_module
 from module.classifier.dao import Dao
 from module.classifier.arch.lr_transformer import TransformersQuestionClassifierTraining
 from .helpers import fixture_path
@@ -44,3 +48,122 @@ def test_find_classifier_returns_updated_classifier_if_model_has_changed(
     ).train()
     c2 = dao.find_classifier(mentor_id)
     assert c1 != c2
+
+
+@responses.activate
+def test_find_classifier_uses_model_version_without_touching_files(
+    monkeypatch, data_root: str, shared_root: str
+):
+    with open(fixture_path("graphql/clint.json")) as f:
+        data = json.load(f)
+        responses.add(responses.POST, re.compile(".*"), json=data, status=200)
+    dao = Dao(shared_root=shared_root, data_root=data_root)
+    dao.set_model_version("clint", "v1")
+    c1 = dao.find_classifier("clint")
+
+    def no_stat(*args):
+        raise AssertionError("cache hit should not stat the model file")
+
+    monkeypatch.setattr(c1, "get_last_trained_at", no_stat)
+    assert dao.find_classifier("clint") == c1
+    dao.set_model_version("clint", "v2")
+    assert dao.find_classifier("clint") != c1
+    assert dao.stats()["reloads"] == 1
+
+
+@responses.activate
+def test_find_classifier_evicts_least_recently_used_over_byte_budget(
+    tmp_path, data_root: str, shared_root: str
+):
+    with open(fixture_path("graphql/clint.json")) as f:
+        data = json.load(f)
+        responses.add(responses.POST, re.compile(".*"), json=data, status=200)
+    for mentor_id in ["a", "b"]:
+        copytree(path.join(data_root, "clint"), tmp_path / mentor_id)
+    nbytes = Dao(shared_root, str(tmp_path)).find_classifier("a").estimate_nbytes()
+    dao = Dao(shared_root, str(tmp_path), max_bytes=int(nbytes * 1.5))
+    a = dao.find_classifier("a")
+    dao.find_classifier("b")
+    assert dao.stats()["entries"] == 1
+    assert dao.stats()["evictions"] == 1
+    assert dao.stats()["bytes"] <= dao.max_bytes
+    assert dao.find_classifier("a") != a
+
+
+class SlowClassifier:
+    loads = 0
+    release = threading.Event()
+    fail = False
+
+    def __init__(self, mentor_id, *args, **kwargs):
+        self.mentor = None
+        SlowClassifier.loads += 1
+        assert SlowClassifier.release.wait(5)
+        if SlowClassifier.fail:
+            raise ValueError(f"failed to load {mentor_id}")
+
+    def get_last_trained_at(self) -> float:
+        return 0
+
+    def estimate_nbytes(self) -> int:
+        return 1
+
+
+@pytest.fixture
+def slow_classifier(monkeypatch):
+    monkeypatch.setattr(SlowClassifier, "loads", 0)
+    monkeypatch.setattr(SlowClassifier, "release", threading.Event())
+    monkeypatch.setattr(
+        dao_module, "TransformersQuestionClassifierPrediction", SlowClassifier
+    )
+    return SlowClassifier
+
+
+def _find_concurrently(dao: Dao, n: int) -> list:
+    with ThreadPoolExecutor(n) as executor:
+        futures = [executor.submit(dao.find_classifier, "m") for _ in range(n)]
+        while dao.stats()["coalesced"] < n - 1:
+            time.sleep(0.001)
+        SlowClassifier.release.set()
+        return futures
+
+
+def test_find_classifier_coalesces_concurrent_loads(slow_classifier):
+    dao = Dao("", "")
+    futures = _find_concurrently(dao, 4)
+    assert len({id(f.result()) for f in futures}) == 1
+    assert slow_classifier.loads == 1
+    assert dao.stats()["coalesced"] == 3
+
+
+def test_find_classifier_propagates_load_failure_without_caching_it(
+    monkeypatch, slow_classifier
+):
+    monkeypatch.setattr(slow_classifier, "fail", True)
+    dao = Dao("", "")
+    futures = _find_concurrently(dao, 3)
+    for f in futures:
+        with pytest.raises(ValueError):
+            f.result()
+    assert dao.stats()["entries"] == 0
+    monkeypatch.setattr(slow_classifier, "fail", False)
+    assert isinstance(dao.find_classifier("m"), SlowClassifier)
+    assert slow_classifier.loads == 2
+
+
+def test_find_classifier_serves_the_cached_classifier_if_the_new_model_fails_to_load(
+    monkeypatch, slow_classifier
+):
+    slow_classifier.release.set()
+    dao = Dao("", "")
+    dao.set_model_version("m", "1")
+    cached = dao.find_classifier("m")
+    # e.g. a knn.f32 fetched before the knn.json it was written with
+    monkeypatch.setattr(slow_classifier, "fail", True)
+    dao.set_model_version("m", "2")
+    assert dao.find_classifier("m") is cached
+    assert dao.stats()["stale"] == 1
+    monkeypatch.setattr(slow_classifier, "fail", False)
+    assert dao.find_classifier("m") is not cached
+    assert dao.find_classifier("m") is dao.find_classifier("m")
+    assert slow_classifier.loads == 3
@@ -0,0 +1,47 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import numpy
+from module.classifier import embedding_cache
+from module.classifier.embedding_cache import EmbeddingCache
+
+
+def _embedding(value: float, size: int = 4) -> numpy.ndarray:
+    return numpy.full(size, value)
+
+
+def test_stores_read_only_float32_embeddings():
+    cache = EmbeddingCache(1024)
+    cache.set("a", _embedding(1.0))
+    embedding = cache.get("a")
+    assert embedding.dtype == numpy.float32
+    assert not embedding.flags.writeable
+    assert cache.stats()["hits"] == 1
+
+
+def test_evicts_least_recently_used_entries_over_byte_budget():
+    # each entry is 4 float32 (16 bytes) + 1 byte key
+    cache = EmbeddingCache(max_bytes=34)
+    cache.set("a", _embedding(1.0))
+    cache.set("b", _embedding(2.0))
+    cache.get("a")
+    cache.set("c", _embedding(3.0))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 34
+
+
+def test_expires_entries_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: now[0])
+    cache = EmbeddingCache(1024, ttl=60)
+    cache.set("a", _embedding(1.0))
+    now[0] += 61
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["entries"] == 0
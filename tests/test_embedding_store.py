@@ -0,0 +1,68 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import multiprocessing
+
+import numpy
+
+from module.classifier.embedding_store import EmbeddingStore
+
+
+def _embedding(i: int, dim: int = 8) -> numpy.ndarray:
+    return numpy.arange(dim, dtype=numpy.float32) + i
+
+
+def test_returns_none_before_anything_is_stored(tmp_path):
+    assert EmbeddingStore(str(tmp_path), 10).get("what is your name") is None
+
+
+def test_persists_embeddings_across_instances(tmp_path):
+    EmbeddingStore(str(tmp_path), 10).set("what is your name", _embedding(1))
+    store = EmbeddingStore(str(tmp_path), 10)
+    numpy.testing.assert_array_equal(store.get("what is your name"), _embedding(1))
+    assert store.stats()["hits"] == 1
+
+
+def test_overwrites_oldest_rows_when_full(tmp_path):
+    store = EmbeddingStore(str(tmp_path), 3)
+    for i in range(4):
+        store.set(f"question {i}", _embedding(i))
+    assert store.get("question 0") is None
+    for i in range(1, 4):
+        numpy.testing.assert_array_equal(store.get(f"question {i}"), _embedding(i))
+    assert (tmp_path / "vectors.f32").stat().st_size == 3 * 8 * 4
+
+
+def test_sees_rows_written_by_another_instance(tmp_path):
+    reader = EmbeddingStore(str(tmp_path), 3)
+    writer = EmbeddingStore(str(tmp_path), 3)
+    writer.set("question 0", _embedding(0))
+    assert reader.get("question 0") is not None
+    for i in range(1, 4):
+        writer.set(f"question {i}", _embedding(i))
+    # question 0 was overwritten by the other instance
+    assert reader.get("question 0") is None
+    numpy.testing.assert_array_equal(reader.get("question 3"), _embedding(3))
+
+
+def _write_range(directory: str, start: int, end: int):
+    store = EmbeddingStore(directory, 100)
+    for i in range(start, end):
+        store.set(f"question {i}", _embedding(i))
+
+
+def test_concurrent_processes_share_a_store(tmp_path):
+    processes = [
+        multiprocessing.Process(target=_write_range, args=(str(tmp_path), s, s + 40))
+        for s in (0, 40)
+    ]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    store = EmbeddingStore(str(tmp_path), 100)
+    for i in range(80):
+        numpy.testing.assert_array_equal(store.get(f"question {i}"), _embedding(i))
@@ -0,0 +1,168 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import json
+import re
+
+import numpy
+import pytest
+import responses
+
+from module.classifier import encoder
+from module.classifier.embedding_cache import EmbeddingCache
+from module.classifier.arch import mentor_training_data
+from module.classifier.encoder import (
+    CachedQuestionEncoder,
+    LocalQuestionEncoder,
+    RemoteQuestionEncoder,
+    find_or_load_question_encoder,
+)
+from module.mentor import Mentor
+from module.utils import sanitize_string
+from module.classifier.predict import TransformersQuestionClassifierPrediction
+from .helpers import fixture_path
+from .fixtures import sbert_encodings
+
+
+@pytest.fixture(autouse=True)
+def python_path_env(monkeypatch):
+    monkeypatch.setenv("GRAPHQL_ENDPOINT", "http://graphql")
+    monkeypatch.setenv("SBERT_ENDPOINT", "http://sbert")
+    monkeypatch.setattr(encoder, "QUESTION_ENCODERS", {})
+
+
+class _FakeLocalEncoder:
+    def __init__(self, shared_root: str):
+        self.name = "local:fake"
+
+    def encode(self, question: str) -> numpy.ndarray:
+        return numpy.array(sbert_encodings[question])
+
+
+def test_uses_cached_remote_encoder_by_default(shared_root: str):
+    e = find_or_load_question_encoder(shared_root)
+    assert isinstance(e, CachedQuestionEncoder)
+    assert isinstance(e.encoder, RemoteQuestionEncoder)
+
+
+def test_falls_back_to_remote_encoder_if_local_model_fails_to_load(
+    monkeypatch, shared_root: str
+):
+    def fail_to_load(self, shared_root):
+        raise OSError("no model")
+
+    monkeypatch.setenv("LOCAL_ENCODER", "true")
+    monkeypatch.setattr(encoder.LocalQuestionEncoder, "__init__", fail_to_load)
+    e = find_or_load_question_encoder(shared_root)
+    assert isinstance(e.encoder, RemoteQuestionEncoder)
+
+
+class _CountingEncoder(_FakeLocalEncoder):
+    def __init__(self):
+        super().__init__("")
+        self.encoded = []
+
+    def encode(self, question: str) -> numpy.ndarray:
+        self.encoded.append(question)
+        return _embedding(question)
+
+    def encode_batch(self, questions):
+        self.encoded.extend(questions)
+        return numpy.array([_embedding(q) for q in questions])
+
+
+def _embedding(text: str) -> numpy.ndarray:
+    return numpy.random.default_rng(list(text.encode())).normal(size=8)
+
+
+def test_cached_encoder_encodes_each_question_once():
+    counting = _CountingEncoder()
+    cached = CachedQuestionEncoder(counting, EmbeddingCache(1024 * 1024))
+    first = cached.encode("What is your name?")
+    embeddings = cached.encode_batch(
+        ["What is your name?", "Who are you?", "Who are you?", "who are you"]
+    )
+    assert counting.encoded == [
+        "What is your name?",
+        "Who are you?",
+        "who are you",
+    ]
+    numpy.testing.assert_array_equal(embeddings[0], first)
+    numpy.testing.assert_array_equal(embeddings[1], embeddings[2])
+    assert cached.cache.stats()["hits"] == 1
+    assert cached.cache.stats()["misses"] == 4
+
+
+def test_cached_encoder_returns_the_encoding_of_the_question_itself():
+    counting = _CountingEncoder()
+    cached = CachedQuestionEncoder(counting, EmbeddingCache(1024 * 1024))
+    cached.encode("what is your name")
+    numpy.testing.assert_allclose(
+        cached.encode("What is your name?"), _embedding("What is your name?"), rtol=1e-6
+    )
+
+
+@responses.activate
+@pytest.mark.parametrize(
+    "mentor_id,question,expected_answer_id",
+    [("clint", "What's your name?", "62709347a2fa682085cdbd1c")],
+)
+def test_predicts_with_local_encoder_without_calling_sbert(
+    monkeypatch,
+    data_root: str,
+    shared_root: str,
+    mentor_id: str,
+    question: str,
+    expected_answer_id: str,
+):
+    monkeypatch.setenv("LOCAL_ENCODER", "true")
+    monkeypatch.setattr(encoder, "LocalQuestionEncoder", _FakeLocalEncoder)
+    with open(fixture_path("graphql/{}.json".format(mentor_id))) as f:
+        data = json.load(f)
+    # no sbert response registered: any remote encode call would fail the test
+    responses.add(responses.POST, re.compile(".*"), json=data, status=200)
+    classifier = TransformersQuestionClassifierPrediction(
+        mentor_id, data_root, shared_root=shared_root
+    )
+    result = classifier.evaluate(question, "123")
+    assert result.answer_id == expected_answer_id
+
+
+class _FakeTransformerEmbeddings:
+    """
+    A distinct (pseudo random) embedding per text, like the sentence transformer.
+    """
+
+    def __init__(self, shared_root: str):
+        pass
+
+    def get_embeddings(self, data, show_progress_bar: bool = True):
+        return numpy.array([_embedding(text) for text in data])
+
+
+@responses.activate
+def test_local_encoder_encodes_questions_like_training_data(
+    monkeypatch, shared_root: str
+):
+    monkeypatch.setattr(
+        "module.classifier.arch.lr_transformer.embeddings.TransformerEmbeddings",
+        _FakeTransformerEmbeddings,
+    )
+    with open(fixture_path("graphql/clint.json")) as f:
+        data = json.load(f)
+    responses.add(responses.POST, re.compile(".*"), json=data, status=200)
+    mentor = Mentor("clint")
+    x_train, _ = mentor_training_data(mentor)
+    question = "What is your name?"
+    asked = "  WHAT is your name?!"
+    trained = _FakeTransformerEmbeddings("").get_embeddings(x_train)
+    local = LocalQuestionEncoder(shared_root)
+    numpy.testing.assert_array_equal(
+        local.encode(asked), trained[x_train.index(sanitize_string(question))]
+    )
+    numpy.testing.assert_array_equal(
+        local.encode_batch([asked])[0], local.encode(asked)
+    )
@@ -0,0 +1,196 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import json
+import os
+import re
+import threading
+from typing import List, Optional
+
+import responses
+
+from module.api import create_user_questions_or_none
+
+from module import feedback
+from module.feedback import FeedbackRecorder, new_feedback_id
+
+
+class _FakeFlush:
+    def __init__(self, fail: bool = False, reject: List[str] = ()):
+        self.fail = fail
+        self.reject = set(reject)
+        self.batches: List[List[dict]] = []
+        self.flushed = threading.Event()
+
+    def __call__(self, batch: List[dict]) -> List[Optional[str]]:
+        if self.fail:
+            raise Exception("graphql unavailable")
+        self.batches.append(batch)
+        self.flushed.set()
+        return [None if uq["question"] in self.reject else uq["_id"] for uq in batch]
+
+
+def _user_question(i: int) -> dict:
+    return {"mentor": "clint", "question": f"question {i}", "chatSessionId": "123"}
+
+
+def test_feedback_ids_are_unique_object_ids():
+    ids = [new_feedback_id() for _ in range(100)]
+    assert all(re.fullmatch("[0-9a-f]{24}", i) for i in ids)
+    assert len(set(ids)) == len(ids)
+
+
+def test_flushes_queued_records_in_batches(tmp_path):
+    flush = _FakeFlush()
+    recorder = FeedbackRecorder(
+        flush, batch_size=2, spill_dir=str(tmp_path), background=False
+    )
+    ids = [recorder.record(_user_question(i)) for i in range(5)]
+    assert flush.batches == []
+    assert recorder.flush() == 5
+    assert [len(b) for b in flush.batches] == [2, 2, 1]
+    assert [uq["_id"] for b in flush.batches for uq in b] == ids
+
+
+def test_flushes_synchronously_when_queue_is_full(tmp_path):
+    flush = _FakeFlush()
+    recorder = FeedbackRecorder(
+        flush, batch_size=10, max_queue=3, spill_dir=str(tmp_path), background=False
+    )
+    for i in range(3):
+        recorder.record(_user_question(i))
+    assert len(recorder.queue) == 0
+    assert recorder.stats["flushed"] == 3
+
+
+def test_spills_failed_flushes_and_retries_them(tmp_path):
+    flush = _FakeFlush(fail=True)
+    recorder = FeedbackRecorder(
+        flush, batch_size=2, spill_dir=str(tmp_path), background=False
+    )
+    for i in range(3):
+        recorder.record(_user_question(i))
+    assert recorder.flush() == 0
+    assert len(os.listdir(tmp_path)) == 2
+    assert recorder.stats["spilled"] == 3
+    flush.fail = False
+    # a new recorder (e.g. after the process recycled) picks up the spilled records
+    assert (
+        FeedbackRecorder(flush, spill_dir=str(tmp_path), background=False).flush() == 3
+    )
+    assert os.listdir(tmp_path) == []
+
+
+def test_background_thread_flushes_full_batches(tmp_path):
+    flush = _FakeFlush()
+    recorder = FeedbackRecorder(
+        flush, batch_size=2, flush_interval=60, spill_dir=str(tmp_path)
+    )
+    recorder.record(_user_question(0))
+    recorder.record(_user_question(1))
+    assert flush.flushed.wait(timeout=5)
+    assert [len(b) for b in flush.batches] == [2]
+
+
+def _spilled(spill_dir) -> List[dict]:
+    spilled = []
+    for name in sorted(os.listdir(spill_dir)):
+        with open(os.path.join(spill_dir, name)) as f:
+            spilled.append(json.load(f))
+    return spilled
+
+
+def test_respills_only_rejected_records(tmp_path):
+    flush = _FakeFlush(reject=["question 1"])
+    recorder = FeedbackRecorder(
+        flush, batch_size=3, spill_dir=str(tmp_path), background=False
+    )
+    ids = [recorder.record(_user_question(i)) for i in range(3)]
+    assert recorder.flush() == 2
+    assert recorder.stats["rejected"] == 1
+    spilled = _spilled(tmp_path)
+    assert [s["attempts"] for s in spilled] == [1]
+    assert [uq["_id"] for uq in spilled[0]["records"]] == [ids[1]]
+    flush.reject.clear()
+    assert recorder.flush() == 1
+    assert [uq["_id"] for uq in flush.batches[-1]] == [ids[1]]
+    assert os.listdir(tmp_path) == []
+
+
+def test_drops_records_rejected_max_attempts_times(tmp_path):
+    flush = _FakeFlush(reject=["question 0"])
+    recorder = FeedbackRecorder(
+        flush, max_attempts=3, spill_dir=str(tmp_path), background=False
+    )
+    recorder.record(_user_question(0))
+    recorder.record(_user_question(1))
+    assert recorder.flush() == 1
+    assert recorder.flush() == 0
+    assert [s["attempts"] for s in _spilled(tmp_path)] == [2]
+    assert recorder.flush() == 0
+    assert os.listdir(tmp_path) == []
+    assert recorder.stats["dropped"] == 1
+    assert len(flush.batches) == 3
+
+
+def test_unsent_batch_doesnt_count_as_an_attempt(tmp_path):
+    flush = _FakeFlush(reject=["question 0"])
+    recorder = FeedbackRecorder(flush, spill_dir=str(tmp_path), background=False)
+    recorder.record(_user_question(0))
+    recorder.flush()
+    flush.fail = True
+    for _ in range(3):
+        assert recorder.flush() == 0
+    assert [s["attempts"] for s in _spilled(tmp_path)] == [1]
+
+
+def test_flush_feedback_writes_records_not_yet_due(monkeypatch, tmp_path):
+    flush = _FakeFlush()
+    recorder = FeedbackRecorder(
+        flush, flush_interval=60, spill_dir=str(tmp_path), background=False
+    )
+    monkeypatch.setattr(feedback, "_recorder", recorder)
+    feedback_id = recorder.record(_user_question(0))
+    assert recorder.flush_due() == 0
+    # at the end of the invocation, the container may never be thawed again
+    feedback.flush_feedback()
+    assert [[uq["_id"] for uq in b] for b in flush.batches] == [[feedback_id]]
+    assert os.listdir(tmp_path) == []
+
+
+def test_counts_records_created_with_other_ids(tmp_path):
+    recorder = FeedbackRecorder(
+        lambda batch: [uq["_id"] if i else "server-id" for i, uq in enumerate(batch)],
+        spill_dir=str(tmp_path),
+        background=False,
+    )
+    recorder.record(_user_question(0))
+    recorder.record(_user_question(1))
+    assert recorder.flush() == 2
+    assert recorder.stats["mismatched"] == 1
+
+
+def test_feedback_id_counter_wraps_to_three_bytes(monkeypatch):
+    monkeypatch.setattr(feedback, "_object_id_counter", iter([0xFFFFFF, 0x1000000]))
+    assert [new_feedback_id()[-6:] for _ in range(2)] == ["ffffff", "000000"]
+
+
+@responses.activate
+def test_partial_graphql_errors_return_none_for_rejected_records(monkeypatch):
+    monkeypatch.setenv("GRAPHQL_ENDPOINT", "http://graphql")
+    responses.add(
+        responses.POST,
+        "http://graphql",
+        json={
+            "data": {"q0": {"_id": "a"}, "q1": None, "q2": {"_id": "c"}},
+            "errors": [{"message": "invalid", "path": ["q1"]}],
+        },
+    )
+    assert create_user_questions_or_none([_user_question(i) for i in range(3)]) == [
+        "a",
+        None,
+        "c",
+    ]
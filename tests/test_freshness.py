@@ -0,0 +1,144 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import os
+
+import pytest
+from botocore.exceptions import ClientError
+
+from module.classifier import freshness
+from module.classifier.freshness import ModelFreshnessChecker
+
+
+class Body:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def iter_chunks(self, chunk_size: int):
+        yield self.data
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+        self.requests = []
+
+    def put(self, key: str, data: bytes, etag: str):
+        self.objects[key] = (data, etag)
+
+    def get_object(self, Bucket: str, Key: str, **conditions):
+        self.requests.append((Key, conditions))
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        data, etag = self.objects[Key]
+        if conditions.get("IfNoneMatch") == etag:
+            raise ClientError(
+                {
+                    "Error": {"Code": "304"},
+                    "ResponseMetadata": {"HTTPHeaders": {"etag": etag}},
+                },
+                "GetObject",
+            )
+        return {"Body": Body(data), "ETag": etag}
+
+
+@pytest.fixture
+def now(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(freshness.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_rechecks_files_only_after_interval(tmp_path, now):
+    s3 = FakeS3()
+    s3.put("m/model.pkl", b"v1", '"1"')
+    checker = ModelFreshnessChecker(s3, "bucket", str(tmp_path), interval=10)
+    assert checker.fetch("m/model.pkl")
+    assert checker.fetch("m/model.pkl")
+    assert len(s3.requests) == 1
+    s3.put("m/model.pkl", b"v2", '"2"')
+    now[0] += 5
+    checker.fetch("m/model.pkl")
+    assert _read(tmp_path / "m" / "model.pkl") == b"v1"
+    now[0] += 5
+    checker.fetch("m/model.pkl")
+    assert _read(tmp_path / "m" / "model.pkl") == b"v2"
+    assert s3.requests[-1] == ("m/model.pkl", {"IfNoneMatch": '"1"'})
+    assert checker.etag("m/model.pkl") == '"2"'
+    assert checker.stats() == {
+        "files": 1,
+        "skipped": 2,
+        "not_modified": 0,
+        "downloads": 2,
+        "not_found": 0,
+    }
+
+
+def test_uses_etag_kept_next_to_file_by_another_process(tmp_path, now):
+    s3 = FakeS3()
+    s3.put("m/model.pkl", b"v1", '"1"')
+    ModelFreshnessChecker(s3, "bucket", str(tmp_path)).fetch("m/model.pkl")
+    checker = ModelFreshnessChecker(s3, "bucket", str(tmp_path))
+    assert checker.fetch("m/model.pkl")
+    assert s3.requests[-1] == ("m/model.pkl", {"IfNoneMatch": '"1"'})
+    assert checker.stats()["not_modified"] == 1
+
+
+def test_removes_local_file_deleted_from_s3(tmp_path, now):
+    s3 = FakeS3()
+    s3.put("m/model.bin", b"v1", '"1"')
+    checker = ModelFreshnessChecker(s3, "bucket", str(tmp_path), interval=0)
+    assert checker.fetch("m/model.bin")
+    del s3.objects["m/model.bin"]
+    assert not checker.fetch("m/model.bin")
+    assert not os.path.exists(tmp_path / "m" / "model.bin")
+    assert checker.stats()["not_found"] == 1
+
+
+def test_rechecks_missing_files_only_after_interval(tmp_path, now):
+    s3 = FakeS3()
+    checker = ModelFreshnessChecker(s3, "bucket", str(tmp_path), interval=10)
+    assert not checker.fetch("m/model.bin")
+    assert not checker.fetch("m/model.bin")
+    assert len(s3.requests) == 1
+    s3.put("m/model.bin", b"v1", '"1"')
+    now[0] += 10
+    assert checker.fetch("m/model.bin")
+    assert s3.requests[-1] == ("m/model.bin", {})
+    assert checker.stats()["skipped"] == 1
+
+
+def test_forced_fetch_checks_before_interval(tmp_path, now):
+    s3 = FakeS3()
+    s3.put("m/model.pkl", b"v1", '"1"')
+    checker = ModelFreshnessChecker(s3, "bucket", str(tmp_path), interval=10)
+    assert checker.fetch("m/model.pkl")
+    s3.put("m/model.pkl", b"v2", '"2"')
+    assert checker.fetch("m/model.pkl", force=True)
+    assert _read(tmp_path / "m" / "model.pkl") == b"v2"
+
+
+def test_skipped_checks_dont_touch_the_file_system(tmp_path, now, monkeypatch):
+    s3 = FakeS3()
+    s3.put("m/model.pkl", b"v1", '"1"')
+    checker = ModelFreshnessChecker(s3, "bucket", str(tmp_path), interval=10)
+    assert checker.fetch("m/model.pkl")
+    assert not checker.fetch("m/model.bin")
+
+    def no_file_system(*args, **kwargs):
+        raise AssertionError("file system accessed")
+
+    monkeypatch.setattr(freshness.os.path, "exists", no_file_system)
+    monkeypatch.setattr("builtins.open", no_file_system)
+    assert checker.fetch("m/model.pkl")
+    assert not checker.fetch("m/model.bin")
+    assert checker.etag("m/model.pkl") == '"1"'
+    assert checker.stats()["skipped"] == 2
@@ -0,0 +1,91 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import random
+
+import pytest
+
+from module.fuzzy_match import (
+    FuzzyQuestionIndex,
+    get_fuzzy_match_threshold,
+    trigrams,
+)
+from module.utils import sanitize_string
+
+QUESTIONS = {
+    sanitize_string(text): answer
+    for text, answer in [
+        ("What is your name?", "name"),
+        ("Who are you?", "name"),
+        ("Where did you grow up?", "hometown"),
+        ("What do you do for a living?", "job"),
+    ]
+}
+
+
+@pytest.mark.parametrize(
+    "question,expected_answer",
+    [
+        ("Waht is your name?", "name"),
+        ("What is name?", "name"),
+        ("your name is what", "name"),
+        ("Were did you grow up", "hometown"),
+        ("what do you do for living", "job"),
+    ],
+)
+def test_finds_near_matches(question: str, expected_answer: str):
+    index = FuzzyQuestionIndex(QUESTIONS)
+    answer, similarity = index.find(sanitize_string(question), 0.7)
+    assert answer == expected_answer
+    assert 0.7 <= similarity < 1.0
+
+
+@pytest.mark.parametrize(
+    "question", ["Tell me about your family", "", "What is your favorite color?"]
+)
+def test_finds_nothing_below_threshold(question: str):
+    assert FuzzyQuestionIndex(QUESTIONS).find(sanitize_string(question), 0.8) is None
+
+
+def test_finds_nothing_when_equally_similar_texts_have_different_answers():
+    index = FuzzyQuestionIndex({"abcd": "a", "abce": "b"})
+    assert index.find("abcf", 0.1) is None
+
+
+def test_threshold_is_disabled_by_default(monkeypatch):
+    monkeypatch.delenv("FUZZY_MATCH_THRESHOLD", raising=False)
+    assert get_fuzzy_match_threshold() == 0
+    monkeypatch.setenv("FUZZY_MATCH_THRESHOLD", "not a number")
+    assert get_fuzzy_match_threshold() == 0
+    monkeypatch.setenv("FUZZY_MATCH_THRESHOLD", "0.9")
+    assert get_fuzzy_match_threshold() == 0.9
+
+
+def test_finds_the_same_matches_as_scoring_every_text():
+    words = ["what", "is", "your", "name", "where", "did", "you", "grow", "up"]
+    rng = random.Random(0)
+    texts = {
+        " ".join(rng.choice(words) for _ in range(rng.randint(2, 6))): i % 7
+        for i in range(300)
+    }
+    index = FuzzyQuestionIndex(texts)
+
+    def scan(text: str, threshold: float):
+        grams = trigrams(text)
+        scores = {
+            t: 2 * len(grams & trigrams(t)) / (len(grams) + len(trigrams(t)))
+            for t in texts
+        }
+        best_score = max(scores.values())
+        values = {texts[t] for t, score in scores.items() if score == best_score}
+        if best_score < threshold or len(values) > 1:
+            return None
+        return values.pop(), best_score
+
+    for _ in range(50):
+        question = " ".join(rng.choice(words) for _ in range(rng.randint(2, 6)))
+        for threshold in [0.5, 0.7, 0.85]:
+            assert index.find(question, threshold) == scan(question, threshold)
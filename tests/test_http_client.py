@@ -0,0 +1,61 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import pytest
+import requests
+import responses
+
+from module import http_client
+from module.http_client import HttpClient
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(http_client.time, "sleep", lambda s: None)
+
+
+@responses.activate
+def test_retries_idempotent_requests():
+    responses.add(responses.GET, "http://sbert/encode", status=503)
+    responses.add(responses.GET, "http://sbert/encode", json={"ok": True})
+    client = HttpClient(retries=2)
+    res = client.get("sbert_encode", "http://sbert/encode")
+    assert res.json() == {"ok": True}
+    assert len(responses.calls) == 2
+    stats = client.stats()["sbert_encode"]
+    assert stats["calls"] == 1
+    assert stats["retries"] == 1
+    assert stats["errors"] == 0
+
+
+@responses.activate
+def test_gives_up_after_max_retries():
+    responses.add(
+        responses.GET,
+        "http://sbert/encode",
+        body=requests.ConnectionError("connection refused"),
+    )
+    client = HttpClient(retries=2)
+    with pytest.raises(requests.ConnectionError):
+        client.get("sbert_encode", "http://sbert/encode")
+    assert len(responses.calls) == 3
+    assert client.stats()["sbert_encode"]["errors"] == 1
+
+
+@responses.activate
+def test_does_not_retry_non_idempotent_requests():
+    responses.add(responses.POST, "http://graphql/", status=503)
+    client = HttpClient(retries=2)
+    res = client.post("graphql_mutation", "http://graphql/", json={})
+    assert res.status_code == 503
+    assert len(responses.calls) == 1
+    assert client.stats()["graphql_mutation"]["errors"] == 1
+
+
+def test_keeps_one_session_per_host():
+    client = HttpClient()
+    assert client.session("http://a/x") is client.session("http://a/y?q=1")
+    assert client.session("http://a/x") is not client.session("http://b/x")
@@ -0,0 +1,133 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import os
+
+import numpy
+import pytest
+
+from module.classifier.ivf import IvfIndex, build_ivf, exact_search, ivf_recall_at_1
+from module.classifier.knn import (
+    KNN_IVF_FILE,
+    NearestNeighborScorer,
+    append_knn_index,
+    knn_rows_to_add,
+    load_knn_scorer,
+    normalize_rows,
+    save_knn_index,
+)
+
+
+def _clustered(n_clusters: int = 50, per_cluster: int = 40, dim: int = 64):
+    rng = numpy.random.default_rng(0)
+    centers = rng.normal(size=(n_clusters, dim))
+    labels = numpy.repeat(numpy.arange(n_clusters), per_cluster)
+    x = centers[labels] + rng.normal(scale=0.3, size=(len(labels), dim))
+    return normalize_rows(x), [f"answer{i}" for i in labels]
+
+
+def test_builds_lists_of_all_rows():
+    embeddings, _ = _clustered()
+    centroids, order, offsets = build_ivf(embeddings, n_lists=20)
+    assert centroids.shape == (20, embeddings.shape[1])
+    assert sorted(order) == list(range(len(embeddings)))
+    assert offsets[0] == 0 and offsets[-1] == len(embeddings)
+    assert all(numpy.diff(offsets) >= 0)
+
+
+def test_probing_every_list_is_exact_search():
+    embeddings, _ = _clustered()
+    centroids, order, offsets = build_ivf(embeddings, n_lists=20)
+    embeddings = embeddings[order]
+    queries = embeddings[:50] + 0.1
+    ids, similarities = IvfIndex(embeddings, centroids, offsets, 20).search(
+        normalize_rows(queries), 3
+    )
+    _, exact_similarities = exact_search(embeddings, normalize_rows(queries), 3)
+    numpy.testing.assert_allclose(
+        numpy.sort(similarities, axis=1),
+        numpy.sort(exact_similarities, axis=1),
+        rtol=1e-5,
+    )
+    assert ivf_recall_at_1(IvfIndex(embeddings, centroids, offsets, 20)) == 1.0
+
+
+def test_ivf_index_is_built_and_used_above_min_rows(monkeypatch, tmp_path):
+    monkeypatch.setenv("KNN_IVF_MIN_ROWS", "1000")
+    monkeypatch.setenv("KNN_IVF_PROBES", "4")
+    embeddings, labels = _clustered()
+    model_dir = str(tmp_path)
+    recall = save_knn_index(model_dir, embeddings, labels)
+    assert recall is not None and recall > 0.9
+    assert os.path.exists(os.path.join(model_dir, KNN_IVF_FILE))
+    scorer = load_knn_scorer(model_dir)
+    assert scorer.ivf is not None
+    queries = embeddings[::7] + numpy.random.default_rng(1).normal(
+        scale=0.1, size=embeddings[::7].shape
+    )
+    exact = NearestNeighborScorer(embeddings, labels)
+    class_indices, _ = scorer.score(queries)
+    exact_class_indices, _ = exact.score(queries)
+    agreement = numpy.mean(
+        scorer.classes[class_indices] == exact.classes[exact_class_indices]
+    )
+    assert agreement > 0.95
+    # appended rows are always scanned
+    append_knn_index(model_dir, [numpy.ones(embeddings.shape[1])], ["appended"])
+    scorer = load_knn_scorer(model_dir, k=1)
+    assert scorer.ivf is not None
+    class_indices, confidences = scorer.score([numpy.ones(embeddings.shape[1])])
+    assert scorer.classes[class_indices[0]] == "appended"
+    assert confidences[0] == pytest.approx(1.0)
+    # exact search below the configured row count
+    monkeypatch.setenv("KNN_IVF_MIN_ROWS", "5000")
+    assert load_knn_scorer(model_dir).ivf is None
+
+
+def test_no_ivf_index_below_min_rows(monkeypatch, tmp_path):
+    monkeypatch.setenv("KNN_IVF_MIN_ROWS", "5000")
+    embeddings, labels = _clustered()
+    assert save_knn_index(str(tmp_path), embeddings, labels) is None
+    assert not os.path.exists(os.path.join(str(tmp_path), KNN_IVF_FILE))
+    assert load_knn_scorer(str(tmp_path)).ivf is None
+
+
+def test_removes_ivf_index_of_a_larger_index(monkeypatch, tmp_path):
+    monkeypatch.setenv("KNN_IVF_MIN_ROWS", "1000")
+    embeddings, labels = _clustered()
+    model_dir = str(tmp_path)
+    save_knn_index(model_dir, embeddings, labels)
+    assert os.path.exists(os.path.join(model_dir, KNN_IVF_FILE))
+    save_knn_index(model_dir, embeddings[:500], labels[:500])
+    assert not os.path.exists(os.path.join(model_dir, KNN_IVF_FILE))
+
+
+def test_rows_past_the_ivf_lists_are_bounded(monkeypatch, tmp_path):
+    monkeypatch.setenv("KNN_IVF_MIN_ROWS", "1000")
+    embeddings, labels = _clustered()
+    keys = [str(i) for i in range(len(labels))]
+    model_dir = str(tmp_path)
+    save_knn_index(model_dir, embeddings[:1000], labels[:1000], keys[:1000])
+    # up to KNN_MAX_APPENDED_FRACTION of the indexed rows are appended
+    assert knn_rows_to_add(model_dir, keys[:1100], labels[:1100]) == list(
+        range(1000, 1100)
+    )
+    assert knn_rows_to_add(model_dir, keys[:1101], labels[:1101]) is None
+    # the first ivf index is built by retraining
+    save_knn_index(model_dir, embeddings[:999], labels[:999], keys[:999])
+    assert knn_rows_to_add(model_dir, keys[:999], labels[:999]) == []
+    assert knn_rows_to_add(model_dir, keys[:1000], labels[:1000]) is None
+
+
+def test_rejects_ivf_not_written_along_with_the_index(monkeypatch, tmp_path):
+    monkeypatch.setenv("KNN_IVF_MIN_ROWS", "1000")
+    embeddings, labels = _clustered()
+    model_dir = str(tmp_path)
+    save_knn_index(model_dir, embeddings, labels)
+    centroids = numpy.fromfile(os.path.join(model_dir, KNN_IVF_FILE), numpy.float32)
+    (centroids + 1).tofile(os.path.join(model_dir, KNN_IVF_FILE))
+    with pytest.raises(ValueError):
+        load_knn_scorer(model_dir)
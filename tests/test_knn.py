@@ -0,0 +1,203 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import json
+import os
+import zlib
+from typing import List
+
+import numpy
+import pytest
+import responses
+
+from module.classifier import ARCH_KNN_TRANSFORMER, mentor_model_path
+from module.classifier.arch.knn_transformer import KnnQuestionClassifierTraining
+from module.classifier.knn import (
+    KNN_EMBEDDINGS_FILE,
+    NearestNeighborScorer,
+    append_knn_index,
+    knn_rows_to_add,
+    load_knn_scorer,
+    save_knn_index,
+)
+from module.classifier.predict import TransformersQuestionClassifierPrediction
+from module.utils import sanitize_string
+from .fixtures import sbert_encodings
+from .helpers import add_graphql_responses, fixture_path
+
+NAME_ANSWER_ID = "62709347a2fa682085cdbd1c"
+AGE_ANSWER_ID = "62709347a2fa682085cdbd43"
+
+
+class FakeEmbeddings:
+    """
+    The sbert fixture encodings for the questions they cover
+    and a (nearly orthogonal) pseudo random vector for any other.
+    """
+
+    def __init__(self, shared_root: str = ""):
+        self.encodings = {
+            sanitize_string(q): numpy.asarray(e, dtype=numpy.float32)
+            for q, e in sbert_encodings.items()
+        }
+
+    def get_embeddings(self, data: List[str], show_progress_bar: bool = True):
+        return numpy.stack([self.__encode(text) for text in data])
+
+    def __encode(self, text: str):
+        if text in self.encodings:
+            return self.encodings[text]
+        rng = numpy.random.default_rng(zlib.crc32(text.encode()))
+        return rng.normal(size=768).astype(numpy.float32)
+
+
+@pytest.fixture(autouse=True)
+def env(monkeypatch):
+    monkeypatch.setenv("GRAPHQL_ENDPOINT", "http://graphql")
+    monkeypatch.setenv("SBERT_ENDPOINT", "http://sbert")
+    monkeypatch.setattr(
+        "module.classifier.arch.knn_transformer.train.TransformerEmbeddings",
+        FakeEmbeddings,
+    )
+
+
+def _add_clint_responses():
+    with open(fixture_path("graphql/clint.json")) as f:
+        mentor_data = json.load(f)
+    with open(fixture_path("graphql/clint_graded_user_questions.json")) as f:
+        graded_user_questions_data = json.load(f)
+    add_graphql_responses("http://graphql", mentor_data, graded_user_questions_data)
+
+
+def test_neighbors_vote_for_an_answer():
+    embeddings = numpy.array(
+        [[1, 0, 0], [0.9, 0.1, 0], [0, 1, 0], [0, 0.9, 0.1], [0, 0.8, 0.2]],
+        dtype=numpy.float32,
+    )
+    labels = ["a", "a", "b", "b", "b"]
+    scorer = NearestNeighborScorer(embeddings, labels, k=3)
+    class_indices, confidences = scorer.score([[1, 0.05, 0], [0.1, 1, 0]])
+    assert list(scorer.classes[class_indices]) == ["a", "b"]
+    # the confidence is the similarity of the closest neighbor of the answer
+    assert confidences[0] == pytest.approx(0.9988, abs=1e-4)
+    assert confidences[1] == pytest.approx(0.9950, abs=1e-4)
+    # two weaker neighbors can outvote a single closer one
+    class_indices, _ = NearestNeighborScorer(embeddings, labels, k=5).score(
+        [[0.7, 0.7, 0]]
+    )
+    assert scorer.classes[class_indices[0]] == "b"
+
+
+def test_appended_rows_are_visible_after_the_index_is_written(tmp_path):
+    model_dir = str(tmp_path)
+    save_knn_index(model_dir, [[1, 0], [0, 1]], ["a", "b"])
+    assert load_knn_scorer(model_dir).embeddings.shape == (2, 2)
+    append_knn_index(model_dir, [[1, 1]], ["c"])
+    scorer = load_knn_scorer(model_dir, k=1)
+    assert list(scorer.classes) == ["a", "b", "c"]
+    class_indices, confidences = scorer.score([[2, 2]])
+    assert scorer.classes[class_indices[0]] == "c"
+    assert confidences[0] == pytest.approx(1.0)
+    with pytest.raises(ValueError):
+        append_knn_index(model_dir, [[1, 1, 1]], ["d"])
+    # rows past the end of the index (an interrupted append) are ignored
+    with open(os.path.join(model_dir, KNN_EMBEDDINGS_FILE), "ab") as f:
+        f.write(numpy.ones(2, dtype=numpy.float32).tobytes())
+    assert load_knn_scorer(model_dir).embeddings.shape == (3, 2)
+
+
+def test_rejects_embeddings_not_written_along_with_the_index(tmp_path):
+    save_knn_index(str(tmp_path / "old"), [[1, 0], [0, 1]], ["a", "b"])
+    save_knn_index(str(tmp_path / "new"), [[0, 1], [1, 0]], ["a", "b"])
+    # e.g. the knn.json of a new training next to the knn.f32 of the old one
+    os.replace(
+        tmp_path / "old" / KNN_EMBEDDINGS_FILE, tmp_path / "new" / KNN_EMBEDDINGS_FILE
+    )
+    with pytest.raises(ValueError):
+        load_knn_scorer(str(tmp_path / "new"))
+
+
+@responses.activate
+def test_trains_and_predicts_with_nearest_neighbors(tmp_path, shared_root: str):
+    _add_clint_responses()
+    data_root = str(tmp_path)
+    result = KnnQuestionClassifierTraining("clint", shared_root, data_root).train()
+    assert result.model_path == mentor_model_path(
+        data_root, "clint", ARCH_KNN_TRANSFORMER
+    )
+    assert result.accuracy > 0.95
+    question = "What's your name?"
+    responses.add(
+        responses.GET,
+        "http://sbert/encode",
+        json={"query": question, "encoding": sbert_encodings[question]},
+        status=200,
+    )
+    classifier = TransformersQuestionClassifierPrediction(
+        "clint", data_root, arch=ARCH_KNN_TRANSFORMER
+    )
+    result = classifier.evaluate(question, "123")
+    assert result.answer_id == NAME_ANSWER_ID
+    assert result.highest_confidence > 0.8
+
+
+def _train_clint(
+    data_root: str, shared_root: str, mentor_data: dict, embedded: List[str] = None
+) -> KnnQuestionClassifierTraining:
+    with open(fixture_path("graphql/clint_graded_user_questions.json")) as f:
+        graded_user_questions_data = json.load(f)
+    with responses.RequestsMock(assert_all_requests_are_fired=False) as rsps:
+        add_graphql_responses(
+            "http://graphql", mentor_data, graded_user_questions_data, rsps
+        )
+        training = KnnQuestionClassifierTraining("clint", shared_root, data_root)
+        if embedded is not None:
+            get_embeddings = training.transformer.get_embeddings
+            training.transformer.get_embeddings = lambda data, **kwargs: (
+                embedded.extend(data) or get_embeddings(data, **kwargs)
+            )
+        training.train()
+    return training
+
+
+def test_retraining_appends_new_paraphrases(tmp_path, shared_root: str):
+    with open(fixture_path("graphql/clint.json")) as f:
+        mentor_data = json.load(f)
+    training = _train_clint(str(tmp_path), shared_root, mentor_data)
+    rows = load_knn_scorer(training.model_path).embeddings.shape[0]
+    answer = next(
+        a for a in mentor_data["data"]["mentor"]["answers"] if a["_id"] == AGE_ANSWER_ID
+    )
+    answer["question"]["paraphrases"].append("How old are you now?")
+    embedded = []
+    training = _train_clint(str(tmp_path), shared_root, mentor_data, embedded)
+    assert embedded == [sanitize_string("How old are you now?")]
+    scorer = load_knn_scorer(training.model_path, k=1)
+    assert scorer.embeddings.shape[0] == rows + 1
+    class_indices, confidences = scorer.score([sbert_encodings["How old are you now?"]])
+    assert scorer.classes[class_indices[0]] == AGE_ANSWER_ID
+    assert confidences[0] == pytest.approx(1.0, abs=1e-5)
+    # without the paraphrase, the index (with a row not in the training data)
+    # is rebuilt
+    answer["question"]["paraphrases"].pop()
+    embedded = []
+    training = _train_clint(str(tmp_path), shared_root, mentor_data, embedded)
+    assert len(embedded) == rows
+    assert load_knn_scorer(training.model_path).embeddings.shape[0] == rows
+
+
+def test_rows_to_add(tmp_path):
+    model_dir = str(tmp_path)
+    assert knn_rows_to_add(model_dir, ["x"], ["a"]) is None
+    save_knn_index(model_dir, [[1, 0], [0, 1]], ["a", "b"], ["x", "y"])
+    assert knn_rows_to_add(model_dir, ["y", "z", "x"], ["b", "a", "a"]) == [1]
+    assert knn_rows_to_add(model_dir, ["x", "y"], ["a", "b"]) == []
+    # a row removed, or moved to another answer
+    assert knn_rows_to_add(model_dir, ["x", "z"], ["a", "a"]) is None
+    assert knn_rows_to_add(model_dir, ["x", "y"], ["a", "a"]) is None
+    # an index without keys can't be appended to by training
+    save_knn_index(model_dir, [[1, 0], [0, 1]], ["a", "b"])
+    assert knn_rows_to_add(model_dir, ["x", "y"], ["a", "b"]) is None
@@ -4,11 +4,23 @@
 #
 # The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
 #
+import copy
 import json
+import os
+import shutil
+import threading
 import responses
 import pytest
-from module.mentor import Mentor
-from .helpers import fixture_path
+from module.classifier import ARCH_LR_TRANSFORMER, mentor_model_path
+from module.classifier.predict import TransformersQuestionClassifierPrediction
+from module.mentor import (
+    MENTOR_BUNDLE,
+    Mentor,
+    load_mentor_bundle,
+    save_mentor_bundle,
+)
+from module.utils import file_hash, sanitize_string
+from .helpers import add_graphql_responses, fixture_path
 import re
 
 
@@ -24,10 +36,7 @@ def test_loads_mentor_from_api(mentor_id, expected_data_file):
         graded_user_questions_data = json.load(f)
     with open(fixture_path("graphql/{}.json".format(expected_data_file))) as f:
         expected_data = json.load(f)
-    responses.add(responses.POST, re.compile(".*"), json=data, status=200)
-    responses.add(
-        responses.POST, re.compile(".*"), json=graded_user_questions_data, status=200
-    )
+    add_graphql_responses(re.compile(".*"), data, graded_user_questions_data)
     m = Mentor(mentor_id)
     assert m.id == mentor_id
     assert m.topics == expected_data["topics"]
@@ -35,3 +44,143 @@ def test_loads_mentor_from_api(mentor_id, expected_data_file):
     assert m.questions_by_id == expected_data["questions_by_id"]
     assert m.questions_by_text == expected_data["questions_by_text"]
     assert m.questions_by_answer == expected_data["questions_by_answer"]
+
+
+def _load_clint() -> Mentor:
+    with open(fixture_path("graphql/clint.json")) as f:
+        data = json.load(f)
+    with open(fixture_path("graphql/clint_graded_user_questions.json")) as f:
+        graded_user_questions_data = json.load(f)
+    with responses.RequestsMock() as rsps:
+        add_graphql_responses(re.compile(".*"), data, graded_user_questions_data, rsps)
+        return Mentor("clint")
+
+
+def test_round_trips_mentor_bundle(tmp_path):
+    m = _load_clint()
+    bundle_file = str(tmp_path / MENTOR_BUNDLE)
+    save_mentor_bundle(bundle_file, m)
+    loaded = load_mentor_bundle(bundle_file)
+    for attr in [
+        "id",
+        "topics",
+        "utterances_by_type",
+        "questions_by_id",
+        "questions_by_text",
+        "questions_by_answer",
+        "answer_id_by_answer",
+    ]:
+        assert getattr(loaded, attr) == getattr(m, attr)
+    # questions shared by the indexes are still shared
+    q = next(iter(loaded.questions_by_id.values()))
+    assert loaded.questions_by_text[sanitize_string(q["question_text"])] is q
+
+
+def test_rejects_unknown_bundle_version():
+    with pytest.raises(ValueError):
+        Mentor.from_bundle({"version": 0})
+
+
+@responses.activate
+def test_classifier_loads_mentor_from_bundle_unless_trained_with_another_model(
+    tmp_path, data_root: str, shared_root: str
+):
+    shutil.copytree(os.path.join(data_root, "clint"), tmp_path / "clint")
+    bundle_file = mentor_model_path(
+        str(tmp_path), "clint", ARCH_LR_TRANSFORMER, MENTOR_BUNDLE
+    )
+    model_file = mentor_model_path(
+        str(tmp_path), "clint", ARCH_LR_TRANSFORMER, "model.pkl"
+    )
+    save_mentor_bundle(bundle_file, _load_clint(), file_hash(model_file))
+    # no graphql responses registered: any query would fail
+    classifier = TransformersQuestionClassifierPrediction(
+        "clint", str(tmp_path), shared_root=shared_root
+    )
+    assert classifier.mentor.questions_by_id
+    # copied to a new container: mtimes change, the hash doesn't
+    os.utime(model_file, (0, 0))
+    TransformersQuestionClassifierPrediction(
+        "clint", str(tmp_path), shared_root=shared_root
+    )
+    save_mentor_bundle(bundle_file, _load_clint(), "0" * 64)
+    with open(fixture_path("graphql/clint.json")) as f:
+        responses.add(responses.POST, re.compile(".*"), json=json.load(f))
+    TransformersQuestionClassifierPrediction(
+        "clint", str(tmp_path), shared_root=shared_root
+    )
+    assert len(responses.calls) == 2
+
+
+def test_refresh_reindexes_only_changed_entries():
+    with open(fixture_path("graphql/clint.json")) as f:
+        data = json.load(f)
+    with open(fixture_path("graphql/clint_graded_user_questions.json")) as f:
+        graded_user_questions_data = json.load(f)
+    m = _load_clint()
+    changed = copy.deepcopy(data)
+    answer = next(
+        a
+        for a in changed["data"]["mentor"]["answers"]
+        if a["question"]["type"] != "UTTERANCE" and a["status"] == "COMPLETE"
+    )
+    answer["question"]["paraphrases"].append("A brand new paraphrase?")
+    with responses.RequestsMock() as rsps:
+        add_graphql_responses(
+            re.compile(".*"), changed, graded_user_questions_data, rsps
+        )
+        stats = m.refresh()
+    assert stats["answers_reindexed"] == 1
+    assert stats["graded_user_questions_reindexed"] == 0
+    assert stats["graded_user_questions"] > 0
+    q = m.questions_by_text[sanitize_string("A brand new paraphrase?")]
+    assert q["answer_id"] == answer["_id"]
+
+
+def test_classifier_refreshes_a_copy_of_the_previous_mentor(
+    data_root: str, shared_root: str
+):
+    with open(fixture_path("graphql/clint.json")) as f:
+        data = json.load(f)
+    with open(fixture_path("graphql/clint_graded_user_questions.json")) as f:
+        graded_user_questions_data = json.load(f)
+    previous = _load_clint()
+    previous_questions = previous.questions_by_text
+    answer = next(
+        a
+        for a in data["data"]["mentor"]["answers"]
+        if a["question"]["type"] != "UTTERANCE" and a["status"] == "COMPLETE"
+    )
+    answer["question"]["paraphrases"].append("A brand new paraphrase?")
+    with responses.RequestsMock() as rsps:
+        add_graphql_responses(re.compile(".*"), data, graded_user_questions_data, rsps)
+        classifier = TransformersQuestionClassifierPrediction(
+            "clint", data_root, shared_root=shared_root, previous_mentor=previous
+        )
+    assert classifier.mentor is not previous
+    assert sanitize_string("A brand new paraphrase?") in (
+        classifier.mentor.questions_by_text
+    )
+    # the mentor the previous classifier answers with is unchanged
+    assert previous.questions_by_text is previous_questions
+    assert sanitize_string("A brand new paraphrase?") not in previous_questions
+
+
+def test_fetches_mentor_data_and_graded_user_questions_concurrently():
+    with open(fixture_path("graphql/clint.json")) as f:
+        data = json.load(f)
+    m = _load_clint()
+    # each query waits for the other one to be in flight:
+    # run one after the other, the first would time out
+    both_in_flight = threading.Barrier(2, timeout=5)
+
+    def callback(request):
+        both_in_flight.wait()
+        return (200, {}, json.dumps(data))
+
+    with responses.RequestsMock() as rsps:
+        rsps.add_callback(responses.POST, re.compile(".*"), callback=callback)
+        stats = m.refresh()
+        assert len(rsps.calls) == 2
+    assert not both_in_flight.broken
+    assert stats["fetch_ms"] >= 0
@@ -0,0 +1,114 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import json
+import shutil
+
+import joblib
+import numpy
+import pytest
+import responses
+from sklearn.linear_model import RidgeClassifier
+
+from module.classifier import ARCH_LR_TRANSFORMER, mentor_model_path
+from module.classifier.arch.lr_transformer import TransformersQuestionClassifierTraining
+from module.classifier.model_artifact import (
+    load_scorer,
+    read_model_hash,
+    save_model,
+    save_scorer,
+)
+from module.classifier.predict import TransformersQuestionClassifierPrediction
+from module.classifier.scorer import LinearScorer
+from module.utils import file_hash
+from .helpers import fixture_path
+
+
+def _scores(scorer: LinearScorer, x: numpy.ndarray):
+    class_indices, confidences = scorer.score(x)
+    return list(scorer.classes[class_indices]), confidences
+
+
+@pytest.mark.parametrize("n_classes", [2, 5])
+def test_round_trips_model(tmp_path, n_classes: int):
+    rng = numpy.random.default_rng(0)
+    x = rng.normal(size=(n_classes * 4, 8))
+    y = [f"answer{i % n_classes}" for i in range(len(x))]
+    model = RidgeClassifier().fit(x, y)
+    artifact = str(tmp_path / "model.bin")
+    save_model(artifact, model)
+    assert read_model_hash(artifact) is None
+    scorer = load_scorer(artifact)
+    assert not scorer.coef.flags.writeable
+    classes, confidences = _scores(scorer, x)
+    expected_classes, expected_confidences = _scores(LinearScorer.from_model(model), x)
+    assert classes == expected_classes
+    numpy.testing.assert_allclose(confidences, expected_confidences, rtol=1e-6)
+
+
+@pytest.mark.parametrize("precision", ["float32", "float16", "int8"])
+def test_round_trips_reduced_precision_scorer(tmp_path, precision: str):
+    rng = numpy.random.default_rng(0)
+    x = rng.normal(size=(40, 8))
+    model = RidgeClassifier().fit(x, [f"answer{i % 10}" for i in range(len(x))])
+    scorer = LinearScorer.from_model(model).with_precision(precision)
+    artifact = str(tmp_path / "model.bin")
+    save_scorer(artifact, scorer, "ab" * 32)
+    assert read_model_hash(artifact) == "ab" * 32
+    loaded = load_scorer(artifact)
+    assert loaded.precision == precision
+    assert list(loaded.classes) == list(scorer.classes)
+    numpy.testing.assert_array_equal(loaded.coef, scorer.coef)
+    numpy.testing.assert_array_equal(
+        loaded.decision_function(x), scorer.decision_function(x)
+    )
+
+
+def test_training_keeps_full_precision_below_min_agreement():
+    rng = numpy.random.default_rng(0)
+    x = rng.normal(size=(40, 8))
+    model = RidgeClassifier().fit(x, [f"answer{i % 10}" for i in range(len(x))])
+    scorer = LinearScorer.from_model(model)
+    reduce_precision = TransformersQuestionClassifierTraining.reduce_precision
+    assert reduce_precision(scorer, x, "int8", 0.5).precision == "int8"
+    assert reduce_precision(scorer, x, "int8", 1.01).precision == "float32"
+
+
+def test_rejects_invalid_artifact(tmp_path):
+    artifact = tmp_path / "model.bin"
+    artifact.write_bytes(b"not a model" * 10)
+    with pytest.raises(ValueError):
+        load_scorer(str(artifact))
+
+
+@responses.activate
+def test_classifier_prefers_artifact_unless_trained_with_another_pickle(
+    tmp_path, shared_root: str
+):
+    shutil.copytree(fixture_path("data/clint"), tmp_path / "clint")
+    model_file = mentor_model_path(
+        str(tmp_path), "clint", ARCH_LR_TRANSFORMER, "model.pkl"
+    )
+    artifact = mentor_model_path(
+        str(tmp_path), "clint", ARCH_LR_TRANSFORMER, "model.bin"
+    )
+    model = joblib.load(model_file)
+    save_model(artifact, model, file_hash(model_file))
+    with open(fixture_path("graphql/clint.json")) as f:
+        data = json.load(f)
+    responses.add(responses.POST, "http://graphql/", json=data, status=200)
+    classifier = TransformersQuestionClassifierPrediction(
+        "clint", str(tmp_path), shared_root=shared_root
+    )
+    assert not classifier.scorer.coef.flags.writeable
+    x = numpy.random.default_rng(1).normal(size=(3, classifier.scorer.n_features))
+    assert _scores(classifier.scorer, x)[0] == list(model.predict(x))
+    # e.g. the pickle of a newer training was downloaded, but not the artifact
+    save_model(artifact, model, "0" * 64)
+    classifier = TransformersQuestionClassifierPrediction(
+        "clint", str(tmp_path), shared_root=shared_root
+    )
+    assert classifier.scorer.coef.flags.writeable
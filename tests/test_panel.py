@@ -0,0 +1,111 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import numpy
+import pytest
+import responses
+
+from module.classifier.panel import evaluate_panel
+from module.classifier.predict import TransformersQuestionClassifierPrediction
+from module.mentor import Mentor
+from module.utils import sanitize_string
+from .fixtures import sbert_encodings
+from .helpers import fixture_path
+
+NAME_ANSWER_ID = "62709347a2fa682085cdbd1c"
+
+
+class CountingEncoder:
+    def __init__(self):
+        self.questions: List[str] = []
+
+    def encode(self, question: str) -> numpy.ndarray:
+        self.questions.append(question)
+        return numpy.asarray(sbert_encodings[question])
+
+
+@pytest.fixture(autouse=True)
+def env(monkeypatch):
+    monkeypatch.setenv("GRAPHQL_ENDPOINT", "http://graphql")
+    monkeypatch.setenv("SBERT_ENDPOINT", "http://sbert")
+
+
+def _add_graphql_responses(mutations: list):
+    with open(fixture_path("graphql/clint.json")) as f:
+        data = json.load(f)
+
+    def graphql_callback(request):
+        body = json.loads(request.body)
+        if not body["query"].startswith("mutation UserQuestionCreateBatch"):
+            return (200, {}, json.dumps(data))
+        mutations.append(body)
+        ids = {k: {"_id": f"feedback-{k}"} for k in body["variables"]}
+        return (200, {}, json.dumps({"data": ids}))
+
+    responses.add_callback(responses.POST, "http://graphql", callback=graphql_callback)
+
+
+def _panel(data_root: str, encoder: CountingEncoder, n: int, not_canned: str = ""):
+    """
+    n classifiers of the clint fixture, the last one
+    without not_canned among its canned questions.
+    """
+    classifiers = []
+    for i in range(n):
+        mentor = Mentor("clint")
+        if i == n - 1 and not_canned:
+            del mentor.questions_by_text[sanitize_string(not_canned)]
+        classifier = TransformersQuestionClassifierPrediction(mentor, data_root)
+        classifier.encoder = encoder
+        classifiers.append(classifier)
+    return classifiers
+
+
+@responses.activate
+def test_encodes_once_and_records_feedback_with_one_mutation(data_root: str):
+    mutations: list = []
+    _add_graphql_responses(mutations)
+    encoder = CountingEncoder()
+    classifiers = _panel(data_root, encoder, 4)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = evaluate_panel(classifiers, "What's your name?", "123", executor)
+    assert encoder.questions == ["What's your name?"]
+    assert [r.answer_id for r in results] == [NAME_ANSWER_ID] * 4
+    assert [r.feedback_id for r in results] == [
+        "feedback-q0",
+        "feedback-q1",
+        "feedback-q2",
+        "feedback-q3",
+    ]
+    assert len(mutations) == 1
+    assert [v["classifierAnswerType"] for v in mutations[0]["variables"].values()] == [
+        "CLASSIFIER"
+    ] * 4
+
+
+@responses.activate
+def test_encodes_only_if_not_canned_for_every_mentor(data_root: str):
+    mutations: list = []
+    _add_graphql_responses(mutations)
+    encoder = CountingEncoder()
+    question = "What is your name?"
+    results = evaluate_panel(_panel(data_root, encoder, 2), question, "123")
+    assert encoder.questions == []
+    assert [r.highest_confidence for r in results] == [1.0, 1.0]
+    results = evaluate_panel(
+        _panel(data_root, encoder, 3, not_canned=question), question, "123"
+    )
+    assert encoder.questions == [question]
+    assert [r.answer_id for r in results] == [NAME_ANSWER_ID] * 3
+    assert [v["classifierAnswerType"] for v in mutations[-1]["variables"].values()] == [
+        "EXACT",
+        "EXACT",
+        "CLASSIFIER",
+    ]
@@ -13,11 +13,11 @@ import json
 import pytest
 import responses
 
-from module.mentor import Media
+from module.mentor import Media, Mentor
 from module.api import OFF_TOPIC_THRESHOLD_DEFAULT
 from module.classifier.arch.lr_transformer import TransformersQuestionClassifierTraining
 from module.classifier.predict import TransformersQuestionClassifierPrediction
-from .helpers import fixture_path
+from .helpers import add_graphql_responses, fixture_path
 from .fixtures import sbert_encodings
 
 
@@ -271,10 +271,7 @@ def _test_gets_off_topic(
         data = json.load(f)
     with open(fixture_path("graphql/clint_graded_user_questions.json")) as g:
         graded_user_question_data = json.load(g)
-    responses.add(responses.POST, "http://graphql/", json=data, status=200)
-    responses.add(
-        responses.POST, "http://graphql/", json=graded_user_question_data, status=200
-    )
+    add_graphql_responses("http://graphql/", data, graded_user_question_data)
     responses.add(
         responses.GET,
         "http://sbert/encode",
@@ -351,3 +348,134 @@ def test_gets_off_topic_for_user_with_no_offtopic_response(
         expected_answer_id,
         expected_answer,
     )
+
+
+@responses.activate
+@pytest.mark.parametrize(
+    "mentor_id,questions,expected_answer_ids",
+    [
+        (
+            "clint",
+            ["What is your name?", "What's your name?", "Tell me your name"],
+            [
+                "62709347a2fa682085cdbd1c",
+                "62709347a2fa682085cdbd1c",
+                "62709347a2fa682085cdbd1c",
+            ],
+        ),
+    ],
+)
+def test_evaluates_batch_with_one_feedback_mutation(
+    data_root: str,
+    shared_root: str,
+    mentor_id: str,
+    questions: List[str],
+    expected_answer_ids: List[str],
+):
+    with open(fixture_path("graphql/{}.json".format(mentor_id))) as f:
+        data = json.load(f)
+    mutations = []
+
+    def graphql_callback(request):
+        body = json.loads(request.body)
+        if not body["query"].startswith("mutation UserQuestionCreateBatch"):
+            return (200, {}, json.dumps(data))
+        mutations.append(body)
+        ids = {k: {"_id": f"feedback-{k}"} for k in body["variables"]}
+        return (200, {}, json.dumps({"data": ids}))
+
+    responses.add_callback(responses.POST, "http://graphql", callback=graphql_callback)
+    for question in questions:
+        responses.add(
+            responses.GET,
+            "http://sbert/encode",
+            json={"query": question, "encoding": sbert_encodings[question]},
+            status=200,
+            match=[responses.matchers.query_param_matcher({"query": question})],
+        )
+    _ensure_trained(mentor_id, shared_root, data_root)
+    classifier = TransformersQuestionClassifierPrediction(mentor_id, data_root)
+    results = classifier.evaluate_batch(questions, "123")
+    assert [r.answer_id for r in results] == expected_answer_ids
+    assert results[0].highest_confidence == 1.0
+    assert all(r.highest_confidence != 1 for r in results[1:])
+    assert [r.feedback_id for r in results] == [
+        "feedback-q0",
+        "feedback-q1",
+        "feedback-q2",
+    ]
+    assert len(mutations) == 1
+    assert [v["classifierAnswerType"] for v in mutations[0]["variables"].values()] == [
+        "EXACT",
+        "CLASSIFIER",
+        "CLASSIFIER",
+    ]
+
+
+@responses.activate
+@pytest.mark.parametrize(
+    "mentor_id,question,missing_answer_id",
+    [("clint", "What's your name?", "62709347a2fa682085cdbd1c")],
+)
+def test_reverts_to_off_topic_if_predicted_answer_is_missing(
+    data_root: str,
+    shared_root: str,
+    mentor_id: str,
+    question: str,
+    missing_answer_id: str,
+):
+    with open(fixture_path("graphql/{}.json".format(mentor_id))) as f:
+        data = json.load(f)
+    responses.add(responses.POST, "http://graphql/", json=data, status=200)
+    responses.add(
+        responses.GET,
+        "http://sbert/encode",
+        json={"query": question, "encoding": sbert_encodings[question]},
+        status=200,
+    )
+    mentor = Mentor(mentor_id)
+    del mentor.answer_id_by_answer[missing_answer_id]
+    classifier = TransformersQuestionClassifierPrediction(mentor, data_root)
+    result = classifier.evaluate(question, "123")
+    assert result.answer_missing
+    assert result.highest_confidence == -1
+    assert result.answer_id != missing_answer_id
+
+
+@responses.activate
+@pytest.mark.parametrize(
+    "mentor_id,question,expected_answer_id",
+    [
+        ("clint", "Waht is your name?", "62709347a2fa682085cdbd1c"),
+        ("clint", "your name is what", "62709347a2fa682085cdbd1c"),
+    ],
+)
+def test_answers_near_match_of_canned_question_without_encoding(
+    monkeypatch,
+    data_root: str,
+    mentor_id: str,
+    question: str,
+    expected_answer_id: str,
+):
+    monkeypatch.setenv("FUZZY_MATCH_THRESHOLD", "0.75")
+    with open(fixture_path("graphql/{}.json".format(mentor_id))) as f:
+        data = json.load(f)
+    mutations = []
+
+    def graphql_callback(request):
+        body = json.loads(request.body)
+        if not body["query"].lstrip().startswith("mutation UserQuestionCreate"):
+            return (200, {}, json.dumps(data))
+        mutations.append(body)
+        return (200, {}, json.dumps({"data": {"userQuestionCreate": {"_id": "f1"}}}))
+
+    responses.add_callback(responses.POST, "http://graphql", callback=graphql_callback)
+    # no sbert response registered: encoding the question would fail
+    classifier = TransformersQuestionClassifierPrediction(mentor_id, data_root)
+    result = classifier.evaluate(question, "123")
+    assert result.answer_id == expected_answer_id
+    assert 0.75 <= result.highest_confidence < 1.0
+    assert result.feedback_id == "f1"
+    user_question = mutations[0]["variables"]["userQuestion"]
+    assert user_question["classifierAnswerType"] == "PARAPHRASE"
+    assert user_question["confidence"] == result.highest_confidence
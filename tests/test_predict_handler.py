@@ -0,0 +1,264 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import base64
+import importlib
+import json
+
+import pytest
+import responses
+
+from module.classifier import ARCH_LR_TRANSFORMER
+from module.classifier.dao import Dao
+from module.classifier import freshness
+from module.classifier.freshness import ModelFreshnessChecker
+from .fixtures import sbert_encodings
+from .helpers import fixture_path
+from .test_freshness import FakeS3
+
+NAME_ANSWER_ID = "62709347a2fa682085cdbd1c"
+
+
+@pytest.fixture
+def predict_module(monkeypatch, shared_root: str):
+    monkeypatch.setenv("GRAPHQL_ENDPOINT", "http://graphql")
+    monkeypatch.setenv("SBERT_ENDPOINT", "http://sbert")
+    monkeypatch.setenv("MODELS_BUCKET", "models")
+    monkeypatch.setenv("SHARED_ROOT", shared_root)
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    return importlib.import_module("predict")
+
+
+@pytest.fixture
+def predict(monkeypatch, predict_module, shared_root: str, data_root: str):
+    monkeypatch.setattr(
+        predict_module,
+        "classifier_dao",
+        Dao(shared_root, data_root, arch=ARCH_LR_TRANSFORMER),
+    )
+    # the fixture models are already in data_root
+    monkeypatch.setattr(predict_module, "fetch_model", lambda mentor: mentor == "clint")
+    return predict_module
+
+
+@pytest.fixture
+def mutations():
+    with open(fixture_path("graphql/clint.json")) as f:
+        data = json.load(f)
+    mutations = []
+
+    def graphql_callback(request):
+        body = json.loads(request.body)
+        if not body["query"].startswith("mutation UserQuestionCreateBatch"):
+            return (200, {}, json.dumps(data))
+        mutations.append(body)
+        ids = {k: {"_id": f"feedback-{k}"} for k in body["variables"]}
+        return (200, {}, json.dumps({"data": ids}))
+
+    with responses.RequestsMock(assert_all_requests_are_fired=False) as rsps:
+        rsps.add_callback(responses.POST, "http://graphql", callback=graphql_callback)
+        for question, encoding in sbert_encodings.items():
+            rsps.add(
+                responses.GET,
+                "http://sbert/encode",
+                json={"query": question, "encoding": encoding},
+                match=[responses.matchers.query_param_matcher({"query": question})],
+            )
+        yield mutations
+
+
+def _post(request, base64_encoded: bool = False) -> dict:
+    body = json.dumps(request)
+    return {
+        "headers": {},
+        "body": base64.b64encode(body.encode()).decode() if base64_encoded else body,
+        "isBase64Encoded": base64_encoded,
+    }
+
+
+@pytest.mark.parametrize("base64_encoded", [False, True])
+def test_batch_handler_answers_questions(predict, mutations, base64_encoded: bool):
+    response = predict.batch_handler(
+        _post(
+            {
+                "mentor": "clint",
+                "chatsessionid": "123",
+                "questions": ["What is your name?", "What's your name?"],
+            },
+            base64_encoded,
+        ),
+        {},
+    )
+    assert response["statusCode"] == 200
+    results = json.loads(response["body"])["results"]
+    assert [r["answer_id"] for r in results] == [NAME_ANSWER_ID, NAME_ANSWER_ID]
+    assert [r["feedback_id"] for r in results] == ["feedback-q0", "feedback-q1"]
+    assert len(mutations) == 1
+
+
+@pytest.mark.parametrize(
+    "event",
+    [
+        {"headers": {}},
+        {"headers": {}, "body": "not json"},
+        {"headers": {}, "body": "not base64", "isBase64Encoded": True},
+        _post({"mentor": "clint", "chatsessionid": "123"}),
+        _post({"mentor": "clint", "chatsessionid": "123", "questions": "What?"}),
+        _post({"mentor": "clint", "chatsessionid": "123", "questions": ["What?", 1]}),
+        _post({"mentor": "clint", "chatsessionid": "123", "questions": [["What?"]]}),
+        _post(["clint"]),
+    ],
+)
+def test_batch_handler_rejects_bad_requests(predict, event: dict):
+    assert predict.batch_handler(event, {})["statusCode"] == 400
+
+
+def test_batch_handler_returns_404_for_mentor_without_model(predict):
+    response = predict.batch_handler(
+        _post({"mentor": "nobody", "chatsessionid": "123", "questions": ["Hi?"]}), {}
+    )
+    assert response["statusCode"] == 404
+
+
+@pytest.mark.parametrize("base64_encoded", [False, True])
+def test_panel_handler_answers_for_each_mentor(
+    predict, mutations, base64_encoded: bool
+):
+    response = predict.panel_handler(
+        _post(
+            {
+                "mentors": ["clint", "clint"],
+                "chatsessionid": "123",
+                "question": "What is your name?",
+            },
+            base64_encoded,
+        ),
+        {},
+    )
+    assert response["statusCode"] == 200
+    results = json.loads(response["body"])["results"]
+    assert [(r["mentor"], r["answer_id"]) for r in results] == [
+        ("clint", NAME_ANSWER_ID)
+    ]
+    assert len(mutations) == 1
+
+
+@pytest.mark.parametrize(
+    "event",
+    [
+        {"headers": {}},
+        {"headers": {}, "body": "not json"},
+        _post({"mentors": ["clint"], "chatsessionid": "123"}),
+        _post({"mentors": "clint", "chatsessionid": "123", "question": "What?"}),
+        _post({"mentors": [["clint"]], "chatsessionid": "123", "question": "What?"}),
+        _post({"mentors": [1], "chatsessionid": "123", "question": "What?"}),
+    ],
+)
+def test_panel_handler_rejects_bad_requests(predict, event: dict):
+    assert predict.panel_handler(event, {})["statusCode"] == 400
+
+
+def test_panel_handler_returns_404_for_mentors_without_model(predict):
+    response = predict.panel_handler(
+        _post(
+            {"mentors": ["clint", "nobody"], "chatsessionid": "123", "question": "Hi?"}
+        ),
+        {},
+    )
+    assert response["statusCode"] == 404
+    assert "nobody" in json.loads(response["body"])["message"]
+
+
+@pytest.mark.parametrize("handler", ["handler", "batch_handler", "panel_handler"])
+def test_handlers_dispatch_warmup_invocations(predict, mutations, handler: str):
+    result = getattr(predict, handler)(
+        {"warmup": {"mentors": ["clint", "nobody"]}}, None
+    )
+    assert [(m["mentor"], m["status"]) for m in result["mentors"]] == [
+        ("clint", "loaded"),
+        ("nobody", "not_found"),
+    ]
+
+
+def test_find_classifier_refetches_the_model_if_its_files_dont_load_together(
+    monkeypatch, predict_module
+):
+    fetches = []
+    monkeypatch.setattr(
+        predict_module,
+        "fetch_model",
+        lambda mentor, force=False: fetches.append((mentor, force)) or True,
+    )
+
+    class Dao:
+        loads = 0
+
+        def find_classifier(self, mentor, auth_headers):
+            Dao.loads += 1
+            if not fetches:
+                raise ValueError("knn.f32 was not written along with its index")
+            return "classifier"
+
+    monkeypatch.setattr(predict_module, "classifier_dao", Dao())
+    assert predict_module.find_classifier("m", {}) == "classifier"
+    assert fetches == [("m", True)]
+    assert Dao.loads == 2
+
+
+def test_fetch_model_fetches_model_files_and_versions_them_by_etags(
+    monkeypatch, predict_module, tmp_path
+):
+    s3 = FakeS3()
+    s3.put(f"m/{ARCH_LR_TRANSFORMER}/model.pkl", b"pkl", '"1"')
+    s3.put(f"m/{ARCH_LR_TRANSFORMER}/model.bin", b"bin", '"2"')
+    monkeypatch.setattr(
+        predict_module,
+        "model_freshness",
+        ModelFreshnessChecker(s3, "models", str(tmp_path), interval=10),
+    )
+    dao = Dao("shared", str(tmp_path), arch=ARCH_LR_TRANSFORMER)
+    monkeypatch.setattr(predict_module, "classifier_dao", dao)
+    assert predict_module.fetch_model("m")
+    # the model file first, then the optional files (the bundle is missing)
+    assert s3.requests[0][0] == f"m/{ARCH_LR_TRANSFORMER}/model.pkl"
+    assert {key for key, _ in s3.requests[1:]} == {
+        f"m/{ARCH_LR_TRANSFORMER}/model.bin",
+        f"m/{ARCH_LR_TRANSFORMER}/mentor.json.gz",
+    }
+    assert (tmp_path / "m" / ARCH_LR_TRANSFORMER / "model.bin").read_bytes() == b"bin"
+    assert dao.versions["m"] == '"1"/"2"/None'
+    requests = len(s3.requests)
+    assert predict_module.fetch_model("m")
+    assert len(s3.requests) == requests
+    # checks every file again, though none is due
+    assert predict_module.fetch_model("m", force=True)
+    assert len(s3.requests) == requests + 3
+    assert not predict_module.fetch_model("nobody")
+    assert "nobody" not in dao.versions
+
+
+def test_fetch_model_fetches_the_other_files_when_the_model_file_changed(
+    monkeypatch, predict_module, tmp_path
+):
+    now = [1000.0]
+    monkeypatch.setattr(freshness.time, "monotonic", lambda: now[0])
+    s3 = FakeS3()
+    s3.put(f"m/{ARCH_LR_TRANSFORMER}/model.pkl", b"pkl", '"1"')
+    s3.put(f"m/{ARCH_LR_TRANSFORMER}/model.bin", b"bin", '"2"')
+    checker = ModelFreshnessChecker(s3, "models", str(tmp_path), interval=10)
+    monkeypatch.setattr(predict_module, "model_freshness", checker)
+    dao = Dao("shared", str(tmp_path), arch=ARCH_LR_TRANSFORMER)
+    monkeypatch.setattr(predict_module, "classifier_dao", dao)
+    assert predict_module.fetch_model("m")
+    now[0] += 5
+    # the files are no longer checked at the same time
+    checker.fetch(f"m/{ARCH_LR_TRANSFORMER}/model.bin", force=True)
+    s3.put(f"m/{ARCH_LR_TRANSFORMER}/model.pkl", b"pkl2", '"3"')
+    s3.put(f"m/{ARCH_LR_TRANSFORMER}/model.bin", b"bin2", '"4"')
+    now[0] += 5
+    assert predict_module.fetch_model("m")
+    assert (tmp_path / "m" / ARCH_LR_TRANSFORMER / "model.bin").read_bytes() == b"bin2"
+    assert dao.versions["m"] == '"3"/"4"/None'
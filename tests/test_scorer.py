@@ -0,0 +1,61 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import joblib
+import numpy
+import pytest
+from sklearn.linear_model import RidgeClassifier
+
+from module.classifier import ARCH_LR_TRANSFORMER, mentor_model_path
+from module.classifier.scorer import LinearScorer
+
+
+def _train(n_classes: int, n_features: int = 16) -> RidgeClassifier:
+    rng = numpy.random.default_rng(0)
+    x = rng.normal(size=(n_classes * 5, n_features))
+    y = numpy.array([f"answer{i % n_classes}" for i in range(len(x))])
+    return RidgeClassifier().fit(x, y)
+
+
+@pytest.mark.parametrize("n_classes", [2, 3, 12])
+def test_scores_like_sklearn(n_classes: int):
+    model = _train(n_classes)
+    scorer = LinearScorer.from_model(model)
+    x = numpy.random.default_rng(1).normal(size=(20, 16))
+    class_indices, confidences = scorer.score(x)
+    assert list(scorer.classes[class_indices]) == list(model.predict(x))
+    decisions = model.decision_function(x)
+    expected = decisions if decisions.ndim == 1 else decisions.max(axis=1)
+    numpy.testing.assert_allclose(confidences, expected, rtol=1e-4, atol=1e-5)
+
+
+def test_scores_fixture_model_like_sklearn(data_root: str):
+    model = joblib.load(
+        mentor_model_path(data_root, "clint", ARCH_LR_TRANSFORMER, "model.pkl")
+    )
+    scorer = LinearScorer.from_model(model)
+    x = numpy.random.default_rng(2).normal(size=(5, scorer.n_features))
+    class_indices, confidences = scorer.score(x)
+    assert list(scorer.classes[class_indices]) == list(model.predict(x))
+    numpy.testing.assert_allclose(
+        confidences, model.decision_function(x).max(axis=1), rtol=1e-4, atol=1e-5
+    )
+
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+def test_reduced_precision_agrees_with_full_precision(data_root: str, precision: str):
+    model = joblib.load(
+        mentor_model_path(data_root, "clint", ARCH_LR_TRANSFORMER, "model.pkl")
+    )
+    scorer = LinearScorer.from_model(model)
+    reduced = scorer.with_precision(precision)
+    assert reduced.precision == precision
+    assert reduced.coef.nbytes < scorer.coef.nbytes
+    x = numpy.random.default_rng(3).normal(size=(50, scorer.n_features))
+    assert scorer.agreement(reduced, x) >= 0.95
+    numpy.testing.assert_allclose(
+        reduced.score(x)[1], scorer.score(x)[1], rtol=0.05, atol=0.05
+    )
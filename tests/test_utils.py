@@ -0,0 +1,79 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import csv
+import glob
+import json
+import os
+from string import ascii_letters, digits, whitespace
+from typing import Iterator, List
+
+import pytest
+
+from module.utils import normalize_strings, sanitize_string
+from .helpers import fixture_path
+
+EDGE_CASES = [
+    "",
+    "   ",
+    " What's up? ",
+    "Straße İstanbul ǅemal ﬁne",
+    "é leading accent",
+    "tabs\tand\nnewlines\r\x0b\x0c",
+    "emoji 🙂 and 中文 text",
+    "nul \x00 inside",
+    "\u00a0non\u00a0breaking\u00a0 ",
+]
+
+
+def _sanitize_string_before(input_string: str) -> str:
+    # the implementation sanitize_string must keep matching
+    input_string = input_string.strip().casefold().replace("\u00a0", " ")
+    return "".join(
+        [ch for ch in input_string if ch in (ascii_letters + digits + whitespace)]
+    )
+
+
+def _strings(value) -> Iterator[str]:
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _strings(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from _strings(v)
+
+
+def _fixture_text() -> List[str]:
+    texts = list(EDGE_CASES)
+    for path in glob.glob(fixture_path(os.path.join("graphql", "*.json"))):
+        with open(path) as f:
+            texts.extend(_strings(json.load(f)))
+    for path in glob.glob(fixture_path(os.path.join("data", "**", "*.csv"))):
+        with open(path, newline="") as f:
+            texts.extend(cell for row in csv.reader(f) for cell in row)
+    return texts
+
+
+def test_sanitize_string_matches_previous_implementation_on_fixture_text():
+    texts = _fixture_text()
+    assert len(texts) > 1000
+    for text in texts:
+        assert sanitize_string(text) == _sanitize_string_before(text), text
+
+
+def test_normalize_strings_matches_sanitize_string_on_fixture_text():
+    texts = _fixture_text()
+    assert normalize_strings(texts) == [_sanitize_string_before(t) for t in texts]
+
+
+@pytest.mark.parametrize(
+    "strings",
+    [[], ["  One  "], ["a\x00b", "C d"], EDGE_CASES],
+)
+def test_normalize_strings_edge_cases(strings):
+    assert normalize_strings(strings) == [_sanitize_string_before(s) for s in strings]
@@ -0,0 +1,99 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import threading
+import time
+from datetime import datetime
+
+from module.classifier.warmup import recent_mentors, warm_up
+
+
+class FakeDao:
+    def __init__(self, nbytes: int = 1, delay: float = 0.05):
+        self.nbytes = nbytes
+        self.delay = delay
+        self.loaded = []
+        self.lock = threading.Lock()
+
+    def find_classifier(self, mentor: str):
+        time.sleep(self.delay)
+        if mentor == "broken":
+            raise ValueError("broken")
+        with self.lock:
+            self.loaded.append(mentor)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"bytes": len(self.loaded) * self.nbytes}
+
+
+def _statuses(report: list) -> dict:
+    return {r["mentor"]: r["status"] for r in report}
+
+
+def test_warms_up_mentors_concurrently():
+    dao = FakeDao(delay=0.2)
+    started = time.monotonic()
+    report = warm_up(
+        dao,
+        ["a", "b", "missing", "broken"],
+        lambda mentor: mentor != "missing",
+        max_bytes=100,
+        deadline=time.monotonic() + 10,
+        workers=4,
+    )
+    assert time.monotonic() - started < 0.6
+    assert _statuses(report) == {
+        "a": "loaded",
+        "b": "loaded",
+        "missing": "not_found",
+        "broken": "error",
+    }
+    assert all(r["load_ms"] >= 0 for r in report)
+
+
+def test_stops_warming_up_over_memory_budget():
+    dao = FakeDao(nbytes=10)
+    report = warm_up(
+        dao, ["a", "b", "c"], lambda m: True, 20, time.monotonic() + 10, workers=1
+    )
+    assert _statuses(report) == {"a": "loaded", "b": "loaded", "c": "over_budget"}
+
+
+def test_stops_warming_up_at_deadline():
+    dao = FakeDao(delay=0.3)
+    report = warm_up(
+        dao, ["a", "b"], lambda m: True, 100, time.monotonic() + 0.1, workers=1
+    )
+    assert _statuses(report) == {"a": "loading", "b": "past_deadline"}
+    # the load still running doesn't change the report returned at the deadline
+    time.sleep(0.4)
+    assert report[0] == {"mentor": "a", "status": "loading"}
+
+
+class FakeS3:
+    def get_paginator(self, name: str):
+        assert name == "list_objects_v2"
+        return self
+
+    def paginate(self, Bucket: str):
+        arch = "module.classifier.arch.lr_transformer"
+        yield {
+            "Contents": [
+                {"Key": f"old/{arch}/model.pkl", "LastModified": datetime(2022, 1, 1)},
+                {"Key": f"new/{arch}/model.pkl", "LastModified": datetime(2022, 3, 1)},
+                {"Key": f"new/{arch}/model.bin", "LastModified": datetime(2022, 3, 1)},
+            ]
+        }
+        yield {
+            "Contents": [
+                {"Key": f"mid/{arch}/model.pkl", "LastModified": datetime(2022, 2, 1)}
+            ]
+        }
+
+
+def test_lists_most_recently_trained_mentors():
+    assert recent_mentors(FakeS3(), "bucket", 2) == ["new", "mid"]
@@ -6,6 +6,7 @@
 #
 import json
 import uuid
+from functools import lru_cache
 import boto3
 import os
 from module.utils import (
@@ -28,13 +29,19 @@ log.info(f"using table {JOBS_TABLE_NAME}")
 JOBS_SQS_NAME = require_env("JOBS_SQS_NAME")
 aws_region = os.environ.get("REGION", "us-east-1")
 sqs = boto3.client("sqs", region_name=aws_region)
-queue_url = sqs.get_queue_url(QueueName=JOBS_SQS_NAME)["QueueUrl"]
-log.info(f"using queue {queue_url}")
 # todo endpoint_url="http://localhost:8000") for localstack
 dynamodb = boto3.resource("dynamodb", region_name=aws_region)
 job_table = dynamodb.Table(JOBS_TABLE_NAME)
 
 
+@lru_cache(maxsize=1)
+def get_queue_url() -> str:
+    # resolved on first use (not at import), requests rejected earlier don't need it
+    queue_url = sqs.get_queue_url(QueueName=JOBS_SQS_NAME)["QueueUrl"]
+    log.info(f"using queue {queue_url}")
+    return queue_url
+
+
 def handler(event, context):
     log.debug(json.dumps(event))
     if "body" not in event:
@@ -76,7 +83,9 @@ def handler(event, context):
         "ttl": int(datetime.datetime.now().timestamp()) + ttl_sec,
     }
     log.debug(train_job)
-    sqs_msg = sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps(train_job))
+    sqs_msg = sqs.send_message(
+        QueueUrl=get_queue_url(), MessageBody=json.dumps(train_job)
+    )
     log.info(sqs_msg)
 
     if ping is False:
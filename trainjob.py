@@ -8,12 +8,18 @@ import json
 import os
 import boto3
 import datetime
+from botocore.exceptions import ClientError
 from module.api import add_or_update_train_task
+from module.classifier import (
+    ARCH_KNN_TRANSFORMER,
+    ARCH_LR_TRANSFORMER,
+    get_classifier_arch,
+)
+from module.classifier.arch.knn_transformer import KnnQuestionClassifierTraining
 from module.classifier.arch.lr_transformer import TransformersQuestionClassifierTraining
 from module.utils import require_env, load_sentry
 from module.logger import get_logger
 
-
 load_sentry()
 log = get_logger("train-job")
 shared = os.environ.get("SHARED_ROOT")
@@ -27,6 +33,12 @@ aws_region = os.environ.get("REGION", "us-east-1")
 dynamodb = boto3.resource("dynamodb", region_name=aws_region)
 job_table = dynamodb.Table(JOBS_TABLE_NAME)
 MODELS_DIR = "/tmp/models"
+# the architecture to train (CLASSIFIER_ARCH), must match predict's
+ARCH = get_classifier_arch()
+training_class = {
+    ARCH_LR_TRANSFORMER: TransformersQuestionClassifierTraining,
+    ARCH_KNN_TRANSFORMER: KnnQuestionClassifierTraining,
+}[ARCH]
 
 
 def handler(event, context):
@@ -40,7 +52,7 @@ def handler(event, context):
 
         if ping:
             try:
-                classifier = TransformersQuestionClassifierTraining(
+                classifier = training_class(
                     mentor=mentor,
                     shared_root=shared,
                     output_dir=MODELS_DIR,
@@ -53,25 +65,28 @@ def handler(event, context):
                 request["id"], "IN_PROGRESS", mentor, auth_headers=auth_headers
             )
             try:
-                classifier = TransformersQuestionClassifierTraining(
+                classifier = training_class(
                     mentor=mentor,
                     shared_root=shared,
                     output_dir=MODELS_DIR,
                     auth_headers=auth_headers,
                 )
+                download_previous_model(mentor)
                 classifier.train()
-                s3.upload_file(
-                    os.path.join(
-                        MODELS_DIR,
-                        mentor,
-                        "module.classifier.arch.lr_transformer",
-                        "model.pkl",
-                    ),
-                    MODELS_BUCKET,
-                    os.path.join(
-                        mentor, "module.classifier.arch.lr_transformer", "model.pkl"
-                    ),
-                )
+                # in order, the model file predict checks to detect a new model goes last
+                missing = []
+                for model_file in training_class.MODEL_FILES:
+                    model_file_path = os.path.join(MODELS_DIR, mentor, ARCH, model_file)
+                    if not os.path.exists(model_file_path):
+                        # optional (e.g. the ivf index of small knn mentors)
+                        missing.append(model_file)
+                        continue
+                    s3.upload_file(
+                        model_file_path,
+                        MODELS_BUCKET,
+                        os.path.join(mentor, ARCH, model_file),
+                    )
+                delete_model_files(mentor, missing)
                 update_status(
                     request["id"],
                     "SUCCESS",
@@ -88,6 +103,43 @@ def handler(event, context):
                 )
 
 
+def download_previous_model(mentor):
+    """
+    Replaces the local files of the previous model of the mentor
+    (training_class.PREVIOUS_MODEL_FILES, e.g. the knn index to append to)
+    with the ones in the bucket, if any.
+    """
+    model_dir = os.path.join(MODELS_DIR, mentor, ARCH)
+    os.makedirs(model_dir, exist_ok=True)
+    for model_file in training_class.PREVIOUS_MODEL_FILES:
+        model_file_path = os.path.join(model_dir, model_file)
+        if os.path.exists(model_file_path):
+            os.remove(model_file_path)
+        try:
+            s3.download_file(
+                MODELS_BUCKET, os.path.join(mentor, ARCH, model_file), model_file_path
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("404", "NoSuchKey"):
+                raise
+            log.info(f"no previous {model_file} for {mentor}")
+
+
+def delete_model_files(mentor, model_files):
+    """
+    Deletes optional files of a previous training the new model doesn't have.
+    Only cleanup once the new model is uploaded (it doesn't refer to them),
+    so a failure is logged rather than failing the training.
+    """
+    for model_file in model_files:
+        try:
+            s3.delete_object(
+                Bucket=MODELS_BUCKET, Key=os.path.join(mentor, ARCH, model_file)
+            )
+        except ClientError as e:
+            log.warning(f"failed to delete {model_file} of {mentor}: {e}")
+
+
 def update_status(id, status, mentor, auth_headers):
     add_or_update_train_task(id, mentor, status, headers=auth_headers)
     # TODO: eventually migrate away from using dynamodb and only use mongo